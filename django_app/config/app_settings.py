@@ -0,0 +1,10 @@
+from django.conf import settings
+
+
+def get_app_settings(name, defaults):
+    """
+    Настройки приложения: значения по умолчанию defaults, переопределенные
+    словарем name из settings (например, RECIPES_PANTRY). Читаются при
+    каждом вызове, поэтому действуют override_settings в тестах.
+    """
+    return {**defaults, **getattr(settings, name, {})}
@@ -44,9 +44,11 @@ INSTALLED_APPS = [
 
     'users',
     'recipes',
+    'metrics',
 ]
 
 MIDDLEWARE = [
+    'metrics.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,6 +90,23 @@ DATABASES = {
         'PASSWORD': os.environ.get('SQL_PASSWORD', 'password'),
         'HOST': os.environ.get('SQL_HOST', 'localhost'),
         'PORT': os.environ.get('SQL_PORT', '5432'),
+        'TEST': {
+            'NAME': os.environ.get('SQL_TEST_DATABASE'),
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Для нескольких процессов используйте общий кеш, например
+# 'django.core.cache.backends.filebased.FileBasedCache' или Redis (django-redis)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -150,3 +169,67 @@ SPECTACULAR_SETTINGS = {
     'SCHEMA_PATH_PREFIX': '/api/v[0-9]',
     'TITLE': 'API для работы с базой рецептов',
 }
+
+# Отложенная запись голосов (см. recipes.votes)
+RECIPES_VOTE_BUFFER = {
+    'ENABLED': os.environ.get('RECIPES_VOTE_BUFFER_ENABLED') == '1',
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_LAG': 5.0,
+}
+
+# Кеш ответов справочников (см. recipes.cache)
+RECIPES_RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 300,
+}
+
+# Инвертированный индекс ингредиентов (см. recipes.indexes)
+RECIPES_INGREDIENT_INDEX = {
+    'TTL': int(os.environ.get('RECIPES_INGREDIENT_INDEX_TTL', 60)),
+}
+
+# Набор ингредиентов в запросах и кеш поиска по нему (см. recipes.pantry)
+RECIPES_PANTRY = {
+    'MAX_SIZE': 1000,
+    'CACHE_SIZE': 1024,
+}
+
+# Асинхронные представления (см. recipes.async_views)
+RECIPES_ASYNC = {
+    'DB_THREADS': int(os.environ.get('RECIPES_ASYNC_DB_THREADS', 16)),
+}
+
+# Поиск по названиям (см. recipes.search)
+RECIPES_SEARCH = {
+    'BACKEND': os.environ.get('RECIPES_SEARCH_BACKEND', 'auto'),
+    'SIMILARITY_THRESHOLD': 0.5,
+    'TTL': int(os.environ.get('RECIPES_SEARCH_TTL', 60)),
+}
+
+# Рейтинги рецептов по категориям (см. recipes.leaderboards)
+RECIPES_LEADERBOARD = {
+    'SIZE': 100,
+    'PRIOR_VOTES': 10,
+    'TTL': int(os.environ.get('RECIPES_LEADERBOARD_TTL', 60)),
+}
+
+# Похожие рецепты по оценкам пользователей (см. recipes.recommendations)
+RECIPES_RECOMMENDATIONS = {
+    'NEIGHBORS': 20,
+    'MIN_SCORE': 6,
+    'SHRINKAGE': 10,
+}
+
+# Похожие рецепты по составу (см. recipes.similarity)
+RECIPES_INGREDIENT_SIMILARITY = {
+    'MIN_SIMILARITY': 0.2,
+    'MAX_CHANGES': 1000,
+    'TTL': int(os.environ.get('RECIPES_INGREDIENT_SIMILARITY_TTL', 300)),
+}
+
+# Метрики запросов (см. metrics.middleware)
+METRICS = {
+    'SLOW_QUERY_THRESHOLD': float(os.environ['METRICS_SLOW_QUERY_THRESHOLD'])
+    if os.environ.get('METRICS_SLOW_QUERY_THRESHOLD') else None,
+    'LOG_SQL_PARAMS': os.environ.get('METRICS_LOG_SQL_PARAMS') == '1',
+}
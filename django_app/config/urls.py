@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from metrics.views import metrics
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularRedocView,
@@ -9,6 +10,7 @@ from drf_spectacular.views import (
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('api/v1/', include('recipes.urls')),
     path('api/v1/', include('users.urls')),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
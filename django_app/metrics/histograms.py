@@ -0,0 +1,73 @@
+import threading
+
+
+# Число бит точности: каждый интервал [2^k, 2^(k+1)) делится на 2^4 корзин,
+# относительная ошибка квантиля не больше 1/16
+SUB_BUCKET_BITS = 4
+
+
+class Histogram:
+    """
+    Гистограмма неотрицательных целых значений с логарифмически-линейными
+    корзинами, как в HdrHistogram.
+
+    Значения меньше 2^(SUB_BUCKET_BITS + 1) хранятся точно, большие -
+    в корзинах шириной 2^shift, поэтому число корзин растет логарифмически
+    от максимального значения, а запись - O(1) без выделения памяти под
+    каждое значение.
+    """
+
+    def __init__(self, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self._lock = threading.Lock()
+        # Номер корзины -> число значений
+        self._counts = {}
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def _get_index(self, value):
+        shift = max(value.bit_length() - self.sub_bucket_bits - 1, 0)
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def _get_highest_value(self, index):
+        """
+        Наибольшее значение, попадающее в корзину
+        """
+        if index < 2 << self.sub_bucket_bits:
+            return index
+        shift = (index >> self.sub_bucket_bits) - 1
+        lowest = (index - (shift << self.sub_bucket_bits)) << shift
+        return lowest + (1 << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = self._get_index(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def get_quantiles(self, quantiles):
+        """
+        Возвращает значения заданных квантилей (0..1) - верхние границы
+        корзин, не больше максимального записанного значения
+        """
+        with self._lock:
+            counts = sorted(self._counts.items())
+            count, maximum = self.count, self.max
+        result = []
+        for quantile in quantiles:
+            if not count:
+                result.append(0)
+                continue
+            rank = max(quantile * count, 1)
+            seen = 0
+            for index, bucket_count in counts:
+                seen += bucket_count
+                if seen >= rank:
+                    result.append(min(self._get_highest_value(index), maximum))
+                    break
+        return result
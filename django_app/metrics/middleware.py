@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import markcoroutinefunction
+from django.db import connection
+
+from config.app_settings import get_app_settings
+
+from .registry import (
+    db_duration, db_queries, request_duration, requests_total, serialization_duration
+)
+
+
+slow_query_logger = logging.getLogger('metrics.slow_query')
+
+DEFAULT_METRICS_SETTINGS = {
+    # Запросы SQL не короче порога (в секундах) пишутся в лог
+    # metrics.slow_query (None - не писать)
+    'SLOW_QUERY_THRESHOLD': None,
+    # Писать в лог медленных запросов и параметры: в них могут быть
+    # персональные данные и пароли
+    'LOG_SQL_PARAMS': False,
+}
+
+
+def get_metrics_settings():
+    return get_app_settings('METRICS', DEFAULT_METRICS_SETTINGS)
+
+
+class RequestMetrics:
+    """
+    Показатели одного запроса. Доступны в представлениях как
+    request.metrics, MetricsViewSetMixin уточняет endpoint и добавляет
+    время сериализации.
+    """
+    __slots__ = ('endpoint', 'queries', 'sql_time', 'serialization_time', 'path',
+                 'slow_query_threshold', 'log_sql_params')
+
+    def __init__(self, path, slow_query_threshold, log_sql_params=False):
+        self.endpoint = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialization_time = None
+        self.path = path
+        self.slow_query_threshold = slow_query_threshold
+        self.log_sql_params = log_sql_params
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обертка выполнения SQL (connection.execute_wrapper)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.sql_time += duration
+            if (self.slow_query_threshold is not None
+                    and duration >= self.slow_query_threshold):
+                if self.log_sql_params:
+                    slow_query_logger.warning(
+                        'Медленный SQL запрос %.1f мс (%s): %s; параметры: %r',
+                        duration * 1000, self.path, sql, params)
+                else:
+                    slow_query_logger.warning(
+                        'Медленный SQL запрос %.1f мс (%s): %s',
+                        duration * 1000, self.path, sql)
+
+
+class MetricsMiddleware:
+    """
+    Собирает для каждого запроса общее время, число и время SQL запросов
+    (и время сериализации, если его измеряет MetricsViewSetMixin) в
+    гистограммы по endpoint и методу, см. metrics.views.metrics.
+
+    Endpoint - действие ViewSet (basename.action) или имя URL. Запросы,
+    выполняемые при итерации StreamingHttpResponse, не учитываются.
+    Должен стоять первым в MIDDLEWARE.
+
+    Под ASGI SQL запросы выполняются в других потоках, их учитывают
+    асинхронные представления recipes.async_views, для синхронных
+    представлений учитывается только время ответа.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics_settings = get_metrics_settings()
+        self.slow_query_threshold = metrics_settings['SLOW_QUERY_THRESHOLD']
+        self.log_sql_params = metrics_settings['LOG_SQL_PARAMS']
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        metrics = request.metrics = RequestMetrics(
+            request.path, self.slow_query_threshold, self.log_sql_params)
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        self.observe(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        metrics = request.metrics = RequestMetrics(
+            request.path, self.slow_query_threshold, self.log_sql_params)
+        response = await self.get_response(request)
+        self.observe(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    def observe(self, request, response, metrics, duration):
+        endpoint = metrics.endpoint
+        if endpoint is None:
+            resolver_match = getattr(request, 'resolver_match', None)
+            # Неизвестные пути не попадают в метки, чтобы не плодить серии
+            endpoint = resolver_match.view_name if resolver_match else 'unmatched'
+        labels = (endpoint, request.method)
+        requests_total.inc(labels + (response.status_code,))
+        request_duration.observe(labels, duration)
+        db_queries.observe(labels, metrics.queries)
+        db_duration.observe(labels, metrics.sql_time)
+        if metrics.serialization_time is not None:
+            serialization_duration.observe(labels, metrics.serialization_time)
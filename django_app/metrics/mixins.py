@@ -0,0 +1,50 @@
+import time
+
+
+class MetricsViewSetMixin:
+    """
+    Mixin для ViewSet, уточняющий показатели запроса, собираемые
+    MetricsMiddleware: endpoint - basename.action, и время сериализации -
+    to_representation сериализаторов действия плюс рендеринг ответа.
+    Без MetricsMiddleware ничего не делает.
+    """
+
+    def _get_request_metrics(self):
+        return getattr(self.request._request, 'metrics', None)
+
+    def initial(self, request, *args, **kwargs):
+        # До проверки прав: отклоненные запросы тоже учитываются по действию
+        metrics = self._get_request_metrics()
+        if metrics is not None:
+            metrics.endpoint = f'{self.basename}.{self.action}'
+            metrics.serialization_time = 0.0
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        metrics = self._get_request_metrics()
+        if metrics is not None:
+            to_representation = serializer.to_representation
+
+            def timed_to_representation(instance):
+                start = time.perf_counter()
+                try:
+                    return to_representation(instance)
+                finally:
+                    metrics.serialization_time += time.perf_counter() - start
+
+            serializer.to_representation = timed_to_representation
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        metrics = self._get_request_metrics()
+        if metrics is not None and hasattr(response, 'add_post_render_callback'):
+            # Ответ рендерится сразу после выхода из представления
+            start = time.perf_counter()
+
+            def add_render_time(rendered):
+                metrics.serialization_time += time.perf_counter() - start
+
+            response.add_post_render_callback(add_render_time)
+        return response
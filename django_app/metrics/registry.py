@@ -0,0 +1,133 @@
+import threading
+
+from .histograms import Histogram
+
+
+def _format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+    )
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Метрика с набором меток: для каждого набора значений меток хранится
+    отдельное значение
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _get(self, labelvalues, factory):
+        value = self._values.get(labelvalues)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(labelvalues, factory())
+        return value
+
+    def collect(self):
+        """
+        Строки метрики в текстовом формате Prometheus
+        """
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} {self.type}'
+        with self._lock:
+            values = sorted(self._values.items())
+        for labelvalues, value in values:
+            yield from self._collect_value(list(zip(self.labelnames, labelvalues)), value)
+
+
+class Counter(Metric):
+    """
+    Счетчик событий
+    """
+    type = 'counter'
+
+    class _Value:
+        def __init__(self):
+            self._lock = threading.Lock()
+            self.value = 0
+
+    def inc(self, labelvalues, amount=1):
+        counter = self._get(labelvalues, self._Value)
+        with counter._lock:
+            counter.value += amount
+
+    def _collect_value(self, labels, counter):
+        yield f'{self.name}_total{{{_format_labels(labels)}}} {counter.value}'
+
+
+class Summary(Metric):
+    """
+    Распределение значений с квантилями, вычисляемыми по Histogram.
+    Значения записываются целыми числами в единицах 1 / scale (например,
+    микросекундах при scale=10**6) и выводятся в исходных единицах.
+    """
+    type = 'summary'
+    quantiles = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, name, documentation, labelnames, scale=1):
+        super().__init__(name, documentation, labelnames)
+        self.scale = scale
+
+    def observe(self, labelvalues, value):
+        self._get(labelvalues, Histogram).record(round(value * self.scale))
+
+    def get_histogram(self, labelvalues):
+        return self._values.get(labelvalues)
+
+    def _collect_value(self, labels, histogram):
+        scale = self.scale
+        values = histogram.get_quantiles(self.quantiles)
+        for quantile, value in zip(self.quantiles, values):
+            yield (f'{self.name}{{{_format_labels(labels + [("quantile", quantile)])}}} '
+                   f'{_format_value(value / scale if scale != 1 else value)}')
+        label_string = _format_labels(labels)
+        total = histogram.sum / scale if scale != 1 else histogram.sum
+        yield f'{self.name}_sum{{{label_string}}} {_format_value(total)}'
+        yield f'{self.name}_count{{{label_string}}} {histogram.count}'
+
+
+class Registry:
+    """
+    Метрики процесса. При нескольких процессах (worker-ах) каждый отдает
+    свои значения, агрегация выполняется на стороне Prometheus.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return ''.join(
+            line + '\n' for metric in self._metrics for line in metric.collect())
+
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    'http_requests', 'Число запросов', ('endpoint', 'method', 'status')))
+request_duration = registry.register(Summary(
+    'http_request_duration_seconds', 'Время обработки запроса',
+    ('endpoint', 'method'), scale=10 ** 6))
+db_queries = registry.register(Summary(
+    'http_request_db_queries', 'Число SQL запросов на запрос', ('endpoint', 'method')))
+db_duration = registry.register(Summary(
+    'http_request_db_duration_seconds', 'Время выполнения SQL запросов на запрос',
+    ('endpoint', 'method'), scale=10 ** 6))
+serialization_duration = registry.register(Summary(
+    'http_request_serialization_duration_seconds',
+    'Время сериализации и рендеринга ответа', ('endpoint', 'method'), scale=10 ** 6))
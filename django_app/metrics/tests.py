@@ -0,0 +1,65 @@
+import random
+
+from django.test import TestCase, override_settings
+
+from .histograms import Histogram
+from .registry import db_queries, request_duration
+
+
+class HistogramTest(TestCase):
+    """
+    Точность квантилей логарифмически-линейной гистограммы
+    """
+
+    def test_quantiles(self):
+        rng = random.Random(0)
+        values = [rng.randint(0, 10 ** 7) for _ in range(10000)]
+        histogram = Histogram()
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for quantile, value in zip((0.5, 0.99, 1), histogram.get_quantiles((0.5, 0.99, 1))):
+            expected = values[int(quantile * len(values)) - 1]
+            self.assertLessEqual(abs(value - expected), expected / 16 + 1)
+        self.assertEqual(histogram.count, len(values))
+        self.assertEqual(histogram.sum, sum(values))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        for value in (0, 1, 2, 3, 31):
+            histogram.record(value)
+        self.assertEqual(histogram.get_quantiles((0.2, 0.4, 0.6, 0.8, 1)), [0, 1, 2, 3, 31])
+
+
+class MetricsMiddlewareTest(TestCase):
+    """
+    Показатели запросов по действиям ViewSet
+    """
+
+    def test_viewset_action_metrics(self):
+        labels = ('measure.list', 'GET')
+        histogram = request_duration.get_histogram(labels)
+        count = histogram.count if histogram else 0
+        self.client.get('/api/v1/measure/')
+        self.assertEqual(request_duration.get_histogram(labels).count, count + 1)
+
+        content = self.client.get('/metrics').content.decode()
+        self.assertIn(
+            'http_request_db_queries_count{endpoint="measure.list",method="GET"}', content)
+        self.assertIn(
+            'http_request_serialization_duration_seconds_count'
+            '{endpoint="measure.list",method="GET"}', content)
+        self.assertIsNotNone(db_queries.get_histogram(labels))
+
+    @override_settings(METRICS={'SLOW_QUERY_THRESHOLD': 0})
+    def test_slow_query_log(self):
+        with self.assertLogs('metrics.slow_query', 'WARNING') as logs:
+            self.client.get('/api/v1/recipe/123456/')
+        self.assertIn('FROM "recipe"', logs.output[0])
+        self.assertFalse(any('параметры' in line for line in logs.output))
+
+    @override_settings(METRICS={'SLOW_QUERY_THRESHOLD': 0, 'LOG_SQL_PARAMS': True})
+    def test_slow_query_log_with_params(self):
+        with self.assertLogs('metrics.slow_query', 'WARNING') as logs:
+            self.client.get('/api/v1/recipe/123456/')
+        self.assertTrue(any('параметры: (123456' in line for line in logs.output))
@@ -0,0 +1,10 @@
+from django.http import HttpResponse
+
+from .registry import registry
+
+
+def metrics(request):
+    """
+    Метрики процесса в текстовом формате Prometheus
+    """
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
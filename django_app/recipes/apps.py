@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .lookups import register_field_lookup
+        from .pantry import ANY_LOOKUP_FIELDS, Any
+        from .search import SEARCH_MODELS, TrigramWordSimilar
+
+        for model_name, field_name in ANY_LOOKUP_FIELDS:
+            register_field_lookup(self.get_model(model_name)._meta.get_field(field_name), Any)
+        for model_name in SEARCH_MODELS.values():
+            register_field_lookup(
+                self.get_model(model_name)._meta.get_field('name'), TrigramWordSimilar)
@@ -0,0 +1,94 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+from config.app_settings import get_app_settings
+
+
+DEFAULT_ASYNC_SETTINGS = {
+    # Число потоков, в которых асинхронные представления выполняют
+    # обращения к БД (и максимум одновременных соединений процесса с БД)
+    'DB_THREADS': 16,
+    # True - выполнять в потоке вызывающего кода, как sync_to_async по
+    # умолчанию (нужно в TestCase, где данные теста видны только в его
+    # соединении)
+    'THREAD_SENSITIVE': False,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_async_settings():
+    return get_app_settings('RECIPES_ASYNC', DEFAULT_ASYNC_SETTINGS)
+
+
+def get_db_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_async_settings()['DB_THREADS'],
+                    thread_name_prefix='recipes-db')
+    return _executor
+
+
+def _call_in_db_thread(func, request, *args, **kwargs):
+    # Соединение потока живет между вызовами, как между запросами в WSGI:
+    # закрывается по CONN_MAX_AGE или после ошибки
+    close_old_connections()
+    try:
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return func(request, *args, **kwargs)
+        with connection.execute_wrapper(metrics):
+            return func(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_db_thread(func, request, *args, **kwargs):
+    """
+    Выполняет синхронное представление func в пуле потоков БД, не занимая
+    цикл событий. В отличие от синхронных представлений под ASGI (которые
+    Django 3.2 выполняет по одному в общем потоке) запросы выполняются
+    параллельно, но не больше DB_THREADS одновременно.
+    """
+    call = functools.partial(_call_in_db_thread, func, request, *args, **kwargs)
+    if get_async_settings()['THREAD_SENSITIVE']:
+        return await sync_to_async(call, thread_sensitive=True)()
+    return await asyncio.get_running_loop().run_in_executor(get_db_executor(), call)
+
+
+def async_view(viewset_class, actions, **initkwargs):
+    """
+    Асинхронное представление действий ViewSet только для чтения: тот же
+    ViewSet (сериализаторы, пагинация, права доступа), выполняемый
+    в пуле потоков БД (см. run_in_db_thread)
+    """
+    for action in actions.values():
+        handler = getattr(viewset_class, action)
+        if hasattr(handler, 'mapping'):
+            # Параметры @action (имя, схема, права доступа), как в DRF Router
+            initkwargs = {**handler.kwargs, **initkwargs}
+    view = viewset_class.as_view(actions, **initkwargs)
+
+    async def async_read_view(request, *args, **kwargs):
+        response = await run_in_db_thread(view, request, *args, **kwargs)
+        # Ответ DRF рендерится лениво, рендеринг тоже выполняется в пуле
+        if hasattr(response, 'render') and not response.is_rendered:
+            await run_in_db_thread(lambda request: response.render(), request)
+        return response
+
+    # Атрибуты, по которым DRF и drf_spectacular находят ViewSet
+    # представления (см. ViewSetMixin.as_view)
+    async_read_view.cls = async_read_view.view_class = viewset_class
+    async_read_view.initkwargs = view.initkwargs
+    async_read_view.actions = actions
+    async_read_view.csrf_exempt = True
+    return async_read_view
@@ -0,0 +1,386 @@
+import datetime
+import http.client
+import random
+import statistics
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count, Max, Min
+from django.test import Client
+from django.test.utils import override_settings
+
+
+SYNTHETIC_PREFIX = 'bench'
+
+
+def iter_synthetic_catalog(recipes, ingredients_per_recipe=10, users=100, votes=0, seed=0,
+                           prefix=SYNTHETIC_PREFIX):
+    """
+    Синтетический каталог в виде объектов фикстуры Django для CatalogLoader.
+
+    Ингредиенты берутся из уже загруженного словаря (initial_fixtures.json)
+    с вероятностью, пропорциональной их частоте в существующих рецептах,
+    число ингредиентов рецепта - от половины до полутора
+    ingredients_per_recipe. При одинаковых seed генерируются одинаковые
+    данные, уже созданные предыдущим запуском объекты пропускаются.
+    """
+    from .models import Ingredient, Measure, Recipe, RecipeCategory, RecipeIngredient
+
+    rng = random.Random(seed)
+    user_model = get_user_model()
+    vocabulary = list(Ingredient.objects.annotate(
+        weight=Count('recipe_ingredients')).values_list('pk', 'weight'))
+    if not vocabulary:
+        raise ValueError('Нет ингредиентов: сначала загрузите initial_fixtures.json')
+    ingredient_ids = [pk for pk, _ in vocabulary]
+    weights = [weight + 1 for _, weight in vocabulary]
+    measure_ids = list(Measure.objects.values_list('pk', flat=True))
+    category_ids = list(RecipeCategory.objects.values_list('pk', flat=True))
+    if not measure_ids or not category_ids:
+        raise ValueError('Нет единиц измерения или категорий рецептов')
+
+    def next_pk(model):
+        return (model.objects.aggregate(pk=Max('pk'))['pk'] or 0) + 1
+
+    # Объекты предыдущего запуска с теми же seed и prefix не создаются заново
+    username_field = user_model.USERNAME_FIELD
+    existing_users = dict(user_model.objects.filter(**{
+        f'{username_field}__startswith': f'{prefix}_user_{seed}_',
+    }).values_list(username_field, 'pk'))
+    existing_recipes = dict(Recipe.objects.filter(
+        name__startswith=f'{prefix} {seed}-').values_list('name', 'pk'))
+
+    user_pk, recipe_pk, row_pk = next_pk(user_model), next_pk(Recipe), next_pk(RecipeIngredient)
+    user_ids = []
+    for i in range(users):
+        username = f'{prefix}_user_{seed}_{i}'
+        if username in existing_users:
+            user_ids.append(existing_users[username])
+            continue
+        yield {'model': user_model._meta.label_lower, 'pk': user_pk, 'fields': {
+            username_field: username, 'password': '!'}}
+        user_ids.append(user_pk)
+        user_pk += 1
+
+    created_at = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+    recipe_ids = []
+    for i in range(recipes):
+        name = f'{prefix} {seed}-{i}'
+        timestamp = (created_at + datetime.timedelta(seconds=i)).isoformat()
+        recipe = {'model': 'recipes.recipe', 'pk': recipe_pk, 'fields': {
+            'author': rng.choice(user_ids),
+            'recipe_category': rng.choice(category_ids),
+            'name': name,
+            'cook_time': str(datetime.timedelta(seconds=rng.randrange(60, 3 * 3600))),
+            'created_at': timestamp,
+            'updated_at': timestamp,
+        }}
+        size = rng.randint(max(ingredients_per_recipe // 2, 1), ingredients_per_recipe * 3 // 2)
+        ingredients = set()
+        while len(ingredients) < min(size, len(ingredient_ids)):
+            ingredients.update(rng.choices(ingredient_ids, weights, k=size - len(ingredients)))
+        amounts = [(rng.choice(measure_ids), rng.randint(1, 500)) for _ in ingredients]
+        if name in existing_recipes:
+            recipe_ids.append(existing_recipes[name])
+            continue
+        yield recipe
+        for ingredient_id, (measure_id, amount) in zip(sorted(ingredients), amounts):
+            yield {'model': 'recipes.recipeingredient', 'pk': row_pk, 'fields': {
+                'author': user_ids[0], 'recipe': recipe_pk, 'measure': measure_id,
+                'ingredient': ingredient_id, 'amount': f'{amount}.00'}}
+            row_pk += 1
+        recipe_ids.append(recipe_pk)
+        recipe_pk += 1
+
+    voted = set()
+    for _ in range(min(votes, users * recipes)):
+        vote = (rng.choice(user_ids), rng.choice(recipe_ids))
+        if vote not in voted:
+            voted.add(vote)
+            yield {'model': 'recipes.userrecipescore', 'fields': {
+                'user': vote[0], 'recipe': vote[1], 'score': rng.randint(1, 10)}}
+
+
+class QueryCounter:
+    """
+    Обертка выполнения SQL, считающая запросы
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(values, quantile):
+    return values[min(int(quantile * len(values)), len(values) - 1)]
+
+
+def summarize(timings, query_counts, errors, elapsed):
+    """
+    Сводка сценария: пропускная способность, квантили времени ответа
+    и число SQL запросов на запрос (если query_counts не None)
+    """
+    timings = sorted(timings)
+    summary = {
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': len(timings) / elapsed if elapsed else None,
+        'latency_ms': {
+            'mean': statistics.mean(timings),
+            'p50': _percentile(timings, 0.5),
+            'p90': _percentile(timings, 0.9),
+            'p99': _percentile(timings, 0.99),
+            'max': timings[-1],
+        },
+    }
+    if query_counts is not None:
+        summary['queries'] = {
+            'mean': statistics.mean(query_counts),
+            'max': max(query_counts),
+        }
+    return summary
+
+
+class ApiBenchmark:
+    """
+    Нагрузочные сценарии API, выполняемые в процессе через тестовый клиент
+    Django (без сети и сервера приложений). Параметры запросов выбираются
+    генератором случайных чисел с заданным seed, поэтому повторные запуски
+    на тех же данных воспроизводимы.
+    """
+    scenarios = (
+        'available_by_ingredients',
+        'closest_by_ingredients',
+        'missed_ingredients',
+        'shopping_list',
+        'cook_time',
+        'list_cursor',
+        'list_page',
+        'vote',
+        'search',
+        'leaderboard',
+        'similar',
+        'similar_by_ingredients',
+    )
+
+    def __init__(self, seed=0, pantry_size=20, page_size=100, warmup=5):
+        from .models import Ingredient, Recipe, RecipeCategory
+
+        self.rng = random.Random(seed)
+        self.pantry_size = pantry_size
+        self.page_size = page_size
+        self.warmup = warmup
+        self.client = Client()
+        vocabulary = list(Ingredient.objects.annotate(
+            weight=Count('recipe_ingredients')).values_list('pk', 'weight'))
+        self.ingredient_ids = [pk for pk, _ in vocabulary]
+        self.ingredient_weights = [weight + 1 for _, weight in vocabulary]
+        bounds = Recipe.objects.aggregate(min=Min('pk'), max=Max('pk'))
+        self.recipe_ids = (bounds['min'] or 0, bounds['max'] or 0)
+        self.recipe_pks = list(Recipe.objects.values_list('pk', flat=True))
+        self.recipes_count = len(self.recipe_pks)
+        self.ingredient_names = list(Ingredient.objects.values_list('name', flat=True))
+        self.category_ids = list(RecipeCategory.objects.values_list('pk', flat=True))
+        self._cursor_url = None
+        self._voter = None
+        self._votes = 0
+
+    def _get_pantry(self):
+        pantry = set(self.rng.choices(
+            self.ingredient_ids, self.ingredient_weights, k=self.pantry_size))
+        return '&'.join(f'ingredient={pk}' for pk in sorted(pantry))
+
+    def _get_recipe_id(self):
+        return self.rng.randint(*self.recipe_ids)
+
+    def get_request(self, scenario):
+        """
+        Возвращает (method, url, data) очередного запроса сценария
+        """
+        if scenario == 'available_by_ingredients':
+            return 'get', f'/api/v1/recipe/available_by_ingredients/?{self._get_pantry()}', None
+        if scenario == 'closest_by_ingredients':
+            return 'get', f'/api/v1/recipe/closest_by_ingredients/?{self._get_pantry()}', None
+        if scenario == 'missed_ingredients':
+            return ('get', f'/api/v1/recipe/{self._get_recipe_id()}/missed_ingredients/'
+                           f'?{self._get_pantry()}', None)
+        if scenario == 'shopping_list':
+            recipes = self.rng.sample(self.recipe_pks, min(50, len(self.recipe_pks)))
+            return ('get', '/api/v1/recipe/shopping_list/?'
+                           + '&'.join(f'recipe={pk}' for pk in recipes)
+                           + f'&{self._get_pantry()}', None)
+        if scenario == 'cook_time':
+            cook_time = datetime.timedelta(seconds=self.rng.randrange(60, 3600))
+            return 'get', f'/api/v1/recipe/cook_time/?cook_time={cook_time}', None
+        if scenario == 'list_cursor':
+            # Последовательный обход списка по ссылкам next
+            url = self._cursor_url or f'/api/v1/recipe/?page_size={self.page_size}'
+            return 'get', url, None
+        if scenario == 'list_page':
+            pages = max(self.recipes_count // self.page_size, 1)
+            return ('get', f'/api/v1/recipe/?page={self.rng.randint(1, pages)}'
+                           f'&page_size={self.page_size}', None)
+        if scenario == 'vote':
+            return 'post', '/api/v1/user_recipe_rating/', {
+                'recipe': self._get_recipe_id(), 'score': self.rng.randint(1, 10)}
+        if scenario == 'search':
+            # Автодополнение: начало названия ингредиента
+            name = self.rng.choice(self.ingredient_names)
+            return 'get', '/api/v1/search/', {'q': name[:self.rng.randint(2, 6)], 'limit': 10}
+        if scenario == 'leaderboard':
+            params = {'kind': self.rng.choice(('top_rated', 'popular')), 'limit': 20}
+            if self.category_ids:
+                params['recipe_category'] = self.rng.choice(self.category_ids)
+            return 'get', '/api/v1/recipe/leaderboard/', params
+        if scenario == 'similar':
+            return 'get', f'/api/v1/recipe/{self.rng.choice(self.recipe_pks)}/similar/', None
+        if scenario == 'similar_by_ingredients':
+            params = {'method': self.rng.choice(('jaccard', 'weighted'))}
+            return ('get', f'/api/v1/recipe/{self.rng.choice(self.recipe_pks)}'
+                           f'/similar_by_ingredients/', params)
+        raise ValueError(f'Неизвестный сценарий {scenario}')
+
+    def _prepare(self, scenario):
+        if scenario == 'vote':
+            self._new_voter()
+        else:
+            self.client.logout()
+
+    def _new_voter(self):
+        user_model = get_user_model()
+        self._voter = user_model.objects.create(
+            **{user_model.USERNAME_FIELD: f'{SYNTHETIC_PREFIX}_voter_{time.time_ns()}'})
+        self.client.force_login(self._voter)
+        self._votes = 0
+
+    def _after_request(self, scenario, response):
+        if scenario == 'list_cursor':
+            self._cursor_url = response.json().get('next') if response.status_code == 200 else None
+        elif scenario == 'vote':
+            # Пользователь голосует за рецепт один раз
+            self._votes += 1
+            if self._votes >= 50:
+                self._new_voter()
+
+    def run(self, scenario, requests):
+        self._prepare(scenario)
+        timings, query_counts, errors = [], [], 0
+        with override_settings(ALLOWED_HOSTS=['*'], DEBUG=False):
+            for i in range(self.warmup + requests):
+                method, url, data = self.get_request(scenario)
+                counter = QueryCounter()
+                start = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    response = getattr(self.client, method)(url, data)
+                duration = (time.perf_counter() - start) * 1000
+                self._after_request(scenario, response)
+                if i < self.warmup:
+                    continue
+                if response.status_code >= 400:
+                    errors += 1
+                timings.append(duration)
+                query_counts.append(counter.count)
+        return summarize(timings, query_counts, errors, sum(timings) / 1000)
+
+
+class ConcurrencyBenchmark:
+    """
+    Сценарии только для чтения ApiBenchmark, выполняемые по HTTP против
+    запущенного сервера (WSGI или ASGI) заданным числом одновременных
+    клиентов. Каждый клиент - поток с постоянным соединением, пропускная
+    способность считается по общему времени выполнения.
+    """
+    scenarios = (
+        'available_by_ingredients',
+        'closest_by_ingredients',
+        'missed_ingredients',
+        'shopping_list',
+        'list_page',
+        'search',
+        'leaderboard',
+    )
+    api_prefix = '/api/v1/'
+
+    def __init__(self, seed=0, pantry_size=20, page_size=100, timeout=60):
+        self.api = ApiBenchmark(seed=seed, pantry_size=pantry_size, page_size=page_size)
+        self.timeout = timeout
+
+    def get_paths(self, scenario, requests):
+        """
+        Пути запросов сценария относительно префикса API
+        """
+        paths = []
+        for _ in range(requests):
+            method, url, data = self.api.get_request(scenario)
+            if data:
+                url = f'{url}?{urllib.parse.urlencode(data)}'
+            paths.append(url[len(self.api_prefix):])
+        return paths
+
+    def run(self, base_url, paths, concurrency):
+        base = urllib.parse.urlsplit(base_url)
+        local = threading.local()
+
+        def request(path):
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection(
+                    base.hostname, base.port, timeout=self.timeout)
+            try:
+                local.connection.request('GET', base.path + path)
+                response = local.connection.getresponse()
+                response.read()
+                if response.will_close:
+                    local.connection.close()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                raise
+
+        def fetch(path):
+            start = time.perf_counter()
+            try:
+                try:
+                    status = request(path)
+                except (ConnectionError, http.client.RemoteDisconnected):
+                    # Сервер закрыл постоянное соединение
+                    status = request(path)
+            except (OSError, http.client.HTTPException):
+                status = None
+            return (time.perf_counter() - start) * 1000, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(fetch, paths))
+        elapsed = time.perf_counter() - start
+        errors = sum(status is None or status >= 400 for _, status in results)
+        return summarize([timing for timing, _ in results], None, errors, elapsed)
+
+
+def compare_reports(baseline, report):
+    """
+    Изменение показателей отчета относительно baseline в процентах
+    (положительное - хуже)
+    """
+    result = {}
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        changes = {}
+        for key in ('p50', 'p99'):
+            if previous['latency_ms'][key]:
+                changes[key] = (current['latency_ms'][key] / previous['latency_ms'][key] - 1) * 100
+        if current['throughput_rps'] and previous['throughput_rps']:
+            changes['throughput_rps'] = (
+                previous['throughput_rps'] / current['throughput_rps'] - 1) * 100
+        changes['queries'] = current['queries']['mean'] - previous['queries']['mean']
+        result[name] = changes
+    return result
@@ -0,0 +1,153 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import parse_etags
+
+from config.app_settings import get_app_settings
+
+
+DEFAULT_RESPONSE_CACHE_SETTINGS = {
+    # Алиас кеша из CACHES (locmem, файловый, Redis и т.д.)
+    'CACHE_ALIAS': 'default',
+    # Время жизни ответа в секундах
+    'TIMEOUT': 300,
+    'KEY_PREFIX': 'recipes',
+}
+
+
+def get_response_cache_settings():
+    return get_app_settings('RECIPES_RESPONSE_CACHE', DEFAULT_RESPONSE_CACHE_SETTINGS)
+
+
+def get_cache():
+    return caches[get_response_cache_settings()['CACHE_ALIAS']]
+
+
+def _get_generation_key(model):
+    prefix = get_response_cache_settings()['KEY_PREFIX']
+    return f'{prefix}:generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    """
+    Возвращает текущие поколения моделей. Поколение меняется при каждом
+    изменении модели, поэтому входит в ключи закешированных ответов.
+    """
+    cache = get_cache()
+    keys = [_get_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Начинаем со времени, а не с 1, чтобы после вытеснения ключа
+            # не вернуться к поколению, для которого еще есть ответы в кеше
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    """
+    Делает недействительными закешированные ответы, зависящие от модели
+    """
+    cache = get_cache()
+    key = _get_generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _get_object_generation_key(model, pk):
+    return f'{_get_generation_key(model)}:{pk}'
+
+
+def get_object_generations(model, pks):
+    """
+    Возвращает словарь pk -> поколение отдельных объектов модели (см.
+    bump_object_generations) для кеширования данных, зависящих от объекта
+    """
+    cache = get_cache()
+    keys = {pk: _get_object_generation_key(model, pk) for pk in pks}
+    generations = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return {pk: generations[key] for pk, key in keys.items()}
+
+
+def bump_object_generations(model, pks):
+    """
+    Делает недействительными закешированные данные объектов модели
+    """
+    cache = get_cache()
+    for pk in pks:
+        key = _get_object_generation_key(model, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+class CachedResponseMixin:
+    """
+    Mixin для ViewSet, кеширующий готовые (отрендеренные) JSON ответы
+    действий cached_actions. При попадании в кеш не выполняются ни запросы
+    к БД, ни сериализация. Ответы отдаются с ETag, на If-None-Match с
+    совпадающим ETag возвращается 304.
+
+    cache_models - модели, от которых зависит ответ (по умолчанию модель
+    queryset). Их поколения (см. bump_generation) входят в ключ, поэтому
+    изменение модели делает ответы недействительными.
+
+    Ответ не зависит от пользователя, поэтому mixin подходит только для
+    общедоступных справочников.
+    """
+    cached_actions = ('list', 'retrieve')
+    cache_models = None
+
+    def list(self, request, *args, **kwargs):
+        return self._get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._get_cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _get_cache_key(self, request):
+        cache_settings = get_response_cache_settings()
+        models = self.cache_models or (self.queryset.model,)
+        generations = ':'.join(str(generation) for generation in get_generations(models))
+        digest = hashlib.md5(
+            f'{request.get_full_path()}|{request.accepted_media_type}'.encode()
+        ).hexdigest()
+        return f'{cache_settings["KEY_PREFIX"]}:response:{generations}:{digest}'
+
+    def _get_cached_response(self, handler, request, *args, **kwargs):
+        if (self.action not in self.cached_actions
+                or request.accepted_renderer.format != 'json'):
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self._get_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type, etag = cached
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = HttpResponseNotModified()
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = get_response_cache_settings()['TIMEOUT']
+
+            def store(rendered):
+                etag = f'"{hashlib.md5(rendered.content).hexdigest()}"'
+                rendered['ETag'] = etag
+                cache.set(key, (rendered.content, rendered['Content-Type'], etag), timeout)
+
+            response.add_post_render_callback(store)
+        return response
@@ -0,0 +1,123 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+# Размер порции строк, получаемых с сервера БД за раз
+EXPORT_CHUNK_SIZE = 2000
+
+# Поля рецепта (и их источники), внешние ключи выгружаются натуральными ключами
+RECIPE_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'recipe_category': 'recipe_category__name',
+    'author': 'author__username',
+    'cook_time': 'cook_time',
+    'servings': 'servings',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'voter_turnout': 'voter_turnout',
+    'full_score': 'full_score',
+    'rating': 'rating',
+    'food_energy': 'food_energy',
+    'alcohol_by_volume': 'alcohol_by_volume',
+}
+RECIPE_INGREDIENT_FIELDS = {
+    'ingredient': 'ingredient__name',
+    'measure': 'measure__name',
+    'amount': 'amount',
+}
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _iter_values(queryset, fields, chunk_size):
+    names = list(fields)
+    for row in queryset.values_list(*fields.values()).iterator(chunk_size=chunk_size):
+        yield dict(zip(names, row))
+
+
+def iter_catalog(chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Итератор рецептов каталога со списками ингредиентов (recipe_ingredients).
+
+    Рецепты и ингредиенты рецептов читаются двумя курсорами на стороне
+    сервера, упорядоченными по id рецепта, и объединяются слиянием, поэтому
+    в памяти находится не больше порции строк независимо от размера каталога.
+    """
+    from .models import Recipe, RecipeIngredient
+
+    recipes = _iter_values(Recipe.objects.order_by('pk'), RECIPE_FIELDS, chunk_size)
+    rows = _iter_values(
+        RecipeIngredient.objects.order_by('recipe_id', 'pk'),
+        {'recipe_id': 'recipe_id', **RECIPE_INGREDIENT_FIELDS},
+        chunk_size,
+    )
+    row = next(rows, None)
+    for recipe in recipes:
+        # Пропускаем строки рецептов, удаленных между запросами
+        while row is not None and row['recipe_id'] < recipe['id']:
+            row = next(rows, None)
+        recipe_ingredients = []
+        while row is not None and row['recipe_id'] == recipe['id']:
+            del row['recipe_id']
+            recipe_ingredients.append(row)
+            row = next(rows, None)
+        recipe['recipe_ingredients'] = recipe_ingredients
+        yield recipe
+
+
+def iter_ndjson(recipes):
+    """
+    Рецепты в формате NDJSON: один JSON объект на строку
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for recipe in recipes:
+        yield encoder.encode(recipe) + '\n'
+
+
+class _Echo:
+    """
+    Файлоподобный объект, который возвращает записанную строку
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(recipes):
+    """
+    Рецепты в формате CSV: одна строка на ингредиент рецепта, поля рецепта
+    повторяются; рецепт без ингредиентов выгружается одной строкой
+    """
+    writer = csv.writer(_Echo())
+    encoder = DjangoJSONEncoder()
+    yield writer.writerow(list(RECIPE_FIELDS) + list(RECIPE_INGREDIENT_FIELDS))
+    empty = dict.fromkeys(RECIPE_INGREDIENT_FIELDS)
+    for recipe in recipes:
+        recipe_ingredients = recipe.pop('recipe_ingredients') or [empty]
+        values = [_to_csv(encoder, value) for value in recipe.values()]
+        for recipe_ingredient in recipe_ingredients:
+            yield writer.writerow(
+                values + [_to_csv(encoder, value) for value in recipe_ingredient.values()])
+
+
+def _to_csv(encoder, value):
+    if value is None or isinstance(value, (str, int)):
+        return value
+    # Даты, время и Decimal в том же виде, что и в JSON
+    return json.loads(encoder.encode(value))
+
+
+def iter_export(export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Итератор строк выгрузки каталога в формате export_format (ndjson, csv)
+    """
+    recipes = iter_catalog(chunk_size)
+    if export_format == 'csv':
+        return iter_csv(recipes)
+    return iter_ndjson(recipes)
@@ -0,0 +1,463 @@
+import datetime
+import hashlib
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, models, transaction
+from django.utils import timezone
+
+from .cache import bump_generation
+from .indexes import ingredient_index
+from .leaderboards import leaderboards
+from .nutrition import RECOMPUTE_BATCH_SIZE, recompute_recipes
+from .search import search_indexes
+from .similarity import ingredient_similarity
+from .units import conversion_table
+
+
+# Число объектов в одном INSERT
+IMPORT_BATCH_SIZE = 1000
+# Размер порции файла, читаемой за раз
+READ_CHUNK_SIZE = 1 << 16
+
+
+class CatalogImportError(ValueError):
+    """
+    Ошибка в данных загружаемого каталога
+    """
+
+
+def _iter_array(f, buffer):
+    decoder = json.JSONDecoder()
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            record, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # Объект не поместился в буфер целиком
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                raise CatalogImportError('Неожиданный конец JSON массива')
+            buffer += chunk
+            continue
+        yield record
+        buffer = buffer[end:]
+
+
+def iter_records(f):
+    """
+    Итератор объектов из JSON массива или NDJSON, читаемых из файла порциями,
+    без загрузки всего файла в память
+    """
+    buffer = f.read(READ_CHUNK_SIZE).lstrip()
+    if buffer.startswith('['):
+        yield from _iter_array(f, buffer[1:])
+        return
+    # Дочитываем первую строку, дальше файл читается построчно
+    lines = chain((buffer + f.readline()).splitlines(), f)
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CatalogImportError(f'Строка {number}: {e}')
+
+
+def _now(field):
+    # Текущее значение, как в pre_save полей auto_now
+    if isinstance(field, models.DateTimeField):
+        return timezone.now()
+    if isinstance(field, models.DateField):
+        return datetime.date.today()
+    return datetime.datetime.now().time()
+
+
+def _get_existing(model, field_name, values, *fields):
+    """
+    Множество значений fields (кортежей, если полей несколько) строк модели,
+    у которых значение поля field_name входит в values. Запросы разбиваются
+    на порции по числу параметров, допустимому базой
+    """
+    values = list(values)
+    batch_size = max(connection.ops.bulk_batch_size([field_name], values), 1)
+    existing = set()
+    for i in range(0, len(values), batch_size):
+        existing.update(model._base_manager.filter(
+            **{f'{field_name}__in': values[i:i + batch_size]}
+        ).values_list(*fields, flat=len(fields) == 1))
+    return existing
+
+
+def insert_objects(model, objs):
+    """
+    Массовый INSERT объектов порциями в режиме raw, как в loaddata: значения
+    полей auto_now и auto_now_add из файла сохраняются как есть, пустые
+    заполняются текущим временем. Уже существующие строки не пропускаются:
+    нарушение ограничений (внешний ключ, уникальность) - IntegrityError.
+    """
+    opts = model._meta
+    for field in opts.concrete_fields:
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            for obj in objs:
+                if getattr(obj, field.attname) is None:
+                    setattr(obj, field.attname, _now(field))
+    for has_pk in (True, False):
+        group = [obj for obj in objs if (obj.pk is not None) == has_pk]
+        fields = [
+            field for field in opts.concrete_fields
+            if has_pk or field is not opts.auto_field
+        ]
+        batch_size = max(connection.ops.bulk_batch_size(fields, group), 1)
+        for i in range(0, len(group), batch_size):
+            # bulk_create перезаписал бы поля auto_now в pre_save
+            model._base_manager._insert(group[i:i + batch_size], fields, raw=True)
+
+
+def get_checksum(f):
+    """
+    SHA-256 содержимого файла, открытого в двоичном режиме
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _count_rows(labels):
+    return {label: apps.get_model(label)._base_manager.count() for label in labels}
+
+
+def is_loaded(checksum):
+    """
+    Файл с контрольной суммой checksum уже загружен, и с тех пор ни в одной
+    из его таблиц не стало меньше строк (иначе часть объектов файла могла
+    быть удалена и загрузка повторяется)
+    """
+    from .models import CatalogImport
+
+    catalog_import = CatalogImport.objects.filter(checksum=checksum).first()
+    if catalog_import is None:
+        return False
+    try:
+        counts = _count_rows(catalog_import.row_counts)
+    except LookupError:
+        return False
+    return all(counts[label] >= count for label, count in catalog_import.row_counts.items())
+
+
+def mark_loaded(checksum, labels):
+    """
+    Запоминает загруженный файл и число строк в таблицах моделей labels
+    """
+    from .models import CatalogImport
+
+    CatalogImport.objects.update_or_create(
+        checksum=checksum, defaults={'row_counts': _count_rows(labels)})
+
+
+class CatalogLoader:
+    """
+    Загрузка каталога массовыми INSERT порциями по batch_size объектов.
+
+    Принимает объекты двух видов:
+    - объекты фикстур Django ({"model": ..., "pk": ..., "fields": ...}),
+      внешние ключи задаются id или натуральным ключом (name, username);
+    - рецепты в формате выгрузки export_catalog, с натуральными ключами
+      категории, автора, ингредиентов и единиц измерения. Недостающие
+      категории, ингредиенты и единицы измерения создаются, рецепты с уже
+      существующим названием пропускаются.
+
+    Натуральные ключи разрешаются по словарям в памяти. Порция модели
+    записывается только после записи порций моделей, на которые она
+    ссылается, при workers > 1 независимые порции пишутся параллельно.
+    Уже существующие объекты пропускаются, поэтому повторная загрузка того же
+    файла ничего не меняет.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, workers=1):
+        from .models import Ingredient, Measure, Recipe, RecipeCategory
+
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        user_model = get_user_model()
+        self.natural_key_fields = {
+            user_model: user_model.USERNAME_FIELD,
+            Measure: 'name',
+            Ingredient: 'name',
+            RecipeCategory: 'name',
+            Recipe: 'name',
+        }
+        # model -> {натуральный ключ: pk}
+        self.natural_keys = {}
+        self.pending = defaultdict(list)
+        self.futures = defaultdict(list)
+        self.recipes = []
+        self.m2m = []
+        self.counts = Counter()
+        self.inserted_pks = set()
+        self.recipe_ids = set()
+        self.scored_recipe_ids = set()
+
+    def get_natural_keys(self, model):
+        keys = self.natural_keys.get(model)
+        if keys is None:
+            # Словарь загружается из БД при первом обращении, поэтому
+            # накопленные объекты модели записываются до этого
+            self.flush(model)
+            self.wait(model)
+            keys = self.natural_keys[model] = dict(model._base_manager.values_list(
+                self.natural_key_fields[model], 'pk'))
+        return keys
+
+    def resolve(self, model, value):
+        """
+        Возвращает pk объекта по id или натуральному ключу
+        """
+        if isinstance(value, list) and len(value) == 1:
+            value = value[0]
+        if value is None or isinstance(value, int):
+            return value
+        if model not in self.natural_key_fields:
+            raise CatalogImportError(
+                f'{model._meta.label}: натуральные ключи не поддерживаются ({value!r})')
+        try:
+            return self.get_natural_keys(model)[value]
+        except KeyError:
+            raise CatalogImportError(f'{model._meta.label} {value!r} не найден')
+
+    def load(self, records):
+        for record in records:
+            if not isinstance(record, dict):
+                raise CatalogImportError(f'Ожидается объект, получено {record!r}')
+            if 'model' in record:
+                self.add_object(record)
+            else:
+                self.add_recipe(record)
+        self.finish()
+
+    def add_object(self, record):
+        try:
+            model = apps.get_model(record['model'])
+        except (LookupError, ValueError) as e:
+            raise CatalogImportError(str(e))
+        obj = model(pk=record.get('pk'))
+        for name, value in record.get('fields', {}).items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                if value:
+                    self.m2m.append((field, obj, value))
+            elif field.is_relation:
+                setattr(obj, field.attname, self.resolve(field.related_model, value))
+            else:
+                setattr(obj, field.attname, field.to_python(value))
+        keys = self.natural_keys.get(model)
+        if keys is not None and obj.pk is not None:
+            keys[getattr(obj, self.natural_key_fields[model])] = obj.pk
+        self.add(model, obj)
+
+    def add(self, model, obj):
+        from .models import Recipe, RecipeIngredient, UserRecipeScore
+
+        self.counts[model._meta.label] += 1
+        if model is Recipe:
+            self.recipe_ids.add(obj.pk)
+        elif model is RecipeIngredient:
+            self.recipe_ids.add(obj.recipe_id)
+        elif model is UserRecipeScore:
+            self.scored_recipe_ids.add(obj.recipe_id)
+        pending = self.pending[model]
+        pending.append(obj)
+        if len(pending) >= self.batch_size:
+            self.flush(model)
+
+    def get_dependencies(self, model):
+        return {
+            field.related_model for field in model._meta.concrete_fields
+            if field.is_relation and field.related_model is not model
+        }
+
+    def flush(self, model):
+        """
+        Записывает накопленную порцию модели после порций моделей,
+        на которые она ссылается
+        """
+        for dependency in self.get_dependencies(model):
+            self.flush(dependency)
+            self.wait(dependency)
+        objs = self.pending.pop(model, None)
+        if not objs:
+            return
+        if any(obj.pk is not None for obj in objs):
+            self.inserted_pks.add(model)
+        if self.executor is None:
+            self._insert(model, objs)
+        else:
+            self.futures[model].append(self.executor.submit(self._insert_in_thread, model, objs))
+
+    def wait(self, model):
+        for future in self.futures.pop(model, []):
+            future.result()
+
+    def _insert(self, model, objs):
+        # Строка, нарушающая ограничения, прерывает загрузку до записи
+        # контрольной суммы файла, а не пропускается
+        try:
+            with transaction.atomic():
+                insert_objects(model, self.skip_existing(model, objs))
+        except IntegrityError as e:
+            raise CatalogImportError(f'{model._meta.label}: {e}')
+
+    def skip_existing(self, model, objs):
+        """
+        Убирает из порции объекты, уже записанные в БД: с заданным pk - по pk,
+        без pk - по натуральному ключу, если он есть у модели
+        """
+        existing = _get_existing(
+            model, 'pk', {obj.pk for obj in objs if obj.pk is not None}, 'pk')
+        objs = [obj for obj in objs if obj.pk not in existing]
+        field = self.natural_key_fields.get(model)
+        if field is None:
+            return objs
+        existing = _get_existing(
+            model, field, {getattr(obj, field) for obj in objs if obj.pk is None}, field)
+        return [obj for obj in objs if obj.pk is not None or getattr(obj, field) not in existing]
+
+    def _insert_in_thread(self, model, objs):
+        try:
+            self._insert(model, objs)
+        finally:
+            # Соединения Django привязаны к потоку
+            connection.close()
+
+    def add_recipe(self, record):
+        self.recipes.append(record)
+        if len(self.recipes) >= self.batch_size:
+            self.flush_recipes()
+
+    def _create_missing(self, model, names):
+        keys = self.get_natural_keys(model)
+        missing = {name for name in names if name not in keys}
+        if missing:
+            self.flush(model)
+            self.wait(model)
+            field = self.natural_key_fields[model]
+            self._insert(model, [model(**{field: name}) for name in missing])
+            keys.update(model._base_manager.filter(
+                **{f'{field}__in': missing}).values_list(field, 'pk'))
+            self.counts[model._meta.label] += len(missing)
+
+    def flush_recipes(self):
+        """
+        Записывает накопленные рецепты в формате выгрузки
+        """
+        from .models import Ingredient, Measure, Recipe, RecipeCategory, RecipeIngredient
+
+        records, self.recipes = self.recipes, []
+        if not records:
+            return
+        try:
+            rows = [row for record in records for row in record.get('recipe_ingredients', [])]
+            self._create_missing(RecipeCategory, {record['recipe_category'] for record in records})
+            self._create_missing(Measure, {row['measure'] for row in rows})
+            self._create_missing(Ingredient, {row['ingredient'] for row in rows})
+        except KeyError as e:
+            raise CatalogImportError(f'Не задано поле {e}')
+
+        recipe_keys = self.get_natural_keys(Recipe)
+        new_records = {}
+        for record in records:
+            if record['name'] not in recipe_keys:
+                new_records.setdefault(record['name'], record)
+        if not new_records:
+            return
+        recipe_fields = [
+            field for field in Recipe._meta.concrete_fields
+            if not field.primary_key and not field.is_relation
+        ]
+        recipes = []
+        for record in new_records.values():
+            recipe = Recipe(
+                author_id=self.resolve(get_user_model(), record.get('author')),
+                recipe_category_id=self.resolve(RecipeCategory, record['recipe_category']),
+            )
+            for field in recipe_fields:
+                if field.name in record:
+                    setattr(recipe, field.attname, field.to_python(record[field.name]))
+            recipes.append(recipe)
+        self.flush(Recipe)
+        self.wait(Recipe)
+        self._insert(Recipe, recipes)
+        recipe_keys.update(Recipe._base_manager.filter(
+            name__in=list(new_records)).values_list('name', 'pk'))
+        self.counts[Recipe._meta.label] += len(recipes)
+
+        for recipe in recipes:
+            recipe_id = recipe_keys[recipe.name]
+            self.recipe_ids.add(recipe_id)
+            for row in new_records[recipe.name].get('recipe_ingredients', []):
+                self.add(RecipeIngredient, RecipeIngredient(
+                    author_id=recipe.author_id,
+                    recipe_id=recipe_id,
+                    measure_id=self.resolve(Measure, row['measure']),
+                    ingredient_id=self.resolve(Ingredient, row['ingredient']),
+                    amount=RecipeIngredient._meta.get_field('amount').to_python(row['amount']),
+                ))
+
+    def finish(self):
+        """
+        Дописывает оставшиеся порции и обновляет то, что при поштучном
+        сохранении обновляют сигналы и UserRecipeScore.save: голоса и
+        калорийность рецептов, последовательности id, индексы, кеш ответов
+        """
+        from .models import Ingredient, Measure, Recipe, RecipeCategory, RecipeIngredient
+
+        self.flush_recipes()
+        for model in list(self.pending):
+            self.flush(model)
+        for model in list(self.futures):
+            self.wait(model)
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        for field, obj, values in self.m2m:
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            existing = _get_existing(through, source, [obj.pk], source, target)
+            rows = {(obj.pk, self.resolve(field.related_model, value)) for value in values}
+            self._insert(through, [
+                through(**{source: source_id, target: target_id})
+                for source_id, target_id in sorted(rows - existing)
+            ])
+
+        # После INSERT с явными id последовательности (PostgreSQL) отстают
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), list(self.inserted_pks))
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+        for ids, update in (
+                (self.scored_recipe_ids, lambda batch: Recipe.objects.filter(
+                    pk__in=batch).recount_votes()),
+                (self.recipe_ids, recompute_recipes)):
+            ids = sorted(pk for pk in ids if pk is not None)
+            for i in range(0, len(ids), RECOMPUTE_BATCH_SIZE):
+                with transaction.atomic():
+                    update(ids[i:i + RECOMPUTE_BATCH_SIZE])
+
+        for model in (Measure, Ingredient, RecipeCategory, Recipe, RecipeIngredient):
+            bump_generation(model)
+        ingredient_index.invalidate()
+        leaderboards.invalidate()
+        ingredient_similarity.invalidate()
+        conversion_table.invalidate()
+        for index in search_indexes.values():
+            index.invalidate()
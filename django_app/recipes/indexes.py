@@ -0,0 +1,240 @@
+import bisect
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import chain
+
+from config.app_settings import get_app_settings
+
+from .pantry import canonical_pantry, pantry_cache
+
+
+DEFAULT_INGREDIENT_INDEX_SETTINGS = {
+    # Время жизни в секундах (None - без ограничения): изменения из других
+    # процессов становятся видны после перестроения
+    'TTL': 60,
+}
+
+
+def get_ingredient_index_settings():
+    return get_app_settings('RECIPES_INGREDIENT_INDEX', DEFAULT_INGREDIENT_INDEX_SETTINGS)
+
+
+class IngredientIndex:
+    """
+    Инвертированный индекс ингредиентов рецептов, живущий в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов
+    (по элементу на строку recipe_ingredient, память пропорциональна числу
+    строк, а не наибольшему id), для каждого рецепта - его строки
+    recipe_ingredient, число которых - число ингредиентов рецепта.
+    Запрос по набору ингредиентов считает совпадения только по массивам
+    этих ингредиентов: рецепт полностью покрыт набором, если число
+    совпадений равно числу его ингредиентов, а недостающих ингредиентов
+    у него столько, сколько не совпало.
+
+    Индекс строится лениво при первом обращении и поддерживается сигналами
+    Recipe и RecipeIngredient (см. recipes.signals). Изменения из других
+    процессов становятся видны после перестроения по истечении TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        # ingredient_id -> отсортированный array id рецептов
+        self._postings = {}
+        # recipe_id -> {recipe_ingredient_id: ingredient_id}
+        self._recipe_rows = {}
+        # recipe_ingredient_id -> recipe_id
+        self._rows = {}
+        # recipe_id -> recipe_category_id
+        self._recipe_categories = {}
+        # Увеличивается при каждом изменении индекса
+        self.version = 0
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        ttl = get_ingredient_index_settings()['TTL']
+        return ttl is None or time.monotonic() - self._built_at < ttl
+
+    def _ensure_built(self):
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._build()
+
+    def _reset(self):
+        self._built_at = None
+        self._postings = {}
+        self._recipe_rows = {}
+        self._rows = {}
+        self._recipe_categories = {}
+        self.version += 1
+
+    def _build(self):
+        from .models import Recipe, RecipeIngredient
+
+        self._reset()
+        self._recipe_categories = {
+            recipe_id: recipe_category_id
+            for recipe_id, recipe_category_id in Recipe.objects.order_by().values_list(
+                'pk', 'recipe_category_id').iterator()
+            if recipe_category_id is not None
+        }
+        postings = {}
+        rows = RecipeIngredient.objects.order_by().values_list(
+            'pk', 'recipe_id', 'ingredient_id')
+        for pk, recipe_id, ingredient_id in rows.iterator():
+            self._rows[pk] = recipe_id
+            self._recipe_rows.setdefault(recipe_id, {})[pk] = ingredient_id
+            postings.setdefault(ingredient_id, []).append(recipe_id)
+        self._postings = {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self._built_at = time.monotonic()
+
+    def _add(self, pk, recipe_id, ingredient_id):
+        self._rows[pk] = recipe_id
+        self._recipe_rows.setdefault(recipe_id, {})[pk] = ingredient_id
+        bisect.insort(self._postings.setdefault(ingredient_id, array('q')), recipe_id)
+
+    def _remove(self, pk):
+        recipe_id = self._rows.pop(pk, None)
+        if recipe_id is None:
+            return
+        recipe_rows = self._recipe_rows[recipe_id]
+        ingredient_id = recipe_rows.pop(pk)
+        if not recipe_rows:
+            del self._recipe_rows[recipe_id]
+        posting = self._postings[ingredient_id]
+        del posting[bisect.bisect_left(posting, recipe_id)]
+        if not posting:
+            del self._postings[ingredient_id]
+
+    def _set_category(self, recipe_id, recipe_category_id):
+        if recipe_category_id is None:
+            self._recipe_categories.pop(recipe_id, None)
+        else:
+            self._recipe_categories[recipe_id] = recipe_category_id
+
+    def _count_hits(self, pantry):
+        # recipe_id -> число строк рецепта с ингредиентами из набора
+        return Counter(chain.from_iterable(
+            self._postings.get(ingredient_id, ()) for ingredient_id in pantry))
+
+    def rebuild(self):
+        """
+        Перестраивает индекс по данным БД
+        """
+        with self._lock:
+            self._build()
+
+    def invalidate(self):
+        """
+        Сбрасывает индекс, он будет перестроен при следующем обращении
+        """
+        with self._lock:
+            self._reset()
+
+    def add_row(self, pk, recipe_id, ingredient_id):
+        """
+        Добавляет (или заменяет) строку recipe_ingredient
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(pk)
+            self._add(pk, recipe_id, ingredient_id)
+            self.version += 1
+
+    def remove_row(self, pk):
+        """
+        Удаляет строку recipe_ingredient
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._remove(pk)
+            self.version += 1
+
+    def set_recipe_category(self, recipe_id, recipe_category_id):
+        """
+        Задает (None - удаляет) категорию рецепта
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._set_category(recipe_id, recipe_category_id)
+            self.version += 1
+
+    def refresh_recipes(self, recipe_ids):
+        """
+        Перечитывает из БД строки recipe_ingredient заданных рецептов.
+        Используется после массовых операций, которые не отправляют сигналы.
+        """
+        from .models import RecipeIngredient
+
+        recipe_ids = set(recipe_ids)
+        with self._lock:
+            if self._built_at is None or not recipe_ids:
+                return
+            for recipe_id in recipe_ids:
+                for pk in list(self._recipe_rows.get(recipe_id, ())):
+                    self._remove(pk)
+            rows = RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).order_by().values_list('pk', 'recipe_id', 'ingredient_id')
+            for pk, recipe_id, ingredient_id in rows:
+                self._add(pk, recipe_id, ingredient_id)
+            self.version += 1
+
+    def get_available(self, ingredient_ids):
+        """
+        Возвращает id рецептов, для приготовления которых достаточно
+        заданных ингредиентов. Результат для того же набора ингредиентов
+        и той же версии индекса берется из pantry_cache.
+        """
+        pantry = canonical_pantry(ingredient_ids)
+        self._ensure_built()
+        with self._lock:
+            return pantry_cache.get_or_set(
+                ('available', pantry, self.version), lambda: self._get_available(pantry))
+
+    def _get_available(self, pantry):
+        recipe_rows = self._recipe_rows
+        return tuple(sorted(
+            recipe_id for recipe_id, hits in self._count_hits(pantry).items()
+            if hits == len(recipe_rows[recipe_id])
+        ))
+
+    def get_closest(self, ingredient_ids, limit, recipe_category_id=None):
+        """
+        Возвращает до limit пар (recipe_id, unlikeness) для рецептов, в которых
+        есть хотя бы один из заданных ингредиентов, по возрастанию unlikeness -
+        числа недостающих ингредиентов (как в RecipeQuerySet.with_unlikeness).
+        Вместо полной сортировки кандидатов используется ограниченная куча.
+        """
+        pantry = canonical_pantry(ingredient_ids)
+        self._ensure_built()
+        with self._lock:
+            return pantry_cache.get_or_set(
+                ('closest', pantry, limit, recipe_category_id, self.version),
+                lambda: self._get_closest(pantry, limit, recipe_category_id))
+
+    def _get_closest(self, pantry, limit, recipe_category_id):
+        hits = self._count_hits(pantry).items()
+        if recipe_category_id is not None:
+            categories = self._recipe_categories
+            hits = ((recipe_id, count) for recipe_id, count in hits
+                    if categories.get(recipe_id) == recipe_category_id)
+        recipe_rows = self._recipe_rows
+        scored = ((len(recipe_rows[recipe_id]) - count, recipe_id) for recipe_id, count in hits)
+        closest = heapq.nsmallest(limit, scored)
+        return tuple((recipe_id, unlikeness) for unlikeness, recipe_id in closest)
+
+
+ingredient_index = IngredientIndex()
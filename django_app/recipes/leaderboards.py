@@ -0,0 +1,249 @@
+import bisect
+import heapq
+import threading
+import time
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from config.app_settings import get_app_settings
+
+
+DEFAULT_LEADERBOARD_SETTINGS = {
+    # Наибольшее число рецептов в ответе
+    'SIZE': 100,
+    # Вес априорной оценки в голосах: рецепт с малым числом голосов
+    # ранжируется ближе к средней оценке
+    'PRIOR_VOTES': 10,
+    # Априорная оценка, None - средняя оценка всех голосов при построении
+    'PRIOR_SCORE': None,
+    # Время жизни в секундах (None - без ограничения): изменения из других
+    # процессов становятся видны после перестроения
+    'TTL': 60,
+}
+
+# Оценка рецепта без голосов, если голосов нет совсем (середина шкалы 0-10)
+DEFAULT_PRIOR_SCORE = 5
+
+LEADERBOARD_KINDS = ('top_rated', 'popular')
+
+
+def get_leaderboard_settings():
+    return get_app_settings('RECIPES_LEADERBOARD', DEFAULT_LEADERBOARD_SETTINGS)
+
+
+class Leaderboards:
+    """
+    Рейтинги рецептов по категориям (и по всем рецептам, категория None),
+    живущие в памяти процесса:
+    top_rated - по байесовской оценке (full_score + m * C) / (voter_turnout + m),
+    где m - PRIOR_VOTES, C - PRIOR_SCORE, затем по числу голосов;
+    popular - по числу голосов, затем по байесовской оценке.
+
+    Для каждой категории хранится отсортированный список ключей не более
+    чем SIZE лучших рецептов, поэтому изменение голосов рецепта перемещает
+    один элемент короткого списка, а ответ - срез его начала. Рецепты вне
+    списка не лучше последнего в нем: рецепт, опустившийся ниже последнего,
+    выбывает из списка, и укоротившийся список заполняется заново по голосам
+    всех рецептов категории при следующем чтении.
+
+    Строятся лениво при первом обращении и поддерживаются сигналами
+    Recipe и recipe_votes_changed (см. recipes.signals). Априорная оценка
+    фиксируется при построении, чтобы голос не менял оценки всех рецептов.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._prior_votes = 0
+        self._prior_score = 0
+        # recipe_id -> [recipe_category_id, name, voter_turnout, full_score]
+        self._recipes = {}
+        # (kind, recipe_category_id) -> отсортированный список (ключ, recipe_id)
+        # не более чем _size лучших рецептов
+        self._boards = {}
+        # Рейтинги, в которые вошли не все рецепты категории
+        self._truncated = set()
+        self._size = 0
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        ttl = get_leaderboard_settings()['TTL']
+        return ttl is None or time.monotonic() - self._built_at < ttl
+
+    def _ensure_built(self):
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._build()
+
+    def _reset(self):
+        self._built_at = None
+        self._recipes = {}
+        self._boards = {}
+        self._truncated = set()
+
+    def _build(self):
+        from .models import Recipe
+
+        self._reset()
+        leaderboard_settings = get_leaderboard_settings()
+        self._size = leaderboard_settings['SIZE']
+        self._prior_votes = leaderboard_settings['PRIOR_VOTES']
+        self._prior_score = leaderboard_settings['PRIOR_SCORE']
+        if self._prior_score is None:
+            totals = Recipe.objects.aggregate(
+                voter_turnout=Sum('voter_turnout'), full_score=Sum('full_score'))
+            if totals['voter_turnout']:
+                self._prior_score = totals['full_score'] / totals['voter_turnout']
+            else:
+                self._prior_score = DEFAULT_PRIOR_SCORE
+        recipes = Recipe.objects.order_by().values_list(
+            'pk', 'recipe_category_id', 'name', 'voter_turnout', 'full_score')
+        for pk, recipe_category_id, name, voter_turnout, full_score in recipes.iterator():
+            self._recipes[pk] = [recipe_category_id, name, voter_turnout or 0, full_score or 0]
+        boards = {}
+        for pk in self._recipes:
+            for board_key, key in self._get_keys(pk):
+                boards.setdefault(board_key, []).append((key, pk))
+        for board_key, board in boards.items():
+            self._set_board(board_key, board)
+        self._built_at = time.monotonic()
+
+    def _set_board(self, board_key, entries):
+        board = heapq.nsmallest(self._size + 1, entries)
+        if len(board) > self._size:
+            board.pop()
+            self._truncated.add(board_key)
+        else:
+            self._truncated.discard(board_key)
+        self._boards[board_key] = board
+
+    def _fill(self, board_key):
+        # Заполняет рейтинг заново по голосам всех рецептов категории
+        kind, recipe_category_id = board_key
+        self._set_board(board_key, (
+            (self._get_kind_keys(pk)[kind], pk)
+            for pk, recipe in self._recipes.items()
+            if recipe_category_id is None or recipe[0] == recipe_category_id
+        ))
+
+    def _get_score(self, voter_turnout, full_score):
+        return ((full_score + self._prior_votes * self._prior_score)
+                / (voter_turnout + self._prior_votes or 1))
+
+    def _get_kind_keys(self, pk):
+        _, name, voter_turnout, full_score = self._recipes[pk]
+        score = self._get_score(voter_turnout, full_score)
+        return {
+            'top_rated': (-score, -voter_turnout, name),
+            'popular': (-voter_turnout, -score, name),
+        }
+
+    def _get_keys(self, pk):
+        recipe_category_id = self._recipes[pk][0]
+        keys = self._get_kind_keys(pk)
+        return [
+            ((kind, category_id), keys[kind])
+            for kind in LEADERBOARD_KINDS
+            for category_id in (None, recipe_category_id)
+        ]
+
+    def _add(self, pk):
+        for board_key, key in self._get_keys(pk):
+            board = self._boards.setdefault(board_key, [])
+            # Рецепт не лучше последнего в усеченном рейтинге остается вне его
+            if board_key in self._truncated and (not board or (key, pk) > board[-1]):
+                continue
+            bisect.insort(board, (key, pk))
+            if len(board) > self._size:
+                board.pop()
+                self._truncated.add(board_key)
+
+    def _remove(self, pk):
+        for board_key, key in self._get_keys(pk):
+            board = self._boards.get(board_key, [])
+            i = bisect.bisect_left(board, (key, pk))
+            if i < len(board) and board[i] == (key, pk):
+                del board[i]
+
+    def invalidate(self):
+        """
+        Сбрасывает рейтинги, они будут перестроены при следующем обращении
+        """
+        with self._lock:
+            self._reset()
+
+    def set_recipe(self, pk, recipe_category_id, name):
+        """
+        Добавляет рецепт или обновляет его категорию и название
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            recipe = self._recipes.get(pk)
+            if recipe is not None:
+                if recipe[:2] == [recipe_category_id, name]:
+                    return
+                self._remove(pk)
+                recipe[:2] = [recipe_category_id, name]
+            else:
+                self._recipes[pk] = [recipe_category_id, name, 0, 0]
+            self._add(pk)
+
+    def remove_recipe(self, pk):
+        """
+        Удаляет рецепт
+        """
+        with self._lock:
+            if self._built_at is None or pk not in self._recipes:
+                return
+            self._remove(pk)
+            del self._recipes[pk]
+
+    def apply_votes(self, pk, voter_turnout_delta, full_score_delta):
+        """
+        Изменяет число голосов и сумму оценок рецепта (как
+        RecipeQuerySet.apply_votes) и его места в рейтингах
+        """
+        with self._lock:
+            if self._built_at is None or pk not in self._recipes:
+                return
+            self._remove(pk)
+            recipe = self._recipes[pk]
+            recipe[2] += voter_turnout_delta
+            recipe[3] += full_score_delta
+            self._add(pk)
+
+    def get(self, kind, recipe_category_id=None, limit=None):
+        """
+        Возвращает до limit (не больше SIZE) рецептов рейтинга kind в
+        категории (None - среди всех рецептов): список словарей
+        {id, name, voter_turnout, rating, score}
+        """
+        size = get_leaderboard_settings()['SIZE']
+        limit = size if limit is None else min(limit, size)
+        self._ensure_built()
+        with self._lock:
+            limit = min(limit, self._size)
+            board_key = (kind, recipe_category_id)
+            board = self._boards.get(board_key, [])
+            if board_key in self._truncated and len(board) < limit:
+                self._fill(board_key)
+                board = self._boards[board_key]
+            result = []
+            for key, pk in board[:limit]:
+                _, name, voter_turnout, full_score = self._recipes[pk]
+                result.append({
+                    'id': pk,
+                    'name': name,
+                    'voter_turnout': voter_turnout,
+                    'rating': str((Decimal(full_score) / voter_turnout).quantize(
+                        Decimal('0.01'))) if voter_turnout else None,
+                    'score': round(self._get_score(voter_turnout, full_score), 3),
+                })
+        return result
+
+
+leaderboards = Leaderboards()
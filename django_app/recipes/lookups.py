@@ -0,0 +1,18 @@
+def register_field_lookup(field, lookup):
+    """
+    Регистрирует lookup только для поля модели field. Field.register_lookup
+    в Django 3.2 - метод класса: lookup появился бы у всех полей этого
+    класса во всех приложениях.
+    """
+    lookups = field.__dict__.get('field_lookups')
+    if lookups is None:
+        lookups = field.field_lookups = {}
+        get_class_lookup = field._get_lookup
+
+        def get_lookup(lookup_name):
+            return lookups.get(lookup_name) or get_class_lookup(lookup_name)
+
+        # Field.get_lookup и get_transform ищут lookup через self._get_lookup
+        field._get_lookup = get_lookup
+    lookups[lookup.lookup_name] = lookup
+    return lookup
@@ -0,0 +1,64 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.benchmarks import ApiBenchmark, compare_reports
+from recipes.models import Recipe, RecipeIngredient, UserRecipeScore
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочные сценарии API: пропускная способность, p50/p99 времени '
+            'ответа и число SQL запросов в JSON для сравнения между запусками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=ApiBenchmark.scenarios,
+                            default=list(ApiBenchmark.scenarios))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число запросов в сценарии')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--pantry-size', type=int, default=20,
+                            help='Число доступных ингредиентов в запросах')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего запуска для сравнения')
+
+    def handle(self, *args, scenarios, requests, warmup, seed, pantry_size, page_size,
+               output, compare, **options):
+        benchmark = ApiBenchmark(seed=seed, pantry_size=pantry_size, page_size=page_size,
+                                 warmup=warmup)
+        report = {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'rows': {
+                model._meta.label: model.objects.count()
+                for model in (Recipe, RecipeIngredient, UserRecipeScore)
+            },
+            'parameters': {
+                'requests': requests, 'warmup': warmup, 'seed': seed,
+                'pantry_size': pantry_size, 'page_size': page_size,
+            },
+            'scenarios': {},
+        }
+        self.stdout.write(f'{"scenario":<26} {"rps":>8} {"p50, ms":>9} {"p99, ms":>9} '
+                          f'{"queries":>8} {"errors":>7}')
+        for scenario in scenarios:
+            result = report['scenarios'][scenario] = benchmark.run(scenario, requests)
+            self.stdout.write(
+                f'{scenario:<26} {result["throughput_rps"]:>8.1f} '
+                f'{result["latency_ms"]["p50"]:>9.2f} {result["latency_ms"]["p99"]:>9.2f} '
+                f'{result["queries"]["mean"]:>8.1f} {result["errors"]:>7}')
+
+        if compare:
+            with open(compare) as f:
+                comparison = report['comparison'] = compare_reports(json.load(f), report)
+            self.stdout.write('\nИзменение относительно предыдущего запуска (+ - хуже):')
+            for scenario, changes in comparison.items():
+                self.stdout.write(f'{scenario:<26} ' + ' '.join(
+                    f'{key} {value:+.1f}' + ('%' if key != 'queries' else '')
+                    for key, value in changes.items()))
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
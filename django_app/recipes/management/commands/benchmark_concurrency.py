@@ -0,0 +1,70 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.benchmarks import ConcurrencyBenchmark
+
+
+class Command(BaseCommand):
+    help = ('Сравнение запущенных серверов (WSGI config.wsgi и ASGI config.asgi) '
+            'при разном числе одновременных клиентов: пропускная способность и p50/p99 '
+            'времени ответа в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', dest='targets', metavar='NAME=URL',
+            help='Сервер и префикс API, по умолчанию '
+                 'wsgi=http://localhost:8000/api/v1/ и asgi=http://localhost:8001/api/v1/async/')
+        parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32, 64],
+                            help='Числа одновременных клиентов')
+        parser.add_argument('--scenarios', nargs='+', choices=ConcurrencyBenchmark.scenarios,
+                            default=list(ConcurrencyBenchmark.scenarios))
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число запросов в сценарии')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--pantry-size', type=int, default=20,
+                            help='Число доступных ингредиентов в запросах')
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, targets, concurrency, scenarios, requests, seed, pantry_size,
+               page_size, output, **options):
+        targets = targets or [
+            'wsgi=http://localhost:8000/api/v1/', 'asgi=http://localhost:8001/api/v1/async/']
+        try:
+            targets = dict(target.split('=', 1) for target in targets)
+        except ValueError:
+            raise CommandError('Ожидается --target NAME=URL')
+        benchmark = ConcurrencyBenchmark(seed=seed, pantry_size=pantry_size,
+                                         page_size=page_size)
+        report = {
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'targets': targets,
+            'parameters': {
+                'requests': requests, 'seed': seed, 'pantry_size': pantry_size,
+                'page_size': page_size, 'concurrency': concurrency,
+            },
+            'scenarios': {},
+        }
+        self.stdout.write(f'{"scenario":<26} {"target":<8} {"clients":>7} {"rps":>8} '
+                          f'{"p50, ms":>9} {"p99, ms":>9} {"errors":>7}')
+        for scenario in scenarios:
+            # Одинаковые запросы для всех серверов и чисел клиентов
+            paths = benchmark.get_paths(scenario, requests)
+            results = report['scenarios'][scenario] = {}
+            for name, url in targets.items():
+                # Прогрев: индексы и соединения с БД
+                benchmark.run(url, paths[:max(concurrency)], max(concurrency))
+                for clients in concurrency:
+                    result = results.setdefault(name, {})[clients] = benchmark.run(
+                        url, paths, clients)
+                    self.stdout.write(
+                        f'{scenario:<26} {name:<8} {clients:>7} '
+                        f'{result["throughput_rps"]:>8.1f} {result["latency_ms"]["p50"]:>9.2f} '
+                        f'{result["latency_ms"]["p99"]:>9.2f} {result["errors"]:>7}')
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
@@ -0,0 +1,98 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import Recipe, UserRecipeScore
+from recipes.pagination import CursorOrPageNumberPagination
+
+
+ENDPOINTS = {
+    'recipe': ('/api/v1/recipe/', Recipe),
+    'user_recipe_rating': ('/api/v1/user_recipe_rating/', UserRecipeScore),
+}
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время получения страниц списка на разной глубине '
+            'для постраничной и keyset-пагинации')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, default='recipe')
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[1, 10, 100, 1000, 10000])
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, endpoint, pages, page_size, repeat, output, **options):
+        url, model = ENDPOINTS[endpoint]
+        ordered = model.objects.order_by(*CursorOrPageNumberPagination.ordering)
+        total = ordered.count()
+        client = Client()
+
+        results = []
+        with override_settings(ALLOWED_HOSTS=['*'], DEBUG=False):
+            for page in pages:
+                offset = (page - 1) * page_size
+                if offset >= total:
+                    self.stderr.write(
+                        f'Страница {page} пропущена: в {endpoint} всего {total} записей')
+                    continue
+                page_number_url = f'{url}?page={page}&page_size={page_size}'
+                if offset:
+                    cursor_url = replace_query_param(
+                        self._get_next_link(url, model, ordered, offset), 'page_size', page_size)
+                else:
+                    cursor_url = f'{url}?page_size={page_size}'
+                results.append({
+                    'page': page,
+                    'page_number_ms': self._measure(client, page_number_url, repeat),
+                    'cursor_ms': self._measure(client, cursor_url, repeat),
+                })
+
+        report = {
+            'endpoint': endpoint,
+            'rows': total,
+            'page_size': page_size,
+            'repeat': repeat,
+            'results': results,
+        }
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=2)
+        self.stdout.write(f'{"page":>8} {"page number, ms":>18} {"cursor, ms":>12}')
+        for result in results:
+            self.stdout.write(
+                f'{result["page"]:>8} {result["page_number_ms"]["median"]:>18.2f} '
+                f'{result["cursor_ms"]["median"]:>12.2f}')
+
+    def _get_next_link(self, url, model, ordered, offset):
+        # Ссылка на следующую страницу, которую вернул бы ответ со страницей,
+        # оканчивающейся записью offset - 1: пагинатору передаются эта запись
+        # и следующая за ней, а страница - из одной записи
+        pks = ordered[offset - 1:offset + 1].values('pk')
+        request = Request(APIRequestFactory().get(url, {'page_size': 1}))
+        paginator = CursorOrPageNumberPagination()
+        paginator.paginate_queryset(model.objects.filter(pk__in=pks), request)
+        return paginator.get_next_link()
+
+    def _measure(self, client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: HTTP {response.status_code}')
+        return {
+            'median': statistics.median(timings),
+            'min': min(timings),
+            'max': max(timings),
+        }
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import build_neighbors
+
+
+class Command(BaseCommand):
+    help = ('Строит списки похожих рецептов по оценкам пользователей '
+            '(по умолчанию только для рецептов с изменившимися оценками)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать списки всех рецептов')
+
+    def handle(self, *args, full, **options):
+        start = time.perf_counter()
+        updated = build_neighbors(full=full)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено {updated} списков похожих рецептов '
+            f'за {time.perf_counter() - start:.1f} с'))
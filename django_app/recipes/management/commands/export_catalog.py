@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from recipes.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает все рецепты с ингредиентами в формате NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS,
+                            default='ndjson')
+        parser.add_argument('--output', help='Файл для выгрузки (по умолчанию stdout)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Число строк, получаемых с сервера БД за раз')
+
+    def handle(self, *args, export_format, output, chunk_size, **options):
+        lines = iter_export(export_format, chunk_size)
+        if output:
+            with open(output, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.benchmarks import SYNTHETIC_PREFIX, iter_synthetic_catalog
+from recipes.importer import IMPORT_BATCH_SIZE, CatalogLoader
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетический каталог для нагрузочного тестирования '
+            'из словаря ингредиентов initial_fixtures.json')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10,
+            help='Среднее число ингредиентов рецепта')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--votes', type=int, default=0, help='Число оценок рецептов')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default=SYNTHETIC_PREFIX,
+                            help='Префикс названий рецептов и имен пользователей')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1)
+
+    def handle(self, *args, recipes, ingredients_per_recipe, users, votes, seed, prefix,
+               batch_size, workers, **options):
+        if workers > 1 and connection.vendor == 'sqlite':
+            workers = 1
+        loader = CatalogLoader(batch_size=batch_size, workers=workers)
+        try:
+            loader.load(iter_synthetic_catalog(
+                recipes, ingredients_per_recipe, max(users, 1), votes, seed, prefix))
+        except ValueError as e:
+            raise CommandError(e)
+        for label, count in sorted(loader.counts.items()):
+            self.stdout.write(f'{label}: {count}')
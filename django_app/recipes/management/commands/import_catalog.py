@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.importer import (
+    IMPORT_BATCH_SIZE, CatalogImportError, CatalogLoader, get_checksum, is_loaded,
+    iter_records, mark_loaded
+)
+
+
+class Command(BaseCommand):
+    help = ('Загружает каталог из фикстуры Django (JSON массив или NDJSON) или '
+            'выгрузки export_catalog (NDJSON) массовыми INSERT. '
+            'Уже загруженные объекты пропускаются, уже загруженный файл '
+            'не перечитывается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для загрузки ("-" - stdin)')
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Число объектов в одном INSERT')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число потоков для параллельной записи независимых порций')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Загрузить файл, даже если он уже был загружен')
+
+    def handle(self, *args, path, batch_size, workers, force, **options):
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write('SQLite не поддерживает параллельную запись, используется 1 поток')
+            workers = 1
+        checksum = None
+        if path != '-':
+            try:
+                with open(path, 'rb') as f:
+                    checksum = get_checksum(f)
+            except OSError as e:
+                raise CommandError(e)
+            if not force and is_loaded(checksum):
+                self.stdout.write(self.style.SUCCESS('Файл уже загружен, загрузка пропущена'))
+                return
+        loader = CatalogLoader(batch_size=batch_size, workers=workers)
+        try:
+            if path == '-':
+                loader.load(iter_records(sys.stdin))
+            else:
+                with open(path, encoding='utf-8') as f:
+                    loader.load(iter_records(f))
+        except CatalogImportError as e:
+            raise CommandError(e)
+        if checksum is not None:
+            mark_loaded(checksum, loader.counts)
+        for label, count in sorted(loader.counts.items()):
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {sum(loader.counts.values())} объектов'))
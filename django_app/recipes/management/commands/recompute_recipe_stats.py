@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.nutrition import RECOMPUTE_BATCH_SIZE, recompute_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает калорийность и крепость рецептов по ингредиентам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=RECOMPUTE_BATCH_SIZE,
+            help='Число рецептов, пересчитываемых в одной транзакции')
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help='Пересчитывать рецепты начиная с этого id '
+                 '(для продолжения прерванного пересчета)')
+
+    def handle(self, *args, chunk_size, start_id, **options):
+        last_id = start_id - 1
+        total = 0
+        while True:
+            recipe_ids = list(
+                Recipe.objects.filter(pk__gt=last_id).order_by('pk')
+                .values_list('pk', flat=True)[:chunk_size]
+            )
+            if not recipe_ids:
+                break
+            with transaction.atomic():
+                recompute_recipes(recipe_ids)
+            last_id = recipe_ids[-1]
+            total += len(recipe_ids)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Пересчитано {total} рецептов (id <= {last_id})')
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано {total} рецептов'))
@@ -1,4 +1,10 @@
-from django.db.models import Count, Q, QuerySet
+from django.db.models import (
+    Count, F, FilteredRelation, FloatField, OuterRef, Q, QuerySet, Subquery, Sum
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .indexes import ingredient_index
+from .pantry import canonical_pantry
 
 
 class RecipeQuerySet(QuerySet):
@@ -6,24 +12,124 @@ class RecipeQuerySet(QuerySet):
     QuerySet для модели рецептов
     """
 
-    def with_unlikeness(self, ingredients):
+    def apply_votes(self, voter_turnout_delta, full_score_delta):
+        """
+        Изменяет число проголосовавших и сумму оценок рецептов и пересчитывает
+        рейтинг одним UPDATE на стороне БД, без чтения значений в Python,
+        поэтому конкурентные голосования не теряют обновлений
+        """
+        voter_turnout = Coalesce(F('voter_turnout'), 0) + voter_turnout_delta
+        full_score = Coalesce(F('full_score'), 0) + full_score_delta
+        return self.update(
+            voter_turnout=voter_turnout,
+            full_score=full_score,
+            rating=Cast(full_score, FloatField()) / NullIf(voter_turnout, 0),
+        )
+
+    def recount_votes(self):
+        """
+        Пересчитывает число проголосовавших, сумму оценок и рейтинг рецептов
+        по оценкам пользователей (после загрузки оценок в обход
+        UserRecipeScore.save)
         """
-        Возвращает рецепты в которых присутствует хотя бы 1 ингредиент из ingredients.
+        score_model = self.model._meta.get_field('user_recipe_ratings').related_model
+        scores = score_model.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe')
+        self.update(
+            voter_turnout=Subquery(scores.annotate(value=Count('pk')).values('value')),
+            full_score=Subquery(scores.annotate(value=Sum('score')).values('value')),
+        )
+        return self.update(
+            rating=Cast(F('full_score'), FloatField()) / NullIf(F('voter_turnout'), 0))
+
+    def with_ingredients(self):
+        """
+        Подгружает ингредиенты рецептов одним дополнительным запросом
+        """
+        return self.prefetch_related('recipe_ingredients')
+
+    def with_unlikeness(self, ingredient_ids):
+        """
+        Возвращает рецепты в которых присутствует хотя бы 1 ингредиент из ingredient_ids.
         Каждому рецепту проставляется unlikeness (>= 0) - число недостающих
         ингредиентов для рецепта.
         """
-        return self.annotate(
+        pantry = list(canonical_pantry(ingredient_ids))
+        # Рецепты-кандидаты отбираются подзапросом по индексу
+        # (ingredient_id, recipe_id): фильтр по связанной таблице после
+        # annotate добавил бы второе соединение и умножил бы unlikeness на
+        # число совпадений
+        recipe_ingredient_model = self.model._meta.get_field(
+            'recipe_ingredients').related_model
+        candidates = recipe_ingredient_model.objects.filter(
+            ingredient_id__any=pantry).values('recipe_id')
+        return self.filter(pk__in=candidates).annotate(
             unlikeness=Count(
                 'recipe_ingredients__pk',
-                filter=~Q(recipe_ingredients__ingredient__in=ingredients)
+                filter=~Q(recipe_ingredients__ingredient_id__any=pantry)
             )
-        ).filter(
-            recipe_ingredients__ingredient__in=ingredients
         ).order_by('unlikeness')
 
-    def get_available_by_ingredients(self, ingredients):
+    def get_missed_ingredients(self, ingredient_ids):
+        """
+        Возвращает словарь recipe_id -> список недостающих для рецепта
+        ингредиентов (RecipeIngredient без связанных объектов) для всех
+        рецептов QuerySet одним запросом: LEFT JOIN с ингредиентами рецепта,
+        которых нет среди ingredient_ids
+        """
+        recipe_ingredient_model = self.model._meta.get_field(
+            'recipe_ingredients').related_model
+        rows = self.annotate(missed=FilteredRelation(
+            'recipe_ingredients',
+            condition=~Q(recipe_ingredients__ingredient_id__any=list(
+                canonical_pantry(ingredient_ids))),
+        )).order_by('pk', 'missed__ingredient_id', 'missed__pk').values_list(
+            'pk', 'missed__pk', 'missed__measure_id', 'missed__ingredient_id', 'missed__amount')
+        result = {}
+        for recipe_id, pk, measure_id, ingredient_id, amount in rows:
+            missed = result.setdefault(recipe_id, [])
+            if pk is not None:
+                missed.append(recipe_ingredient_model(
+                    pk=pk, recipe_id=recipe_id, measure_id=measure_id,
+                    ingredient_id=ingredient_id, amount=amount))
+        return result
+
+    def get_by_cook_time(self, cook_time):
+        """
+        Возвращает рецепты, приготовление которых занимает не более cook_time
+        """
+        return self.filter(cook_time__lte=cook_time)
+
+    def get_available_by_ingredients(self, ingredient_ids):
         """
         Возвращает все рецепты для приготовления которых достаточно
         заданных ингредиентов
         """
-        return self.with_unlikeness(ingredients).filter(unlikeness=0)
+        return self.with_unlikeness(ingredient_ids).filter(unlikeness=0)
+
+    def get_available_by_ingredient_ids(self, ingredient_ids, limit, offset=0):
+        """
+        То же, что get_available_by_ingredients, но рецепты подбираются
+        по инвертированному индексу ингредиентов без агрегации в БД.
+        Возвращает не более limit рецептов начиная с offset по возрастанию id,
+        поэтому в запрос попадает не больше limit id
+        """
+        recipe_ids = ingredient_index.get_available(ingredient_ids)[offset:offset + limit]
+        return self.filter(pk__any=list(recipe_ids)).order_by('pk')
+
+    def get_closest_by_ingredient_ids(self, ingredient_ids, limit,
+                                      recipe_category_id=None):
+        """
+        Возвращает список из не более чем limit рецептов, ближайших к заданным
+        ингредиентам. Каждому рецепту проставляется unlikeness - число
+        недостающих ингредиентов.
+        """
+        closest = ingredient_index.get_closest(
+            ingredient_ids, limit, recipe_category_id)
+        recipes = self.in_bulk([recipe_id for recipe_id, _ in closest])
+        result = []
+        for recipe_id, unlikeness in closest:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.unlikeness = unlikeness
+                result.append(recipe)
+        return result
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='voter_turnout',
+            field=models.PositiveIntegerField(blank=True, default=None, null=True, verbose_name='voter turnout'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:04
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_voter_turnout_integer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measure',
+            name='dimension',
+            field=models.CharField(blank=True, choices=[('mass', 'mass'), ('volume', 'volume'), ('count', 'count')], default=None, max_length=10, null=True, verbose_name='dimension'),
+        ),
+        migrations.AddField(
+            model_name='measure',
+            name='factor',
+            field=models.DecimalField(decimal_places=6, default=Decimal('1'), help_text='number of base units (g, ml, pcs) in one measure', max_digits=12, validators=[django.core.validators.MinValueValidator(Decimal('0.000001'))], verbose_name='conversion factor'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_measure_conversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['created_at', 'id'], name='recipe_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecipescore',
+            index=models.Index(fields=['created_at', 'id'], name='rating_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+SEARCH_TABLES = ('ingredient', 'recipe', 'recipe_category')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Расширение pg_trgm и GIN индексы по названиям для поиска
+    (recipes.search); на остальных БД поиск использует индекс в памяти
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in SEARCH_TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_name_trgm_idx '
+            f'ON {table} USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
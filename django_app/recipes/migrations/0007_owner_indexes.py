@@ -0,0 +1,34 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0006_search_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='author'),
+        ),
+        migrations.AlterField(
+            model_name='userrecipescore',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='user_recipe_ratings', to=settings.AUTH_USER_MODEL, verbose_name='users'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='recipe_author_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrecipescore',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='rating_user_created_id_idx'),
+        ),
+    ]
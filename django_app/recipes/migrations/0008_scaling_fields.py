@@ -0,0 +1,24 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:47
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_owner_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='measure',
+            name='decimal_places',
+            field=models.PositiveSmallIntegerField(default=2, help_text='rounding of scaled amounts', validators=[django.core.validators.MaxValueValidator(6)], verbose_name='decimal places'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='servings',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='servings'),
+        ),
+    ]
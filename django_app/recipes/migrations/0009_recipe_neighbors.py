@@ -0,0 +1,29 @@
+# Generated by Django 3.2.4 on 2026-10-18 03:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_scaling_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeNeighbors',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_neighbors', serialize=False, to='recipes.recipe', verbose_name='recipe')),
+                ('neighbors', models.JSONField(default=list, verbose_name='neighbors')),
+                ('voter_turnout', models.PositiveIntegerField(default=0, verbose_name='voter turnout')),
+                ('full_score', models.PositiveIntegerField(default=0, verbose_name='full score')),
+                ('built_at', models.DateTimeField(verbose_name='built at')),
+            ],
+            options={
+                'verbose_name': 'recipe neighbors',
+                'verbose_name_plural': 'recipe neighbors',
+                'db_table': 'recipe_neighbors',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.4 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_neighbors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checksum', models.CharField(max_length=64, unique=True, verbose_name='checksum')),
+                ('row_counts', models.JSONField(default=dict, verbose_name='row counts')),
+                ('loaded_at', models.DateTimeField(auto_now=True, verbose_name='loaded at')),
+            ],
+            options={
+                'verbose_name': 'catalog import',
+                'verbose_name_plural': 'catalog imports',
+                'db_table': 'catalog_import',
+            },
+        ),
+    ]
@@ -1,20 +1,74 @@
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import ugettext_lazy as _
 
 from .managers import RecipeQuerySet
+from .votes import apply_votes
 
 
 User = get_user_model()
 
 
-class Measure(models.Model):
+class LoadedValuesMixin:
+    """
+    Запоминает значения полей loaded_values_fields (attname), загруженные
+    из БД, чтобы сигналы могли узнать, что изменилось при сохранении
+    """
+    loaded_values_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.loaded_values_fields
+        }
+        return instance
+
+    def get_loaded_value(self, name, default=None):
+        return getattr(self, '_loaded_values', {}).get(name, default)
+
+
+class Measure(LoadedValuesMixin, models.Model):
     """
     Модель единицы измерения (граммы, литры и т.д.)
     """
+    loaded_values_fields = ('dimension', 'factor')
+
+    class Dimension(models.TextChoices):
+        # Базовые единицы: грамм, миллилитр, штука
+        MASS = 'mass', _('mass')
+        VOLUME = 'volume', _('volume')
+        COUNT = 'count', _('count')
+
     name = models.CharField(_('name'), max_length=100, unique=True)
+    dimension = models.CharField(
+        _('dimension'),
+        max_length=10,
+        choices=Dimension.choices,
+        null=True,
+        blank=True,
+        default=None,
+    )
+    # Количество базовых единиц величины в одной единице измерения
+    factor = models.DecimalField(
+        _('conversion factor'),
+        help_text=_('number of base units (g, ml, pcs) in one measure'),
+        max_digits=12,
+        decimal_places=6,
+        default=Decimal('1'),
+        validators=[MinValueValidator(Decimal('0.000001'))]
+    )
+
+    # Точность количеств, пересчитанных на другое число порций
+    decimal_places = models.PositiveSmallIntegerField(
+        _('decimal places'),
+        help_text=_('rounding of scaled amounts'),
+        default=2,
+        validators=[MaxValueValidator(6)]
+    )
 
     def __str__(self):
         return self.name
@@ -26,10 +80,12 @@ class Measure(models.Model):
         verbose_name_plural = _('measures')
 
 
-class Ingredient(models.Model):
+class Ingredient(LoadedValuesMixin, models.Model):
     """
     Модель ингредиента (лимон, соль и т.д.)
     """
+    loaded_values_fields = ('food_energy', 'alcohol_by_volume')
+
     name = models.CharField(_('name'), max_length=100, unique=True)
     food_energy = models.DecimalField(
         _('food energy'),
@@ -89,7 +145,8 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name=_('author'),
-        related_name='recipes'
+        related_name='recipes',
+        db_index=False
     )
     recipe_category = models.ForeignKey(
         RecipeCategory,
@@ -105,10 +162,16 @@ class Recipe(models.Model):
         blank=True,
         default=None,
     )
+    # Число порций, на которое рассчитаны количества ингредиентов
+    servings = models.PositiveSmallIntegerField(
+        _('servings'),
+        default=1,
+        validators=[MinValueValidator(1)]
+    )
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
-    voter_turnout = models.PositiveSmallIntegerField(
+    voter_turnout = models.PositiveIntegerField(
         _('voter turnout'),
         null=True,
         blank=True,
@@ -159,22 +222,49 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.voter_turnout and self.full_score:
-            self.rating = self.full_score / self.voter_turnout
+    # Поля голосования изменяются только через recipes.votes.apply_votes
+    VOTE_FIELDS = ('voter_turnout', 'full_score', 'rating')
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if self.voter_turnout and self.full_score is not None:
+            self.rating = (
+                Decimal(self.full_score) / self.voter_turnout
+            ).quantize(Decimal('0.01'))
+        if not self._state.adding and not force_insert and update_fields is None:
+            # Не перезаписываем голоса значениями, прочитанными до
+            # конкурентных голосований
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VOTE_FIELDS
+            ]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
 
     class Meta:
         ordering = ['rating', 'name']
         db_table = 'recipe'
+        indexes = [
+            # Keyset-пагинация (recipes.pagination)
+            models.Index(fields=['created_at', 'id'], name='recipe_created_id_idx'),
+            # Рецепты автора (mine) с keyset-пагинацией
+            models.Index(fields=['author', 'created_at', 'id'],
+                         name='recipe_author_created_id_idx'),
+            # Сортировка по умолчанию (Meta.ordering)
+            models.Index(fields=['rating', 'name'], name='recipe_rating_name_idx'),
+            # RecipeQuerySet.get_by_cook_time
+            models.Index(fields=['cook_time'], name='recipe_cook_time_idx'),
+        ]
         verbose_name = _('recipe')
         verbose_name_plural = _('recipes')
 
 
-class RecipeIngredient(models.Model):
+class RecipeIngredient(LoadedValuesMixin, models.Model):
     """
     Модель ингредиента рецепта с количеством и мерой
     """
+    loaded_values_fields = ('recipe_id',)
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -185,7 +275,8 @@ class RecipeIngredient(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         verbose_name=_('recipe'),
-        related_name='recipe_ingredients'
+        related_name='recipe_ingredients',
+        db_index=False
     )
     measure = models.ForeignKey(
         Measure,
@@ -197,7 +288,8 @@ class RecipeIngredient(models.Model):
         Ingredient,
         on_delete=models.CASCADE,
         verbose_name=_('ingredient'),
-        related_name='recipe_ingredients'
+        related_name='recipe_ingredients',
+        db_index=False
     )
 
     amount = models.DecimalField(
@@ -213,6 +305,13 @@ class RecipeIngredient(models.Model):
     class Meta:
         ordering = ['ingredient']
         db_table = 'recipe_ingredient'
+        # Составные индексы заменяют индексы внешних ключей recipe и ingredient
+        indexes = [
+            # Ингредиенты рецепта (prefetch, соединение в with_unlikeness)
+            models.Index(fields=['recipe', 'ingredient'], name='recipe_ingr_recipe_idx'),
+            # Рецепты с ингредиентом (кандидаты в with_unlikeness)
+            models.Index(fields=['ingredient', 'recipe'], name='recipe_ingr_ingredient_idx'),
+        ]
         verbose_name = _('recipe ingredient')
         verbose_name_plural = _('recipe ingredients')
 
@@ -225,7 +324,8 @@ class UserRecipeScore(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name=_('users'),
-        related_name='user_recipe_ratings'
+        related_name='user_recipe_ratings',
+        db_index=False
     )
     recipe = models.ForeignKey(
         Recipe,
@@ -246,24 +346,77 @@ class UserRecipeScore(models.Model):
         return f'{self.user} - {self.recipe} - {self.score}'
 
     def save(self, *args, **kwargs):
-        is_new = not self.pk
-        old_score = self.score
-        super().save(*args, **kwargs)
-        if is_new:
-            if self.recipe.voter_turnout:
-                self.recipe.voter_turnout += 1
-            else:
-                self.recipe.voter_turnout = 1
-            if self.recipe.full_score:
-                self.recipe.full_score += self.score
-            else:
-                self.recipe.full_score = self.score
-        else:
-            self.recipe.full_score += self.score - old_score
+        with transaction.atomic():
+            old_vote = None
+            if not self._state.adding:
+                old_vote = UserRecipeScore.objects.select_for_update().filter(
+                    pk=self.pk).values_list('recipe_id', 'score').first()
+            super().save(*args, **kwargs)
+            if old_vote is None:
+                apply_votes(self.recipe_id, 1, self.score)
+            elif old_vote[0] != self.recipe_id:
+                apply_votes(old_vote[0], -1, -old_vote[1])
+                apply_votes(self.recipe_id, 1, self.score)
+            elif old_vote[1] != self.score:
+                apply_votes(self.recipe_id, 0, self.score - old_vote[1])
 
     class Meta:
         ordering = ['score', 'recipe']
         unique_together = ('user', 'recipe')
         db_table = 'user_recipe_rating'
+        indexes = [
+            # Keyset-пагинация (recipes.pagination)
+            models.Index(fields=['created_at', 'id'], name='rating_created_id_idx'),
+            # Рейтинги пользователя (mine) с keyset-пагинацией
+            models.Index(fields=['user', 'created_at', 'id'],
+                         name='rating_user_created_id_idx'),
+        ]
         verbose_name = _('user recipe score')
         verbose_name_plural = _('user recipe scores')
+
+
+class RecipeNeighbors(models.Model):
+    """
+    Рецепты, которые оценили те же пользователи (см. recipes.recommendations)
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name=_('recipe'),
+        related_name='rating_neighbors'
+    )
+    # Пары [id рецепта, похожесть] по убыванию похожести
+    neighbors = models.JSONField(_('neighbors'), default=list)
+    # Голоса рецепта при построении: по их изменению находятся рецепты,
+    # списки которых нужно обновить
+    voter_turnout = models.PositiveIntegerField(_('voter turnout'), default=0)
+    full_score = models.PositiveIntegerField(_('full score'), default=0)
+    built_at = models.DateTimeField(_('built at'))
+
+    def __str__(self):
+        return f'{self.recipe_id} - {len(self.neighbors)}'
+
+    class Meta:
+        db_table = 'recipe_neighbors'
+        verbose_name = _('recipe neighbors')
+        verbose_name_plural = _('recipe neighbors')
+
+
+class CatalogImport(models.Model):
+    """
+    Загруженный файл каталога (см. recipes.importer)
+    """
+    # SHA-256 содержимого файла
+    checksum = models.CharField(_('checksum'), max_length=64, unique=True)
+    # label модели -> число строк в таблице после загрузки
+    row_counts = models.JSONField(_('row counts'), default=dict)
+    loaded_at = models.DateTimeField(_('loaded at'), auto_now=True)
+
+    def __str__(self):
+        return self.checksum
+
+    class Meta:
+        db_table = 'catalog_import'
+        verbose_name = _('catalog import')
+        verbose_name_plural = _('catalog imports')
@@ -0,0 +1,118 @@
+import threading
+
+from django.db import transaction
+from django.db.models import (
+    DecimalField, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+# Ограничение на число параметров запроса в SQLite
+RECOMPUTE_BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+def _stat_subquery(ingredient_field, known_only):
+    """
+    Средневзвешенное по количеству значение поля ингредиента для рецепта
+    из внешнего запроса. При known_only ингредиенты без значения не
+    учитываются, иначе считаются нулевыми.
+
+    Количество переводится в базовые единицы (Measure.factor), граммы и
+    миллилитры считаются равноценными, ингредиенты в штуках не учитываются.
+    """
+    from .models import Measure, RecipeIngredient
+
+    output_field = DecimalField()
+    amount = F('amount') * F('measure__factor')
+    weighed = ~Q(measure__dimension=Measure.Dimension.COUNT)
+    weighted = Sum(
+        amount * Coalesce(F(f'ingredient__{ingredient_field}'), Value(0),
+                          output_field=output_field),
+        filter=weighed,
+        output_field=output_field,
+    )
+    if known_only:
+        weighed &= Q(**{f'ingredient__{ingredient_field}__isnull': False})
+    total = Sum(amount, filter=weighed, output_field=output_field)
+    # Деление в плавающей точке: SQLite хранит целые суммы как INTEGER
+    value = NullIf(
+        Cast(weighted, FloatField()) / Cast(NullIf(total, Value(0)), FloatField()),
+        Value(0.0),
+    )
+    rows = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(value=value).values('value')
+    return Subquery(rows, output_field=FloatField())
+
+
+def get_stats_update():
+    """
+    Выражения для UPDATE полей рецепта, вычисляемых по ингредиентам:
+    food_energy - среднее по ингредиентам с известной калорийностью,
+    alcohol_by_volume - среднее по всем ингредиентам (без крепости - 0%)
+    """
+    return {
+        'food_energy': _stat_subquery('food_energy', known_only=True),
+        'alcohol_by_volume': _stat_subquery('alcohol_by_volume', known_only=False),
+    }
+
+
+def recompute_recipes(recipe_ids):
+    """
+    Пересчитывает калорийность и крепость заданных рецептов массовыми UPDATE
+    """
+    from .models import Recipe
+
+    recipe_ids = sorted(set(recipe_ids))
+    for i in range(0, len(recipe_ids), RECOMPUTE_BATCH_SIZE):
+        Recipe.objects.filter(
+            pk__in=recipe_ids[i:i + RECOMPUTE_BATCH_SIZE]
+        ).update(**get_stats_update())
+
+
+def _recompute_recipes_where(**lookups):
+    from .models import Recipe, RecipeIngredient
+
+    recipe_ids = RecipeIngredient.objects.filter(**lookups).values('recipe_id')
+    return Recipe.objects.filter(pk__in=recipe_ids).update(**get_stats_update())
+
+
+def recompute_recipes_with_ingredients(ingredient_ids):
+    """
+    Пересчитывает калорийность и крепость всех рецептов с заданными
+    ингредиентами одним UPDATE
+    """
+    return _recompute_recipes_where(ingredient_id__in=ingredient_ids)
+
+
+def recompute_recipes_with_measures(measure_ids):
+    """
+    Пересчитывает калорийность и крепость всех рецептов с ингредиентами
+    в заданных единицах измерения одним UPDATE
+    """
+    return _recompute_recipes_where(measure_id__in=measure_ids)
+
+
+def schedule_recompute(recipe_ids):
+    """
+    Откладывает пересчет рецептов до фиксации текущей транзакции. Рецепты,
+    измененные в одной транзакции несколько раз, пересчитываются один раз:
+    каждый вызов регистрирует свой on_commit, а первый выполнившийся
+    пересчитывает все накопленные в потоке рецепты, остальные ничего не
+    делают. Рецепты из отмененной транзакции пересчитываются вместе со
+    следующими, что безопасно: пересчет читает текущие данные.
+    """
+    pending = getattr(_local, 'recipe_ids', None)
+    if pending is None:
+        pending = _local.recipe_ids = set()
+    pending.update(recipe_ids)
+    transaction.on_commit(_flush_scheduled)
+
+
+def _flush_scheduled():
+    recipe_ids = getattr(_local, 'recipe_ids', None)
+    if recipe_ids:
+        _local.recipe_ids = set()
+        recompute_recipes(recipe_ids)
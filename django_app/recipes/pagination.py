@@ -0,0 +1,134 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+class RecipePageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация (COUNT + OFFSET) с настраиваемым размером страницы
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class CursorOrPageNumberPagination(CursorPagination):
+    """
+    Keyset-пагинация: следующая страница выбирается условием по
+    (created_at, id) последней записи, а не OFFSET, поэтому время ответа не
+    зависит от глубины страницы. Требует индекса по полям ordering.
+
+    В отличие от CursorPagination, курсор хранит значения всех полей
+    ordering, а не только первого со смещением среди равных, поэтому
+    записи с одинаковым created_at не пропускаются и не повторяются при
+    переходах по ссылкам next и previous.
+
+    Если в запросе передан параметр page, используется постраничная
+    пагинация (RecipePageNumberPagination) с ordering модели.
+    """
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    page_number_pagination_class = RecipePageNumberPagination
+
+    page_number_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_number_pagination_class.page_query_param in request.query_params:
+            self.page_number_paginator = self.page_number_pagination_class()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor is not None else None
+
+        ordering = [
+            name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+        ] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._get_keyset_filter(queryset.model, ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        # Курсор указывает на запись соседней страницы, значит, в
+        # направлении, откуда пришли, страницы есть
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_keyset_filter(self, model, ordering, position):
+        # Записи строго после position в порядке ordering:
+        # a > x OR (a = x AND (b > y OR ...)), с дополнительным a >= x,
+        # по которому БД выбирает диапазон индекса
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            values = [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(ordering, values)
+            ]
+        except (ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        condition = None
+        for name, value in reversed(list(zip(ordering, values))):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            after = Q(**{f'{field}__{lookup}': value})
+            if condition is None:
+                condition = after
+            else:
+                condition = Q(**{f'{field}__{lookup}e': value}) & (
+                    after | Q(**{field: value}) & condition)
+        return condition
+
+    def _encode_position(self, instance):
+        return json.dumps([
+            str(getattr(instance, name.lstrip('-'))) for name in self.ordering
+        ])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Перед курсором обратного прохода записей нет: следующая
+            # страница - первая
+            return self.encode_cursor(Cursor(offset=0, reverse=False, position=None))
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self._encode_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # После курсора записей нет: предыдущая страница - последняя
+            return self.encode_cursor(Cursor(offset=0, reverse=True, position=None))
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self._encode_position(self.page[0])))
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        page_number_parameters = self.page_number_pagination_class(
+        ).get_schema_operation_parameters(view)
+        names = {parameter['name'] for parameter in parameters}
+        return parameters + [
+            parameter for parameter in page_number_parameters
+            if parameter['name'] not in names
+        ]
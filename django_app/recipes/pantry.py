@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Lookup
+
+from config.app_settings import get_app_settings
+
+
+DEFAULT_PANTRY_SETTINGS = {
+    # Наибольшее число ингредиентов в запросе
+    'MAX_SIZE': 1000,
+    # Сколько результатов поиска по индексу ингредиентов хранить в памяти
+    'CACHE_SIZE': 1024,
+}
+
+
+def get_pantry_settings():
+    return get_app_settings('RECIPES_PANTRY', DEFAULT_PANTRY_SETTINGS)
+
+
+def canonical_pantry(ingredient_ids):
+    """
+    Набор ингредиентов в каноническом виде: отсортированный кортеж
+    уникальных id, пригодный для ключа кеша
+    """
+    return tuple(sorted(set(ingredient_ids)))
+
+
+class PantryError(ValueError):
+    """
+    Некорректный набор ингредиентов
+    """
+
+
+def parse_pantry(values):
+    """
+    Проверяет id ингредиентов из параметров запроса и возвращает
+    канонический набор (см. canonical_pantry)
+    """
+    try:
+        ingredient_ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise PantryError('Ожидаются целочисленные id ингредиентов')
+    if any(pk <= 0 for pk in ingredient_ids):
+        raise PantryError('Ожидаются положительные id ингредиентов')
+    pantry = canonical_pantry(ingredient_ids)
+    max_size = get_pantry_settings()['MAX_SIZE']
+    if len(pantry) > max_size:
+        raise PantryError(f'Не больше {max_size} ингредиентов')
+    return pantry
+
+
+class Any(Lookup):
+    """
+    field__any=[1, 2, 3] - то же, что field__in, но для списка значений:
+    на PostgreSQL передается одним параметром-массивом (field = ANY(%s)),
+    поэтому текст запроса не зависит от числа значений. Регистрируется
+    для полей из ANY_LOOKUP_FIELDS в RecipesConfig.ready
+    """
+    lookup_name = 'any'
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        field = self.lhs.output_field
+        return '%s', [[field.get_db_prep_value(field.get_prep_value(v), connection)
+                       for v in value]]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        _, (values,) = self.process_rhs(compiler, connection)
+        if connection.vendor == 'postgresql':
+            return f'{lhs} = ANY(%s)', lhs_params + [values]
+        if not values:
+            raise EmptyResultSet
+        placeholders = ', '.join(['%s'] * len(values))
+        return f'{lhs} IN ({placeholders})', lhs_params + values
+
+
+# Поля (модель, имя поля), для которых регистрируется Any
+ANY_LOOKUP_FIELDS = (
+    ('Recipe', 'id'),
+    ('RecipeIngredient', 'recipe'),
+    ('RecipeIngredient', 'ingredient'),
+)
+
+
+class PantryCache:
+    """
+    LRU кеш результатов поиска рецептов по набору ингредиентов в памяти
+    процесса. Ключ включает канонический набор ингредиентов и версию
+    индекса, поэтому изменение индекса делает старые записи недостижимыми,
+    а вытесняются они по мере заполнения.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_set(self, key, compute):
+        """
+        Возвращает закешированное значение для key или вычисляет его
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+        value = compute()
+        size = get_pantry_settings()['CACHE_SIZE']
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+pantry_cache = PantryCache()
@@ -0,0 +1,16 @@
+import numpy as np
+
+
+def get_top(ids, values, k):
+    """
+    Список до k пар [id рецепта, похожесть] по убыванию похожести, при
+    равной - по возрастанию id
+    """
+    if len(values) > k:
+        # Все рецепты с похожестью не ниже k-й, чтобы из равных выбирались
+        # меньшие id, как при полной сортировке
+        threshold = -np.partition(-values, k - 1)[k - 1]
+        top = values >= threshold
+        ids, values = ids[top], values[top]
+    order = np.lexsort((ids, -values))[:k]
+    return [[pk, value] for pk, value in zip(ids[order].tolist(), values[order].tolist())]
@@ -0,0 +1,220 @@
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from scipy import sparse
+
+from config.app_settings import get_app_settings
+
+from .models import Recipe, RecipeNeighbors, UserRecipeScore
+from .ranking import get_top
+
+
+DEFAULT_RECOMMENDATIONS_SETTINGS = {
+    # Число похожих рецептов, хранимых для каждого рецепта
+    'NEIGHBORS': 20,
+    # Оценки не ниже этой считаются "понравилось"
+    'MIN_SCORE': 6,
+    # Сглаживание похожести по числу общих пользователей n: похожесть
+    # умножается на n / (n + SHRINKAGE), чтобы случайные совпадения
+    # немногих оценок не вытесняли устойчивые
+    'SHRINKAGE': 10,
+    # Число строк матрицы похожести, вычисляемых за раз
+    'BLOCK_SIZE': 1000,
+    # Размер порции строк при чтении и записи
+    'CHUNK_SIZE': 2000,
+}
+
+
+def get_recommendations_settings():
+    return get_app_settings('RECIPES_RECOMMENDATIONS', DEFAULT_RECOMMENDATIONS_SETTINGS)
+
+
+class RatingMatrix:
+    """
+    Разреженная матрица пользователи x рецепты из оценок "понравилось"
+    (UserRecipeScore.score >= MIN_SCORE) и похожесть рецептов по ней:
+    косинусная мера столбцов со сглаживанием по числу общих пользователей.
+    """
+
+    def __init__(self, min_score, shrinkage, chunk_size):
+        self.shrinkage = shrinkage
+        rows = UserRecipeScore.objects.filter(
+            score__gte=max(min_score, 1)).order_by().values_list('user_id', 'recipe_id', 'score')
+        values = np.fromiter(
+            chain.from_iterable(rows.iterator(chunk_size=chunk_size)), dtype=np.int64)
+        user_ids, recipe_ids, scores = values.reshape(-1, 3).T
+        # Номера строк и столбцов матрицы - позиции id в отсортированных
+        # массивах уникальных id
+        self.recipe_ids, columns = np.unique(recipe_ids, return_inverse=True)
+        _, users = np.unique(user_ids, return_inverse=True)
+        shape = (users.max() + 1 if len(users) else 0, len(self.recipe_ids))
+        matrix = sparse.csc_matrix(
+            (scores.astype(np.float64), (users, columns)), shape=shape)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        self.normalized = (matrix @ sparse.diags(1 / norms)).tocsc()
+        self.binary = (matrix != 0).astype(np.float64).tocsc()
+
+    def get_columns(self, recipe_ids):
+        """
+        Номера столбцов рецептов (-1 - у рецепта нет оценок)
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        positions = np.searchsorted(self.recipe_ids, recipe_ids)
+        positions[positions == len(self.recipe_ids)] = 0
+        found = (len(self.recipe_ids) > 0) & (self.recipe_ids[positions] == recipe_ids)
+        return np.where(found, positions, -1)
+
+    def get_similarity(self, columns):
+        """
+        Строки матрицы похожести рецептов для столбцов columns
+        (len(columns) x число рецептов с оценками, CSR)
+        """
+        similarity = (self.normalized[:, columns].T @ self.normalized).tocsr()
+        if self.shrinkage:
+            common = (self.binary[:, columns].T @ self.binary).tocsr()
+            common.data = common.data / (common.data + self.shrinkage)
+            similarity = similarity.multiply(common).tocsr()
+        similarity.eliminate_zeros()
+        return similarity
+
+    def iter_similar(self, columns, block_size):
+        """
+        Возвращает для каждого столбца columns пару массивов (id рецептов,
+        похожесть) всех похожих рецептов, кроме самого рецепта
+        """
+        for start in range(0, len(columns), block_size):
+            block = columns[start:start + block_size]
+            similarity = self.get_similarity(block)
+            for row, column in enumerate(block):
+                begin, end = similarity.indptr[row], similarity.indptr[row + 1]
+                indices = similarity.indices[begin:end]
+                keep = indices != column
+                yield (self.recipe_ids[indices[keep]],
+                       np.round(similarity.data[begin:end][keep], 4))
+
+
+def _merge(neighbors, changed, candidates, k):
+    """
+    Заменяет в списке соседей рецепта похожести на рецепты changed
+    значениями candidates (id -> похожесть); None - если список без
+    пересчета не восстановить (рецепт из полного списка стал менее похожим)
+    """
+    if len(neighbors) >= k and any(
+            pk in changed and candidates.get(pk, 0) < value for pk, value in neighbors):
+        return None
+    merged = {pk: value for pk, value in neighbors if pk not in changed}
+    merged.update(candidates)
+    return sorted(([pk, value] for pk, value in merged.items()),
+                  key=lambda item: (-item[1], item[0]))[:k]
+
+
+def build_neighbors(full=False):
+    """
+    Строит списки похожих рецептов (RecipeNeighbors) по оценкам
+    пользователей. Возвращает число обновленных списков.
+
+    Без full пересчитываются только рецепты, оценки которых изменились с
+    прошлого построения (изменились число голосов или сумма оценок, или
+    есть оценки новее построения), а списки остальных рецептов обновляются
+    похожестями на них, удаленные рецепты из списков убираются; полностью
+    пересчитываются только те, в полных списках которых изменившийся
+    рецепт стал менее похожим или удален.
+    """
+    recommendations_settings = get_recommendations_settings()
+    k = recommendations_settings['NEIGHBORS']
+    chunk_size = recommendations_settings['CHUNK_SIZE']
+    # Время фиксируется до чтения: оценки, записанные во время построения,
+    # попадут в следующее
+    built_at = timezone.now()
+    votes = {
+        pk: (voter_turnout or 0, full_score or 0)
+        for pk, voter_turnout, full_score in Recipe.objects.order_by().values_list(
+            'pk', 'voter_turnout', 'full_score').iterator(chunk_size=chunk_size)
+    }
+    existing = {} if full else {
+        pk: (neighbors, (voter_turnout, full_score), previous_built_at)
+        for pk, neighbors, voter_turnout, full_score, previous_built_at
+        in RecipeNeighbors.objects.order_by().values_list(
+            'recipe_id', 'neighbors', 'voter_turnout', 'full_score', 'built_at'
+        ).iterator(chunk_size=chunk_size)
+    }
+    changed = {pk for pk in votes if pk not in existing or existing[pk][1] != votes[pk]}
+    # Рецепты, удаленные после прошлого построения, убираются из списков
+    # соседей (их собственные списки удалены каскадно)
+    deleted = {
+        neighbor_id for neighbors, _, _ in existing.values()
+        for neighbor_id, _ in neighbors if neighbor_id not in votes
+    }
+    changed.update(deleted)
+    if existing:
+        oldest = min(item[2] for item in existing.values())
+        recent = UserRecipeScore.objects.filter(updated_at__gte=oldest).order_by().values(
+            'recipe_id').annotate(updated_at=Max('updated_at'))
+        changed.update(
+            item['recipe_id'] for item in recent
+            if item['recipe_id'] in existing
+            and item['updated_at'] >= existing[item['recipe_id']][2]
+        )
+    if not changed:
+        return 0
+
+    matrix = RatingMatrix(
+        recommendations_settings['MIN_SCORE'], recommendations_settings['SHRINKAGE'],
+        chunk_size)
+    block_size = recommendations_settings['BLOCK_SIZE']
+
+    def compute(recipe_ids, candidates=None):
+        # candidates - словарь id рецепта -> {id изменившегося рецепта:
+        # похожесть}, заполняется по полным строкам матрицы (она симметрична)
+        recipe_ids = sorted(recipe_ids)
+        columns = matrix.get_columns(recipe_ids)
+        result = {pk: [] for pk in recipe_ids}
+        rated = [pk for pk, column in zip(recipe_ids, columns) if column >= 0]
+        for pk, (ids, values) in zip(rated, matrix.iter_similar(columns[columns >= 0],
+                                                                 block_size)):
+            result[pk] = get_top(ids, values, k)
+            if candidates is not None:
+                for neighbor_id, value in zip(ids.tolist(), values.tolist()):
+                    candidates.setdefault(neighbor_id, {})[pk] = value
+        return result
+
+    candidates = {}
+    updated = compute(changed - deleted, candidates if existing else None)
+    if existing:
+        recompute = set()
+        for pk, (neighbors, _, _) in existing.items():
+            if pk in changed or pk not in votes:
+                continue
+            if pk not in candidates and not any(
+                    neighbor_id in changed for neighbor_id, _ in neighbors):
+                continue
+            merged = _merge(neighbors, changed, candidates.get(pk, {}), k)
+            if merged is None:
+                recompute.add(pk)
+            elif merged != neighbors:
+                updated[pk] = merged
+        updated.update(compute(recompute))
+
+    _save(updated, votes, built_at, chunk_size)
+    return len(updated)
+
+
+def _save(neighbors, votes, built_at, chunk_size):
+    # Строки заменяются удалением и вставкой: bulk_update с CASE по каждой
+    # строке на порядок медленнее
+    items = sorted(neighbors.items())
+    for i in range(0, len(items), chunk_size):
+        batch = dict(items[i:i + chunk_size])
+        with transaction.atomic():
+            RecipeNeighbors.objects.filter(recipe_id__in=batch).delete()
+            # Рецепт мог быть удален после чтения
+            alive = Recipe.objects.filter(pk__in=batch).values_list('pk', flat=True)
+            RecipeNeighbors.objects.bulk_create([
+                RecipeNeighbors(recipe_id=pk, neighbors=batch[pk],
+                                voter_turnout=votes[pk][0], full_score=votes[pk][1],
+                                built_at=built_at)
+                for pk in alive
+            ])
@@ -0,0 +1,98 @@
+import math
+from decimal import Decimal
+from fractions import Fraction
+
+from .cache import (
+    get_cache, get_generations, get_object_generations, get_response_cache_settings
+)
+from .models import Measure, Recipe, RecipeIngredient
+
+
+# Модели, изменение которых (например, импортом) делает недействительными
+# все пересчитанные рецепты; изменения отдельных рецептов отслеживаются
+# поколениями рецептов (см. recipes.signals)
+SCALING_CACHE_MODELS = (Measure, Recipe, RecipeIngredient)
+
+
+def round_amount(amount, decimal_places):
+    """
+    Округляет точное количество (Fraction) до decimal_places знаков после
+    запятой половиной вверх. Ненулевое количество не округляется до нуля:
+    остается хотя бы одна единица последнего знака.
+    """
+    units = math.floor(amount * 10 ** decimal_places + Fraction(1, 2))
+    if units == 0 and amount > 0:
+        units = 1
+    return Decimal(units).scaleb(-decimal_places)
+
+
+def scale_amount(amount, servings, base_servings, decimal_places):
+    """
+    Количество ингредиента рецепта на base_servings порций, пересчитанное
+    на servings порций без промежуточных округлений
+    """
+    return round_amount(Fraction(amount) * servings / base_servings, decimal_places)
+
+
+def _scale_recipe(recipe, rows, servings):
+    pk, name, base_servings = recipe
+    return {
+        'recipe': pk,
+        'name': name,
+        'servings': base_servings,
+        'scaled_servings': servings,
+        'recipe_ingredients': [
+            {
+                'id': row_pk,
+                'ingredient': ingredient_id,
+                'measure': measure_id,
+                'amount': str(scale_amount(amount, servings, base_servings, decimal_places)),
+            }
+            for row_pk, ingredient_id, measure_id, decimal_places, amount in rows
+        ],
+    }
+
+
+def scale_recipes(recipe_ids, servings):
+    """
+    Рецепты recipe_ids с количествами ингредиентов, пересчитанными на
+    servings порций и округленными по точности единиц измерения
+    (Measure.decimal_places). Возвращает словарь id -> рецепт, рецептов,
+    которых нет в БД, в нем нет.
+
+    Результаты кешируются по рецепту и числу порций, ненайденные в кеше
+    рецепты пересчитываются за два запроса за один проход по ингредиентам.
+    """
+    cache = get_cache()
+    cache_settings = get_response_cache_settings()
+    # Поколения читаются до данных: изменение, зафиксированное между
+    # чтениями, попадет в кеш под устаревшим ключом
+    generations = ':'.join(str(generation)
+                           for generation in get_generations(SCALING_CACHE_MODELS))
+    recipe_generations = get_object_generations(Recipe, recipe_ids)
+    keys = {
+        pk: f'{cache_settings["KEY_PREFIX"]}:scaled:{generations}:'
+            f'{recipe_generations[pk]}:{pk}:{servings}'
+        for pk in recipe_ids
+    }
+    cached = cache.get_many(keys.values())
+    scaled = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in recipe_ids if pk not in scaled]
+    if missing:
+        recipes = list(Recipe.objects.filter(pk__any=missing).order_by().values_list(
+            'pk', 'name', 'servings'))
+        rows = {}
+        for recipe_id, *row in RecipeIngredient.objects.filter(
+                recipe_id__any=missing).order_by('recipe_id', 'pk').values_list(
+                'recipe_id', 'pk', 'ingredient_id', 'measure_id',
+                'measure__decimal_places', 'amount'):
+            rows.setdefault(recipe_id, []).append(row)
+        computed = {
+            recipe[0]: _scale_recipe(recipe, rows.get(recipe[0], []), servings)
+            for recipe in recipes
+        }
+        cache.set_many({keys[pk]: value for pk, value in computed.items()},
+                       cache_settings['TIMEOUT'])
+        scaled.update(computed)
+    return scaled
@@ -0,0 +1,324 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import (
+    Case, ExpressionWrapper, F, FloatField, Func, IntegerField, Lookup, Q, Value, When
+)
+from django.db.models.functions import Length
+
+from config.app_settings import get_app_settings
+
+
+DEFAULT_SEARCH_SETTINGS = {
+    # 'auto' - pg_trgm на PostgreSQL, индекс в памяти процесса на остальных БД;
+    # 'memory' или 'database' - принудительно
+    'BACKEND': 'auto',
+    # Минимальная доля триграмм запроса, найденных в названии
+    # (аналог pg_trgm.word_similarity_threshold)
+    'SIMILARITY_THRESHOLD': 0.5,
+    # Время жизни индекса в памяти в секундах (None - без ограничения):
+    # изменения из других процессов становятся видны после перестроения
+    'TTL': 60,
+}
+
+# Сколько названий, начинающихся с запроса, рассматривается при ранжировании
+PREFIX_SCAN_LIMIT = 1000
+# Надбавка к оценке названия, слово которого (первое слово которого)
+# начинается с запроса: полное совпадение слова важнее автодополнения
+PREFIX_BONUS = 0.1
+
+WORD_RE = re.compile(r'\w+')
+
+
+def get_search_settings():
+    return get_app_settings('RECIPES_SEARCH', DEFAULT_SEARCH_SETTINGS)
+
+
+def normalize(text):
+    """
+    Приводит текст к виду для сравнения: слова в нижнем регистре через пробел
+    """
+    return ' '.join(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+def get_trigrams(text):
+    """
+    Триграммы нормализованного текста как в pg_trgm: каждое слово дополняется
+    двумя пробелами слева и одним справа
+    """
+    trigrams = set()
+    for word in text.split():
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return frozenset(trigrams)
+
+
+class TrigramWordSimilar(Lookup):
+    """
+    name__trigram_word_similar=query - оператор pg_trgm %> (запрос похож на
+    часть названия), использует GIN индекс gin_trgm_ops. Регистрируется
+    для полей name моделей SEARCH_MODELS в RecipesConfig.ready
+    """
+    lookup_name = 'trigram_word_similar'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} %%> {rhs}', lhs_params + rhs_params
+
+
+# Атрибут соединения: значение pg_trgm.word_similarity_threshold,
+# установленное в сессии БД (сбрасывается при подключении, см. recipes.signals)
+THRESHOLD_ATTRIBUTE = 'trigram_word_similarity_threshold'
+
+
+def set_similarity_threshold(connection, threshold):
+    """
+    Устанавливает pg_trgm.word_similarity_threshold для сессии соединения
+    один раз, а не перед каждым поиском. Внутри транзакции значение
+    устанавливается заново: при ее откате set_config тоже откатывается.
+    """
+    if getattr(connection, THRESHOLD_ATTRIBUTE, None) == threshold:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+            [str(threshold)])
+    setattr(connection, THRESHOLD_ATTRIBUTE,
+            None if connection.in_atomic_block else threshold)
+
+
+class TrigramIndex:
+    """
+    Триграммный индекс названий объектов модели в памяти процесса.
+
+    Для каждой триграммы хранится множество id объектов, в названиях которых
+    она встречается, для автодополнения - отсортированный список окончаний
+    названий, начинающихся с границы слова. Кандидаты поиска - объекты
+    с общими с запросом триграммами, поэтому запрос с опечаткой находит
+    название, а оценка - доля триграмм запроса, найденных в названии.
+
+    Индекс строится лениво при первом обращении и поддерживается сигналами
+    моделей (см. recipes.signals). Изменения из других процессов становятся
+    видны после перестроения по истечении TTL.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._lock = threading.RLock()
+        self._built_at = None
+        # id -> название
+        self._names = {}
+        # id -> триграммы названия
+        self._trigrams = {}
+        # триграмма -> множество id
+        self._postings = {}
+        # Отсортированный список (окончание нормализованного названия, id,
+        # номер слова, с которого оно начинается)
+        self._prefixes = []
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        ttl = get_search_settings()['TTL']
+        return ttl is None or time.monotonic() - self._built_at < ttl
+
+    def _reset(self):
+        self._built_at = None
+        self._names = {}
+        self._trigrams = {}
+        self._postings = {}
+        self._prefixes = []
+
+    def _build(self):
+        model = apps.get_model('recipes', self.model_name)
+        self._reset()
+        for pk, name in model.objects.order_by().values_list('pk', 'name').iterator():
+            self._add(pk, name, sort=False)
+        self._prefixes.sort()
+        self._built_at = time.monotonic()
+
+    def _ensure_built(self):
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._build()
+
+    @staticmethod
+    def _get_suffixes(text):
+        words = text.split()
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    def _add(self, pk, name, sort=True):
+        text = normalize(name)
+        trigrams = get_trigrams(text)
+        self._names[pk] = name
+        self._trigrams[pk] = trigrams
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, set()).add(pk)
+        for position, suffix in enumerate(self._get_suffixes(text)):
+            if sort:
+                bisect.insort(self._prefixes, (suffix, pk, position))
+            else:
+                self._prefixes.append((suffix, pk, position))
+
+    def _remove(self, pk):
+        name = self._names.pop(pk, None)
+        if name is None:
+            return
+        for trigram in self._trigrams.pop(pk):
+            postings = self._postings[trigram]
+            postings.discard(pk)
+            if not postings:
+                del self._postings[trigram]
+        for position, suffix in enumerate(self._get_suffixes(normalize(name))):
+            i = bisect.bisect_left(self._prefixes, (suffix, pk, position))
+            if i < len(self._prefixes) and self._prefixes[i] == (suffix, pk, position):
+                del self._prefixes[i]
+
+    def invalidate(self):
+        """
+        Сбрасывает индекс, он будет перестроен при следующем обращении
+        """
+        with self._lock:
+            self._reset()
+
+    def update(self, pk, name):
+        """
+        Добавляет объект или обновляет его название
+        """
+        with self._lock:
+            if self._built_at is None:
+                return
+            if self._names.get(pk) != name:
+                self._remove(pk)
+                self._add(pk, name)
+
+    def remove(self, pk):
+        """
+        Удаляет объект из индекса
+        """
+        with self._lock:
+            if self._built_at is not None:
+                self._remove(pk)
+
+    def search(self, query, limit, threshold):
+        """
+        Возвращает до limit словарей {id, name, score} по убыванию
+        релевантности: доли найденных в названии триграмм запроса (score)
+        с надбавкой за совпадение начала слова, затем похожести всего
+        названия и по длине названия
+        """
+        text = normalize(query)
+        if not text:
+            return []
+        query_trigrams = get_trigrams(text)
+        self._ensure_built()
+        with self._lock:
+            shared = Counter()
+            for trigram in query_trigrams:
+                shared.update(self._postings.get(trigram, ()))
+            # 2 - название начинается с запроса, 1 - одно из слов названия
+            prefixed = {}
+            i = bisect.bisect_left(self._prefixes, (text,))
+            for suffix, pk, position in self._prefixes[i:i + PREFIX_SCAN_LIMIT]:
+                if not suffix.startswith(text):
+                    break
+                prefixed[pk] = max(prefixed.get(pk, 0), 1 + (position == 0))
+
+            ranked = []
+            for pk in prefixed.keys() | shared.keys():
+                common = shared[pk]
+                score = common / len(query_trigrams)
+                if score < threshold and pk not in prefixed:
+                    continue
+                similarity = common / (len(query_trigrams) + len(self._trigrams[pk]) - common)
+                name = self._names[pk]
+                rank = score + PREFIX_BONUS * prefixed.get(pk, 0)
+                ranked.append((-rank, -similarity, len(name), pk, name, score))
+            best = heapq.nsmallest(limit, ranked)
+        return [
+            {'id': pk, 'name': name, 'score': round(score, 3)}
+            for _, _, _, pk, name, score in best
+        ]
+
+
+class DatabaseSearch:
+    """
+    Поиск средствами pg_trgm (индексы создаются миграцией
+    0006_search_trigram_indexes)
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def search(self, query, limit, threshold):
+        model = apps.get_model('recipes', self.model_name)
+        text = normalize(query)
+        if not text:
+            return []
+        set_similarity_threshold(connection, threshold)
+        # Ранжирование как в TrigramIndex.search
+        queryset = model.objects.filter(
+            Q(name__trigram_word_similar=text) | Q(name__istartswith=text)
+            | Q(name__icontains=f' {text}')
+        ).annotate(
+            prefixed=Case(
+                When(name__istartswith=text, then=Value(2)),
+                When(name__icontains=f' {text}', then=Value(1)),
+                default=Value(0), output_field=IntegerField()),
+            score=Func(Value(text), F('name'), function='word_similarity',
+                       output_field=FloatField()),
+            similarity=Func(Value(text), F('name'), function='similarity',
+                            output_field=FloatField()),
+        ).annotate(
+            rank=ExpressionWrapper(F('score') + F('prefixed') * PREFIX_BONUS,
+                                   output_field=FloatField()),
+        ).order_by('-rank', '-similarity', Length('name'), 'pk')
+        return [
+            {'id': pk, 'name': name, 'score': round(score, 3)}
+            for pk, name, score in queryset.values_list('pk', 'name', 'score')[:limit]
+        ]
+
+
+SEARCH_MODELS = {
+    'ingredient': 'Ingredient',
+    'recipe': 'Recipe',
+    'recipe_category': 'RecipeCategory',
+}
+
+search_indexes = {key: TrigramIndex(model_name) for key, model_name in SEARCH_MODELS.items()}
+database_search = {key: DatabaseSearch(model_name) for key, model_name in SEARCH_MODELS.items()}
+
+
+def use_database_search():
+    backend = get_search_settings()['BACKEND']
+    if backend == 'auto':
+        return connection.vendor == 'postgresql'
+    return backend == 'database'
+
+
+def search(query, types, limit):
+    """
+    Ищет объекты по названию с учетом опечаток, возвращает словарь
+    тип -> список {id, name, score}
+    """
+    threshold = get_search_settings()['SIMILARITY_THRESHOLD']
+    backends = database_search if use_database_search() else search_indexes
+    return {key: backends[key].search(query, limit, threshold) for key in types}
+
+
+def get_search_index(model):
+    """
+    Индекс в памяти для модели (None, если по ней нет поиска)
+    """
+    for key, model_name in SEARCH_MODELS.items():
+        if model._meta.object_name == model_name:
+            return search_indexes[key]
+    return None
@@ -1,4 +1,14 @@
-from rest_framework.serializers import ModelSerializer
+from django.db import connection, transaction
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.serializers import (
+    IntegerField,
+    ListSerializer,
+    ModelSerializer,
+    PrimaryKeyRelatedField,
+    ValidationError
+)
+
+from users.permissions import is_owner
 
 from .models import (
     Measure,
@@ -8,6 +18,58 @@ from .models import (
     RecipeIngredient,
     UserRecipeScore
 )
+from .signals import recipe_ingredients_changed
+
+
+class PrefetchedPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField, который при валидации списка берет объекты из
+    словаря prefetched, заполненного BulkListSerializer, вместо отдельного
+    запроса на каждое значение
+    """
+    prefetched = None
+
+    def to_internal_value(self, data):
+        if self.prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.prefetched[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class BulkListSerializer(ListSerializer):
+    """
+    ListSerializer, который перед валидацией загружает объекты внешних
+    ключей всех элементов списка одним запросом на поле
+    (для полей PrefetchedPrimaryKeyRelatedField)
+    """
+
+    def to_internal_value(self, data):
+        fields = [
+            field for field in self.child.fields.values()
+            if isinstance(field, PrefetchedPrimaryKeyRelatedField) and not field.read_only
+        ]
+        if isinstance(data, list):
+            for field in fields:
+                pks = set()
+                for item in data:
+                    if not isinstance(item, dict):
+                        continue
+                    try:
+                        pks.add(int(item.get(field.field_name)))
+                    except (TypeError, ValueError):
+                        pass
+                field.prefetched = field.get_queryset().in_bulk(pks)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            for field in fields:
+                field.prefetched = None
 
 
 class MeasureSerializer(ModelSerializer):
@@ -17,7 +79,7 @@ class MeasureSerializer(ModelSerializer):
 
     class Meta:
         model = Measure
-        fields = ('id', 'name')
+        fields = ('id', 'name', 'dimension', 'factor', 'decimal_places')
 
 
 class IngredientSerializer(ModelSerializer):
@@ -44,21 +106,193 @@ class RecipeIngredientSerializer(ModelSerializer):
     """
     Сериализатор ингредиентов рецепта
     """
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'recipe', 'measure', 'ingredient', 'amount')
 
 
+class RecipeIngredientBulkListSerializer(BulkListSerializer):
+    """
+    Массовое создание (элементы без id) и обновление (элементы с id)
+    ингредиентов рецептов в одной транзакции через bulk_create / bulk_update
+    """
+    update_fields = ('recipe', 'measure', 'ingredient', 'amount')
+
+    def validate(self, attrs):
+        pks = [item['id'] for item in attrs if item.get('id') is not None]
+        if len(pks) != len(set(pks)):
+            raise ValidationError('Ингредиенты рецептов в списке повторяются')
+        return attrs
+
+    def save(self, **kwargs):
+        user = self.context['request'].user
+        items = [{**item, **kwargs} for item in self.validated_data]
+        update_items = [item for item in items if item.get('id') is not None]
+        create_items = [item for item in items if item.get('id') is None]
+
+        # Рецепты загружены при валидации, строки - одним запросом ниже:
+        # права на все объекты проверяются по id владельцев без запросов
+        if not user.is_staff and not all(
+                is_owner(user, item['recipe'], 'author') for item in items):
+            raise PermissionDenied()
+
+        with transaction.atomic():
+            existing = RecipeIngredient.objects.select_for_update().in_bulk(
+                [item['id'] for item in update_items])
+            missing = [item['id'] for item in update_items if item['id'] not in existing]
+            if missing:
+                raise ValidationError(f'Ингредиенты рецептов не найдены: {missing}')
+            if not user.is_staff and not all(
+                    is_owner(user, row, 'author') for row in existing.values()):
+                raise PermissionDenied()
+            recipe_ids = set()
+            updated = []
+            for item in update_items:
+                recipe_ingredient = existing[item['id']]
+                # Пересчитываются и прежний, и новый рецепт
+                recipe_ids.add(recipe_ingredient.recipe_id)
+                for name in self.update_fields:
+                    setattr(recipe_ingredient, name, item[name])
+                recipe_ids.add(recipe_ingredient.recipe_id)
+                updated.append(recipe_ingredient)
+            RecipeIngredient.objects.bulk_update(updated, self.update_fields)
+
+            created = [
+                RecipeIngredient(**{name: value for name, value in item.items() if name != 'id'})
+                for item in create_items
+            ]
+            if connection.features.can_return_rows_from_bulk_insert:
+                RecipeIngredient.objects.bulk_create(created)
+            else:
+                # База не возвращает id из массового INSERT (SQLite, MySQL):
+                # строки вставляются по одной в той же транзакции
+                for recipe_ingredient in created:
+                    recipe_ingredient.save(force_insert=True)
+            recipe_ids.update(item['recipe'].pk for item in create_items)
+            recipe_ingredients_changed.send(sender=RecipeIngredient, recipe_ids=recipe_ids)
+
+        self.instance = updated + created
+        return self.instance
+
+
+class RecipeIngredientBulkSerializer(RecipeIngredientSerializer):
+    """
+    Сериализатор элемента массового создания / обновления ингредиентов рецепта
+    """
+    id = IntegerField(required=False)
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        list_serializer_class = RecipeIngredientBulkListSerializer
+
+
+class RecipeIngredientNestedSerializer(RecipeIngredientSerializer):
+    """
+    Сериализатор ингредиента в составе рецепта: рецепт задается родительским
+    сериализатором, id указывается для изменения существующего ингредиента
+    """
+    id = IntegerField(required=False)
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        read_only_fields = ('recipe',)
+        list_serializer_class = BulkListSerializer
+
+
 class RecipeSerializer(ModelSerializer):
     """
-    Сериализатор рецептов
+    Сериализатор рецептов.
+
+    Рецепт создается и изменяется вместе со списком ингредиентов: список
+    заменяет текущие ингредиенты рецепта, изменения вносятся массовыми
+    INSERT, UPDATE и DELETE в одной транзакции.
     """
-    recipe_ingredients = RecipeIngredientSerializer(many=True)
+    recipe_ingredients = RecipeIngredientNestedSerializer(many=True, required=False)
+
+    ingredient_fields = ('measure', 'ingredient', 'amount')
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.with_ingredients()
+
+    def validate_recipe_ingredients(self, value):
+        pks = [item['id'] for item in value if item.get('id') is not None]
+        if len(pks) != len(set(pks)):
+            raise ValidationError('Ингредиенты рецепта в списке повторяются')
+        return value
+
+    def create(self, validated_data):
+        items = validated_data.pop('recipe_ingredients', [])
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            self._save_ingredients(recipe, items, created=True)
+        return recipe
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop('recipe_ingredients', None)
+        with transaction.atomic():
+            recipe = super().update(instance, validated_data)
+            if items is not None:
+                self._save_ingredients(recipe, items)
+        return recipe
+
+    def _save_ingredients(self, recipe, items, created=False):
+        """
+        Приводит ингредиенты рецепта к списку items. Элементы с id изменяют
+        ингредиент с этим id, элементы без id - ингредиент рецепта с тем же
+        Ingredient, если он еще не сопоставлен, иначе создаются. Ингредиенты,
+        которых нет в списке, удаляются. Число запросов не зависит от длины
+        списка.
+        """
+        existing = {} if created else RecipeIngredient.objects.select_for_update().filter(
+            recipe=recipe).order_by().in_bulk()
+        unknown = [item['id'] for item in items
+                   if item.get('id') is not None and item['id'] not in existing]
+        if unknown:
+            raise ValidationError({
+                'recipe_ingredients': [f'Ингредиенты не относятся к рецепту: {unknown}']})
+
+        unmatched = {pk: row for pk, row in existing.items()
+                     if pk not in {item.get('id') for item in items}}
+        by_ingredient = {}
+        for row in unmatched.values():
+            by_ingredient.setdefault(row.ingredient_id, []).append(row)
+
+        updated, created_rows = [], []
+        for item in items:
+            if item.get('id') is not None:
+                row = existing[item['id']]
+            elif by_ingredient.get(item['ingredient'].pk):
+                row = by_ingredient[item['ingredient'].pk].pop()
+                del unmatched[row.pk]
+            else:
+                created_rows.append(RecipeIngredient(
+                    author_id=recipe.author_id, recipe=recipe,
+                    **{name: item[name] for name in self.ingredient_fields}))
+                continue
+            changed = False
+            for name in self.ingredient_fields:
+                # Внешние ключи сравниваются по id, без загрузки объектов
+                attname = RecipeIngredient._meta.get_field(name).attname
+                value = getattr(item[name], 'pk', item[name])
+                if getattr(row, attname) != value:
+                    setattr(row, name, item[name])
+                    changed = True
+            if changed:
+                updated.append(row)
+
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, self.ingredient_fields)
+        if created_rows:
+            RecipeIngredient.objects.bulk_create(created_rows)
+        if unmatched:
+            RecipeIngredient.objects.filter(pk__in=unmatched).delete()
+        if updated or created_rows or unmatched:
+            recipe_ingredients_changed.send(sender=RecipeIngredient, recipe_ids=[recipe.pk])
 
     class Meta:
         model = Recipe
-        fields = ('id', 'recipe_category', 'name', 'cook_time', 'author',
+        fields = ('id', 'recipe_category', 'name', 'cook_time', 'servings', 'author',
                   'created_at', 'updated_at', 'voter_turnout', 'rating',
                   'food_energy', 'alcohol_by_volume', 'recipe_ingredients')
         read_only_fields = ('author', 'created_at', 'updated_at',
@@ -66,6 +300,16 @@ class RecipeSerializer(ModelSerializer):
                             'alcohol_by_volume')
 
 
+class RecipeUnlikenessSerializer(RecipeSerializer):
+    """
+    Сериализатор рецептов с числом недостающих ингредиентов
+    """
+    unlikeness = IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('unlikeness',)
+
+
 class UserRecipeScoreSerializer(ModelSerializer):
     """
     Сериализатор рейтингов рецептов
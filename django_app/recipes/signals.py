@@ -0,0 +1,262 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .cache import bump_generation, bump_object_generations
+from .indexes import ingredient_index
+from .leaderboards import leaderboards
+from .models import (
+    Measure,
+    Ingredient,
+    RecipeCategory,
+    Recipe,
+    RecipeIngredient,
+    UserRecipeScore
+)
+from .nutrition import (
+    recompute_recipes_with_ingredients,
+    recompute_recipes_with_measures,
+    schedule_recompute
+)
+from .search import THRESHOLD_ATTRIBUTE, get_search_index
+from .similarity import ingredient_similarity
+from .units import conversion_table
+from .votes import apply_votes, recipe_votes_changed
+
+
+# Отправляется массовыми операциями над RecipeIngredient (bulk_create,
+# bulk_update), которые не отправляют post_save; аргумент recipe_ids -
+# рецепты, ингредиенты которых изменились
+recipe_ingredients_changed = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    """
+    Обновляет категорию рецепта в индексе после фиксации транзакции
+    """
+    recipe = (instance.pk, instance.recipe_category_id)
+    transaction.on_commit(lambda: ingredient_index.set_recipe_category(*recipe))
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    """
+    Удаляет рецепт из индекса категорий после фиксации транзакции
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: ingredient_index.set_recipe_category(pk, None))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def index_recipe_ingredient(sender, instance, **kwargs):
+    """
+    Добавляет ингредиент рецепта в индекс после фиксации транзакции
+    """
+    row = (instance.pk, instance.recipe_id, instance.ingredient_id)
+    transaction.on_commit(lambda: ingredient_index.add_row(*row))
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def unindex_recipe_ingredient(sender, instance, **kwargs):
+    """
+    Удаляет ингредиент рецепта из индекса после фиксации транзакции
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: ingredient_index.remove_row(pk))
+
+
+@receiver(post_save, sender=Recipe)
+def update_leaderboards_recipe(sender, instance, **kwargs):
+    """
+    Обновляет категорию и название рецепта в рейтингах после фиксации
+    транзакции
+    """
+    recipe = (instance.pk, instance.recipe_category_id, instance.name)
+    transaction.on_commit(lambda: leaderboards.set_recipe(*recipe))
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_leaderboards_recipe(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: leaderboards.remove_recipe(pk))
+
+
+@receiver(recipe_votes_changed)
+def update_leaderboards_votes(sender, recipe_id, voter_turnout_delta, full_score_delta,
+                              **kwargs):
+    """
+    Перемещает рецепт в рейтингах после фиксации изменения его голосов
+    """
+    votes = (recipe_id, voter_turnout_delta, full_score_delta)
+    transaction.on_commit(lambda: leaderboards.apply_votes(*votes))
+
+
+@receiver(post_delete, sender=UserRecipeScore)
+def retract_vote(sender, instance, **kwargs):
+    """
+    Убирает оценку из рейтинга рецепта (в т.ч. при каскадном удалении)
+    """
+    apply_votes(instance.recipe_id, -1, -instance.score)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recompute_recipe_stats(sender, instance, raw, **kwargs):
+    """
+    Пересчитывает калорийность и крепость рецепта (и рецепта, из которого
+    ингредиент перенесен)
+    """
+    if raw:
+        return
+    recipe_ids = {instance.recipe_id, instance.get_loaded_value('recipe_id')}
+    recipe_ids.discard(None)
+    schedule_recompute(recipe_ids)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recompute_recipe_stats_on_delete(sender, instance, **kwargs):
+    schedule_recompute({instance.recipe_id})
+
+
+@receiver(post_save, sender=Ingredient)
+def recompute_ingredient_recipes_stats(sender, instance, created, raw, **kwargs):
+    """
+    Пересчитывает все рецепты с ингредиентом при изменении его калорийности
+    или крепости
+    """
+    if raw or created:
+        return
+    changed = any(
+        getattr(instance, name) != instance.get_loaded_value(name)
+        for name in Ingredient.loaded_values_fields
+    )
+    if changed:
+        pk = instance.pk
+        transaction.on_commit(lambda: recompute_recipes_with_ingredients([pk]))
+
+
+@receiver(recipe_ingredients_changed)
+def update_changed_recipes(sender, recipe_ids, **kwargs):
+    """
+    Обновляет индекс и пересчитывает калорийность и крепость рецептов
+    после массового изменения их ингредиентов, один раз на рецепт
+    """
+    recipe_ids = set(recipe_ids)
+    transaction.on_commit(lambda: ingredient_index.refresh_recipes(recipe_ids))
+    schedule_recompute(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_scaled_recipe(sender, instance, **kwargs):
+    """
+    Сбрасывает рецепт, пересчитанный на другое число порций
+    (recipes.scaling), после фиксации транзакции
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: bump_object_generations(Recipe, [pk]))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_scaled_recipe_ingredients(sender, instance, **kwargs):
+    recipe_ids = {instance.recipe_id, instance.get_loaded_value('recipe_id')}
+    recipe_ids.discard(None)
+    transaction.on_commit(lambda: bump_object_generations(Recipe, recipe_ids))
+
+
+@receiver(recipe_ingredients_changed)
+def invalidate_scaled_changed_recipes(sender, recipe_ids, **kwargs):
+    recipe_ids = set(recipe_ids)
+    transaction.on_commit(lambda: bump_object_generations(Recipe, recipe_ids))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_similarity_recipe(sender, instance, **kwargs):
+    """
+    Отмечает рецепт (и рецепт, из которого ингредиент перенесен) для
+    перечитывания в матрице похожести по составу после фиксации транзакции
+    """
+    recipe_ids = {instance.recipe_id, instance.get_loaded_value('recipe_id')}
+    recipe_ids.discard(None)
+    transaction.on_commit(lambda: ingredient_similarity.refresh_recipes(recipe_ids))
+
+
+@receiver(recipe_ingredients_changed)
+def refresh_similarity_changed_recipes(sender, recipe_ids, **kwargs):
+    recipe_ids = set(recipe_ids)
+    transaction.on_commit(lambda: ingredient_similarity.refresh_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Measure)
+def update_measure_conversion(sender, instance, created, raw, **kwargs):
+    """
+    Сбрасывает таблицу перевода единиц и пересчитывает рецепты с единицей
+    измерения при изменении ее величины или коэффициента
+    """
+    transaction.on_commit(conversion_table.invalidate)
+    if raw or created:
+        return
+    changed = any(
+        getattr(instance, name) != instance.get_loaded_value(name)
+        for name in Measure.loaded_values_fields
+    )
+    if changed:
+        pk = instance.pk
+        transaction.on_commit(lambda: recompute_recipes_with_measures([pk]))
+        # Доли ингредиентов зависят от перевода в базовые единицы
+        transaction.on_commit(ingredient_similarity.invalidate)
+
+
+@receiver(post_delete, sender=Measure)
+def delete_measure_conversion(sender, instance, **kwargs):
+    transaction.on_commit(conversion_table.invalidate)
+
+
+@receiver(post_save, sender=Measure)
+@receiver(post_delete, sender=Measure)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=RecipeCategory)
+@receiver(post_delete, sender=RecipeCategory)
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Сбрасывает закешированные ответы справочников после фиксации транзакции
+    (иначе конкурентный запрос может снова закешировать старые данные)
+    """
+    transaction.on_commit(lambda: bump_generation(sender))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeCategory)
+def index_name(sender, instance, **kwargs):
+    """
+    Обновляет название в поисковом индексе после фиксации транзакции
+    """
+    index = get_search_index(sender)
+    item = (instance.pk, instance.name)
+    transaction.on_commit(lambda: index.update(*item))
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=RecipeCategory)
+def unindex_name(sender, instance, **kwargs):
+    """
+    Удаляет объект из поискового индекса после фиксации транзакции
+    """
+    index = get_search_index(sender)
+    pk = instance.pk
+    transaction.on_commit(lambda: index.remove(pk))
+
+
+@receiver(connection_created)
+def reset_similarity_threshold(sender, connection, **kwargs):
+    """
+    В новой сессии БД порог pg_trgm еще не установлен (см.
+    recipes.search.set_similarity_threshold)
+    """
+    setattr(connection, THRESHOLD_ATTRIBUTE, None)
@@ -0,0 +1,282 @@
+import threading
+import time
+from itertools import groupby
+from operator import itemgetter
+from statistics import median
+
+import numpy as np
+from scipy import sparse
+
+from config.app_settings import get_app_settings
+
+from .models import Measure, RecipeIngredient
+from .ranking import get_top
+from .units import conversion_table
+
+
+DEFAULT_SIMILARITY_SETTINGS = {
+    # Похожесть по умолчанию, ниже которой рецепты не возвращаются: чем она
+    # больше, тем меньше инвертированных списков просматривается
+    'MIN_SIMILARITY': 0.2,
+    # Сколько рецептов может измениться после построения матрицы, прежде
+    # чем она будет перестроена
+    'MAX_CHANGES': 1000,
+    # Время жизни в секундах (None - без ограничения): изменения из других
+    # процессов становятся видны после перестроения
+    'TTL': 300,
+}
+
+SIMILARITY_METHODS = ('jaccard', 'weighted')
+
+WEIGHED_DIMENSIONS = (Measure.Dimension.MASS, Measure.Dimension.VOLUME)
+
+# Допуск сравнения сумм весов с порогом (ошибки округления float)
+EPSILON = 1e-9
+
+
+def get_similarity_settings():
+    return get_app_settings('RECIPES_INGREDIENT_SIMILARITY', DEFAULT_SIMILARITY_SETTINGS)
+
+
+def get_weights(rows):
+    """
+    Доли ингредиентов рецепта по количеству для списка строк
+    (ingredient_id, measure_id, amount): словарь ingredient_id -> доля,
+    сумма долей - 1.
+
+    Количество переводится в базовые единицы, граммы и миллилитры считаются
+    равноценными (как в recipes.nutrition). Ингредиентам в штуках и без
+    количества назначается медиана остальных, а если таких нет - всем
+    поровну.
+    """
+    converted = conversion_table.to_base((amount, measure_id) for _, measure_id, amount in rows)
+    weights = {}
+    unknown = []
+    for (ingredient_id, _, _), (amount, dimension) in zip(rows, converted):
+        if dimension in WEIGHED_DIMENSIONS and amount > 0:
+            weights[ingredient_id] = weights.get(ingredient_id, 0) + float(amount)
+        else:
+            unknown.append(ingredient_id)
+    fill = median(weights.values()) if weights else 1.0
+    for ingredient_id in unknown:
+        if ingredient_id not in weights:
+            weights[ingredient_id] = fill
+    total = sum(weights.values())
+    return {ingredient_id: weight / total for ingredient_id, weight in weights.items()}
+
+
+class IngredientSimilarity:
+    """
+    Похожесть рецептов по составу, живущая в памяти процесса:
+    jaccard - |A ∩ B| / |A ∪ B| по множествам ингредиентов,
+    weighted - взвешенная мера Жаккара по долям ингредиентов (get_weights):
+    sum(min(a, b)) / sum(max(a, b)).
+
+    Рецепты хранятся разреженной матрицей рецепты x ингредиенты (CSR для
+    строк рецептов и CSC - инвертированные списки рецептов ингредиентов).
+    Кандидаты берутся только из списков самых редких ингредиентов рецепта:
+    просматривается столько списков, чтобы у рецепта вне их общая часть
+    с образцом была заведомо меньше нужной для min_similarity. Поэтому
+    время запроса зависит от длины этих списков, а не от числа рецептов.
+
+    Строится лениво при первом обращении. Рецепты, ингредиенты которых
+    изменились (сигналы RecipeIngredient, см. recipes.signals),
+    перечитываются одним запросом при следующем обращении и до
+    перестроения хранятся отдельно от матрицы.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._reset()
+
+    def _is_fresh(self):
+        if self._built_at is None:
+            return False
+        ttl = get_similarity_settings()['TTL']
+        return ttl is None or time.monotonic() - self._built_at < ttl
+
+    def _ensure_built(self):
+        if not self._is_fresh():
+            with self._lock:
+                if not self._is_fresh():
+                    self._build()
+
+    def _reset(self):
+        self._built_at = None
+        # Номер строки -> id рецепта (по возрастанию)
+        self._recipe_ids = np.zeros(0, dtype=np.int64)
+        # Номер столбца -> id ингредиента (по возрастанию)
+        self._ingredient_ids = np.zeros(0, dtype=np.int64)
+        # Матрица рецепты x ингредиенты с долями (CSR) и она же в CSC
+        self._rows = sparse.csr_matrix((0, 0))
+        self._columns = sparse.csc_matrix((0, 0))
+        # Число ингредиентов рецепта каждой строки
+        self._sizes = np.zeros(0, dtype=np.int64)
+        # Строки рецептов, измененных после построения (их доли - в _changed)
+        self._stale = np.zeros(0, dtype=bool)
+        # recipe_id -> {ingredient_id: доля} рецептов, измененных после построения
+        self._changed = {}
+        # Рецепты, которые нужно перечитать из БД
+        self._pending = set()
+
+    def _read(self, recipe_ids=None):
+        rows = RecipeIngredient.objects.order_by('recipe_id')
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__any=list(recipe_ids))
+        rows = rows.values_list('recipe_id', 'ingredient_id', 'measure_id', 'amount')
+        for recipe_id, recipe_rows in groupby(rows.iterator(), key=itemgetter(0)):
+            yield recipe_id, get_weights([row[1:] for row in recipe_rows])
+
+    def _build(self):
+        self._reset()
+        recipe_ids, ingredient_ids, weights = [], [], []
+        for recipe_id, recipe_weights in self._read():
+            recipe_ids.extend([recipe_id] * len(recipe_weights))
+            ingredient_ids.extend(recipe_weights.keys())
+            weights.extend(recipe_weights.values())
+        self._recipe_ids, rows = np.unique(
+            np.array(recipe_ids, dtype=np.int64), return_inverse=True)
+        self._ingredient_ids, columns = np.unique(
+            np.array(ingredient_ids, dtype=np.int64), return_inverse=True)
+        shape = (len(self._recipe_ids), len(self._ingredient_ids))
+        self._rows = sparse.csr_matrix(
+            (np.array(weights, dtype=np.float64), (rows, columns)), shape=shape)
+        self._columns = self._rows.tocsc()
+        self._sizes = np.diff(self._rows.indptr)
+        self._stale = np.zeros(len(self._recipe_ids), dtype=bool)
+        self._built_at = time.monotonic()
+
+    def _find(self, ids, sorted_ids):
+        # Позиции ids в sorted_ids, -1 - нет
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(sorted_ids, ids)
+        positions[positions == len(sorted_ids)] = 0
+        found = (len(sorted_ids) > 0) & (sorted_ids[positions] == ids)
+        return np.where(found, positions, -1)
+
+    def _refresh(self):
+        pending, self._pending = self._pending, set()
+        if len(self._changed.keys() | pending) > get_similarity_settings()['MAX_CHANGES']:
+            self._build()
+            return
+        for recipe_id in pending:
+            self._changed[recipe_id] = {}
+        self._changed.update(self._read(pending))
+        rows = self._find(list(pending), self._recipe_ids)
+        self._stale[rows[rows >= 0]] = True
+
+    def invalidate(self):
+        """
+        Сбрасывает матрицу, она будет перестроена при следующем обращении
+        """
+        with self._lock:
+            self._reset()
+
+    def refresh_recipes(self, recipe_ids):
+        """
+        Отмечает рецепты, ингредиенты которых изменились (или которые
+        удалены): они будут перечитаны из БД при следующем обращении
+        """
+        with self._lock:
+            if self._built_at is not None:
+                self._pending.update(recipe_ids)
+
+    def _get_recipe(self, recipe_id):
+        # Доли ингредиентов рецепта: {ingredient_id: доля}
+        if recipe_id in self._changed:
+            return self._changed[recipe_id]
+        row = self._find([recipe_id], self._recipe_ids)[0]
+        if row < 0:
+            return {}
+        begin, end = self._rows.indptr[row], self._rows.indptr[row + 1]
+        return dict(zip(self._ingredient_ids[self._rows.indices[begin:end]].tolist(),
+                        self._rows.data[begin:end].tolist()))
+
+    def get_similar(self, recipe_id, limit, method='jaccard', min_similarity=None):
+        """
+        Возвращает до limit пар [recipe_id, похожесть] рецептов, похожих на
+        рецепт recipe_id по составу (method - одно из SIMILARITY_METHODS),
+        с похожестью не ниже min_similarity (None - MIN_SIMILARITY), по
+        убыванию похожести, при равной - по возрастанию id
+        """
+        if min_similarity is None:
+            min_similarity = get_similarity_settings()['MIN_SIMILARITY']
+        self._ensure_built()
+        with self._lock:
+            if self._pending:
+                self._refresh()
+            recipe = self._get_recipe(recipe_id)
+            if not recipe:
+                return []
+            ids, values = self._score(recipe_id, recipe, method, min_similarity)
+        keep = values >= min_similarity - EPSILON
+        return get_top(ids[keep], np.round(values[keep], 4), limit)
+
+    def _score(self, recipe_id, recipe, method, min_similarity):
+        weighted = method == 'weighted'
+        ingredient_ids = np.array(sorted(recipe), dtype=np.int64)
+        weights = np.array([recipe[pk] for pk in ingredient_ids.tolist()])
+        size = len(ingredient_ids)
+        # Вклад каждого ингредиента в общую часть и общая часть, нужная для
+        # min_similarity: по числу ингредиентов |A ∩ B| >= t * |A|, по долям
+        # из S / (2 - S) >= t следует S = sum(min(a, b)) >= 2t / (1 + t)
+        if weighted:
+            masses = weights
+            required = 2 * min_similarity / (1 + min_similarity)
+        else:
+            masses = np.ones(size)
+            required = min_similarity * size
+
+        columns = self._find(ingredient_ids, self._ingredient_ids)
+        known = columns >= 0
+        indptr = self._columns.indptr
+        lengths = np.zeros(size, dtype=np.int64)
+        lengths[known] = indptr[columns[known] + 1] - indptr[columns[known]]
+        # Списки просматриваются от коротких, пока у рецепта вне
+        # просмотренных списков общая часть не станет заведомо меньше нужной
+        order = np.argsort(lengths, kind='stable')
+        remaining = masses.sum() - np.cumsum(masses[order])
+        probed = order[:np.searchsorted(-remaining, -(required - EPSILON)) + 1]
+        probed = columns[probed][known[probed]]
+
+        rows = np.unique(np.concatenate(
+            [self._columns.indices[indptr[column]:indptr[column + 1]] for column in probed]
+            or [np.zeros(0, dtype=np.int32)]))
+        rows = rows[~self._stale[rows] & (self._recipe_ids[rows] != recipe_id)]
+        if not weighted and min_similarity > 0:
+            # |B| при |A ∩ B| / |A ∪ B| >= t лежит в [t |A|, |A| / t]
+            sizes = self._sizes[rows]
+            rows = rows[(sizes >= min_similarity * size - EPSILON)
+                        & (sizes <= size / min_similarity + EPSILON)]
+
+        candidates = self._rows[rows][:, columns[known]]
+        if weighted:
+            candidates.data = np.minimum(candidates.data, weights[known][candidates.indices])
+            common = np.asarray(candidates.sum(axis=1)).ravel()
+            values = common / (2 - common)
+        else:
+            common = np.diff(candidates.indptr)
+            values = common / (size + self._sizes[rows] - common)
+        ids = self._recipe_ids[rows]
+
+        # Рецепты, измененные после построения, сравниваются по отдельности
+        changed_ids, changed_values = [], []
+        for pk, other in self._changed.items():
+            if pk == recipe_id or not other or recipe.keys().isdisjoint(other):
+                continue
+            if weighted:
+                common = sum(min(weight, other[ingredient_id])
+                             for ingredient_id, weight in recipe.items()
+                             if ingredient_id in other)
+                value = common / (2 - common)
+            else:
+                common = len(recipe.keys() & other.keys())
+                value = common / (size + len(other) - common)
+            changed_ids.append(pk)
+            changed_values.append(value)
+        return (np.concatenate([ids, np.array(changed_ids, dtype=np.int64)]),
+                np.concatenate([values, np.array(changed_values, dtype=np.float64)]))
+
+
+ingredient_similarity = IngredientSimilarity()
@@ -1,3 +1,1682 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import re
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, transaction
+from django.db.models import CharField
+from django.test import LiveServerTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from metrics.registry import db_queries
+
+from . import async_views
+from .benchmarks import ApiBenchmark, ConcurrencyBenchmark
+from .importer import CatalogImportError, CatalogLoader, iter_records
+from .indexes import ingredient_index
+from .leaderboards import LEADERBOARD_KINDS, get_leaderboard_settings, leaderboards
+from .pantry import PantryError, canonical_pantry, pantry_cache, parse_pantry
+from .recommendations import build_neighbors
+from .scaling import scale_amount
+from .search import get_search_settings, search_indexes, set_similarity_threshold
+from .signals import reset_similarity_threshold
+from .similarity import (
+    SIMILARITY_METHODS, get_similarity_settings, get_weights, ingredient_similarity
+)
+from .units import ConversionError, conversion_table
+from .votes import vote_buffer
+from .models import (
+    CatalogImport,
+    Measure,
+    Ingredient,
+    RecipeCategory,
+    Recipe,
+    RecipeIngredient,
+    RecipeNeighbors,
+    UserRecipeScore
+)
+
+
+User = get_user_model()
+
+
+class CatalogTestMixin:
+    """
+    Заполняет БД небольшим каталогом рецептов
+    """
+    recipes_count = 20
+    ingredients_per_recipe = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', password='password')
+        cls.measure = Measure.objects.create(name='ml')
+        cls.category = RecipeCategory.objects.create(name='cocktail')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ingredient {i}')
+            for i in range(cls.recipes_count + cls.ingredients_per_recipe)
+        ]
+        cls.recipes = []
+        for i in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                recipe_category=cls.category,
+                name=f'recipe {i}',
+                cook_time='00:10:00',
+            )
+            for ingredient in cls.ingredients[i:i + cls.ingredients_per_recipe]:
+                RecipeIngredient.objects.create(
+                    author=cls.user,
+                    recipe=recipe,
+                    measure=cls.measure,
+                    ingredient=ingredient,
+                    amount=Decimal('10'),
+                )
+            UserRecipeScore.objects.create(user=cls.user, recipe=recipe, score=5)
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        # Сигналы индекса и кеша срабатывают только после фиксации
+        # транзакции, поэтому в TestCase индексы перестраиваются по данным
+        # теста, а кеш ответов очищается
+        ingredient_index.rebuild()
+        leaderboards.invalidate()
+        ingredient_similarity.invalidate()
+        for index in search_indexes.values():
+            index.invalidate()
+        cache.clear()
+
+
+class QueryCountTest(CatalogTestMixin, APITestCase):
+    """
+    Число SQL запросов каждого эндпоинта не зависит от числа объектов
+    """
+
+    def get_endpoints(self):
+        recipe = self.recipes[0]
+        pantry = '&'.join(f'ingredient={i.pk}' for i in self.ingredients)
+        recipes = '&'.join(f'recipe={r.pk}' for r in self.recipes)
+        # (url, число запросов)
+        return [
+            ('/api/v1/measure/', 2),
+            ('/api/v1/ingredient/', 2),
+            ('/api/v1/recipe_category/', 2),
+            ('/api/v1/recipe/', 2),
+            ('/api/v1/recipe/?page=1', 3),
+            (f'/api/v1/recipe/{recipe.pk}/', 2),
+            (f'/api/v1/recipe/available_by_ingredients/?{pantry}', 2),
+            (f'/api/v1/recipe/closest_by_ingredients/?{pantry}&limit=100', 2),
+            (f'/api/v1/recipe/{recipe.pk}/missed_ingredients/?{pantry}', 2),
+            (f'/api/v1/recipe/shopping_list/?{recipes}&{pantry}', 1),
+            ('/api/v1/recipe/cook_time/?cook_time=00:10:00', 2),
+            ('/api/v1/recipe_ingredient/', 2),
+            ('/api/v1/user_recipe_rating/', 1),
+            ('/api/v1/user_recipe_rating/?page=1', 2),
+        ]
+
+    def test_query_count(self):
+        for url, num_queries in self.get_endpoints():
+            with self.subTest(url=url), self.assertNumQueries(num_queries):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class CursorPaginationTest(CatalogTestMixin, APITestCase):
+    """
+    Keyset-пагинация возвращает все записи ровно по одному разу
+    """
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.data)
+            pages.append([item['id'] for item in response.data['results']])
+            url = response.data[direction]
+        return pages
+
+    def test_pages_complete_without_overlap(self):
+        # Несколько записей с одинаковым created_at: порядок среди них задает id
+        created_at = self.recipes[0].created_at
+        Recipe.objects.filter(pk__in=[recipe.pk for recipe in self.recipes[::2]]).update(
+            created_at=created_at)
+        UserRecipeScore.objects.update(created_at=created_at)
+        for url, model in (('/api/v1/recipe/', Recipe),
+                           ('/api/v1/user_recipe_rating/', UserRecipeScore)):
+            expected = list(model.objects.order_by('-created_at', '-id').values_list(
+                'pk', flat=True))
+            for page_size in (1, 3, len(expected)):
+                with self.subTest(url=url, page_size=page_size):
+                    pages = self.walk(f'{url}?page_size={page_size}')
+                    self.assertEqual(sum(pages, []), expected)
+                    self.assertTrue(all(len(page) == page_size for page in pages[:-1]))
+                    # Обратный проход по ссылкам previous дает те же страницы
+                    last = self.client.get(f'{url}?page_size={page_size}')
+                    while last.data['next']:
+                        last = self.client.get(last.data['next'])
+                    backward = self.walk(last.data['previous'], 'previous')
+                    self.assertEqual(sum(reversed(backward), []) + pages[-1], expected)
+        for cursor in ('x', 'cD1bMV0=', 'cD1bIngiLCAieCJd'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/v1/recipe/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_cook_time(self):
+        url = '/api/v1/recipe/cook_time/'
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(cook_time='01:00:00')
+        expected = list(Recipe.objects.filter(cook_time__lte='00:30').order_by(
+            '-created_at', '-id').values_list('pk', flat=True))
+        pages = self.walk(f'{url}?cook_time=00:30&page_size=7')
+        self.assertEqual(sum(pages, []), expected)
+        self.assertNotIn(self.recipes[0].pk, expected)
+        for params in ({}, {'cook_time': ''}, {'cook_time': 'abc'}, {'cook_time': '25:00'}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cook_time', response.data)
+
+
+class ResponseCacheTest(CatalogTestMixin, APITestCase):
+    """
+    Кеширование ответов справочников
+    """
+    url = '/api/v1/ingredient/'
+
+    def test_cache_hit_skips_database(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], etag)
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_save_invalidates_cache(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='new ingredient')
+        response = self.client.get(self.url)
+        self.assertIn('new ingredient', response.content.decode())
+
+
+class QueryPlanTest(CatalogTestMixin, APITestCase):
+    """
+    Запросы RecipeQuerySet читают таблицы по индексам, а не целиком
+    """
+
+    def get_querysets(self):
+        ingredient_ids = [ingredient.pk for ingredient in self.ingredients[:3]]
+        recipe_ids = [recipe.pk for recipe in self.recipes[:3]]
+        return {
+            'with_unlikeness': Recipe.objects.with_unlikeness(ingredient_ids),
+            'get_available_by_ingredients':
+                Recipe.objects.get_available_by_ingredients(ingredient_ids),
+            'get_available_by_ingredient_ids':
+                Recipe.objects.get_available_by_ingredient_ids(ingredient_ids, 100),
+            'get_by_cook_time': Recipe.objects.get_by_cook_time('00:10:00'),
+            'with_ingredients': RecipeIngredient.objects.filter(recipe_id__in=recipe_ids),
+            'list': Recipe.objects.all()[:100],
+        }
+
+    def get_sequential_scans(self, queryset):
+        """
+        Возвращает таблицы, которые план запроса читает последовательно
+        """
+        if connection.vendor == 'postgresql':
+            # На маленьких таблицах планировщик предпочитает Seq Scan, даже
+            # когда подходящий индекс есть
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return re.findall(r'Seq Scan on (\w+)', queryset.explain())
+        if connection.vendor == 'sqlite':
+            # Полный обход индекса (SCAN ... USING INDEX) для сортировки
+            # последовательным чтением таблицы не считается
+            return re.findall(r'\bSCAN (?:TABLE )?(\w+)\s*$', queryset.explain(), re.M)
+        self.skipTest(f'EXPLAIN для {connection.vendor} не поддерживается')
+
+    def test_no_sequential_scans(self):
+        for name, queryset in self.get_querysets().items():
+            with self.subTest(name):
+                self.assertEqual(self.get_sequential_scans(queryset), [])
+
+
+class RatingTest(CatalogTestMixin, APITestCase):
+    """
+    Агрегация голосов в рейтинг рецепта
+    """
+
+    def test_rating_follows_votes(self):
+        recipe = self.recipes[0]
+        other = User.objects.create_user(username='other', password='password')
+        score = UserRecipeScore.objects.create(user=other, recipe=recipe, score=8)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (2, 13))
+        self.assertEqual(recipe.rating, Decimal('6.50'))
+
+        score.score = 9
+        score.save()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (2, 14))
+        self.assertEqual(recipe.rating, Decimal('7.00'))
+
+        score.delete()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (1, 5))
+        self.assertEqual(recipe.rating, Decimal('5.00'))
+
+    def test_recipe_save_keeps_votes(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        other = User.objects.create_user(username='other', password='password')
+        UserRecipeScore.objects.create(user=other, recipe=recipe, score=10)
+        recipe.name = 'renamed'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (2, 15))
+
+    def test_stale_instances_do_not_lose_updates(self):
+        # Голоса применяются приращениями в UPDATE, а не значениями,
+        # прочитанными в Python, поэтому устаревшие экземпляры рецепта
+        # и оценки не затирают чужие голоса
+        recipe = self.recipes[0]
+        stale_recipes = [Recipe.objects.get(pk=recipe.pk) for _ in range(2)]
+        voters = [User.objects.create(username=f'voter {i}') for i in range(2)]
+        with CaptureQueriesContext(connection) as queries:
+            UserRecipeScore.objects.create(user=voters[0], recipe=stale_recipes[0], score=8)
+        update, = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertIn('"recipe"."voter_turnout", 0) + 1', update)
+        self.assertIn('"recipe"."full_score", 0) + 8', update)
+        UserRecipeScore.objects.create(user=voters[1], recipe=stale_recipes[1], score=2)
+
+        first, second = [UserRecipeScore.objects.get(user=voters[0]) for _ in range(2)]
+        first.score = 10
+        first.save()
+        second.score = 4
+        second.save()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (3, 11))
+        self.assertEqual(recipe.rating, Decimal('3.67'))
+
+    @override_settings(RECIPES_VOTE_BUFFER={
+        'ENABLED': True, 'FLUSH_INTERVAL': None, 'MAX_LAG': None})
+    def test_vote_buffer(self):
+        recipe = self.recipes[0]
+        voters = [User.objects.create(username=f'voter {i}') for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            for voter in voters:
+                UserRecipeScore.objects.create(user=voter, recipe=recipe, score=9)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (1, 5))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(vote_buffer.flush(), 1)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.voter_turnout, recipe.full_score), (4, 32))
+        self.assertEqual(recipe.rating, Decimal('8.00'))
+
+
+class NutritionTest(CatalogTestMixin, APITestCase):
+    """
+    Пересчет калорийности и крепости рецептов по ингредиентам
+    """
+
+    def get_stats(self, *indexes):
+        stats = {pk: (food_energy, alcohol_by_volume)
+                 for pk, food_energy, alcohol_by_volume in Recipe.objects.values_list(
+                     'pk', 'food_energy', 'alcohol_by_volume')}
+        return [stats[self.recipes[i].pk] for i in indexes]
+
+    def set_ingredient(self, i, **values):
+        ingredient = Ingredient.objects.get(pk=self.ingredients[i].pk)
+        for name, value in values.items():
+            setattr(ingredient, name, value)
+        ingredient.save()
+
+    def count_recipe_updates(self, queries):
+        return sum(query['sql'].startswith('UPDATE "recipe"') for query in queries)
+
+    def test_ingredient_change_fans_out(self):
+        # Одно изменение ингредиента пересчитывает все его рецепты одним UPDATE
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.set_ingredient(0, food_energy=Decimal('1'))
+            self.set_ingredient(1, food_energy=Decimal('3'))
+            self.set_ingredient(2, alcohol_by_volume=Decimal('40'))
+        self.assertEqual(self.count_recipe_updates(queries), 3)
+        self.assertEqual(self.get_stats(0, 1, 2, 3), [
+            (Decimal('2.00'), Decimal('13.33')),
+            (Decimal('3.00'), Decimal('13.33')),
+            (None, Decimal('13.33')),
+            (None, None),
+        ])
+        # Без изменения значений пересчета нет
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.set_ingredient(0, name='renamed')
+        self.assertEqual(self.count_recipe_updates(queries), 0)
+
+    def test_recipe_ingredient_changes_recompute_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_ingredient(0, food_energy=Decimal('1'))
+            self.set_ingredient(1, food_energy=Decimal('3'))
+        rows = {row.ingredient_id: row for row in self.recipes[0].recipe_ingredients.all()}
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            row = rows[self.ingredients[0].pk]
+            row.amount = Decimal('30')
+            row.save()
+            # Строка переносится в другой рецепт: пересчитываются оба
+            row = rows[self.ingredients[1].pk]
+            row.recipe = self.recipes[5]
+            row.save()
+        self.assertEqual(self.count_recipe_updates(queries), 1)
+        self.assertEqual(self.get_stats(0, 5),
+                         [(Decimal('1.00'), None), (Decimal('3.00'), None)])
+
+        with CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            rows[self.ingredients[0].pk].delete()
+        self.assertEqual(self.count_recipe_updates(queries), 1)
+        self.assertEqual(self.get_stats(0), [(None, None)])
+
+    def test_savepoint_rollback(self):
+        row = self.recipes[0].recipe_ingredients.get(ingredient=self.ingredients[0])
+        pk = row.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_ingredient(0, food_energy=Decimal('1'))
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        row.delete()
+                        raise DatabaseError
+                except DatabaseError:
+                    pass
+                self.set_ingredient(0, food_energy=Decimal('2'))
+        self.assertEqual(self.get_stats(0), [(Decimal('2.00'), None)])
+        self.assertTrue(RecipeIngredient.objects.filter(pk=pk).exists())
+
+        # Следующая транзакция снова планирует пересчет
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.get(pk=pk).delete()
+        self.assertEqual(self.get_stats(0), [(None, None)])
+
+    def test_recompute_command(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.set_ingredient(0, food_energy=Decimal('1'))
+            self.set_ingredient(2, alcohol_by_volume=Decimal('40'))
+        expected = self.get_stats(*range(len(self.recipes)))
+        Recipe.objects.update(food_energy=None, alcohol_by_volume=None)
+        call_command('recompute_recipe_stats', chunk_size=3, stdout=io.StringIO())
+        self.assertEqual(self.get_stats(*range(len(self.recipes))), expected)
+
+        # Продолжение прерванного пересчета не трогает рецепты до start_id
+        Recipe.objects.update(food_energy=None, alcohol_by_volume=None)
+        call_command('recompute_recipe_stats', start_id=self.recipes[1].pk,
+                     stdout=io.StringIO())
+        self.assertEqual(self.get_stats(0, 1, 2),
+                         [(None, None), expected[1], expected[2]])
+
+
+class RecipeIngredientBulkTest(CatalogTestMixin, APITestCase):
+    """
+    Массовое создание и обновление ингредиентов рецептов
+    """
+    url = '/api/v1/recipe_ingredient/bulk/'
+
+    def get_payload(self, recipe, ingredients):
+        return [
+            {'recipe': recipe.pk, 'measure': self.measure.pk,
+             'ingredient': ingredient.pk, 'amount': '10'}
+            for ingredient in ingredients
+        ]
+
+    def test_query_count(self):
+        self.client.force_authenticate(self.user)
+        for recipe, size in ((self.recipes[0], 1), (self.recipes[1], 20)):
+            # Без RETURNING строки вставляются по одной
+            queries = 6 if connection.features.can_return_rows_from_bulk_insert else 5 + size
+            with self.subTest(size=size), self.assertNumQueries(queries):
+                response = self.client.post(
+                    self.url, self.get_payload(recipe, self.ingredients[-size:]),
+                    format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+
+    def test_create_and_update(self):
+        self.client.force_authenticate(self.user)
+        recipe = self.recipes[0]
+        row = recipe.recipe_ingredients.first()
+        payload = self.get_payload(recipe, self.ingredients[-2:])
+        payload.append({**self.get_payload(recipe, [row.ingredient])[0],
+                        'id': row.pk, 'amount': '25'})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(recipe.recipe_ingredients.count(), 5)
+        rows = RecipeIngredient.objects.filter(pk__in=[item['id'] for item in response.data])
+        self.assertEqual(
+            sorted((item['id'], item['ingredient'], Decimal(item['amount']))
+                   for item in response.data),
+            sorted(rows.values_list('pk', 'ingredient_id', 'amount')))
+        row.refresh_from_db()
+        self.assertEqual(row.amount, Decimal('25'))
+        pantry = [i.pk for i in self.ingredients[:3] + self.ingredients[-2:]]
+        self.assertIn(recipe.pk, ingredient_index.get_available(pantry))
+
+    def test_invalid_items_are_rejected(self):
+        self.client.force_authenticate(self.user)
+        payload = self.get_payload(self.recipes[0], self.ingredients[:1])
+        payload[0]['ingredient'] = 0
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(RecipeIngredient.objects.count(), 60)
+
+    def test_created_ids_with_repeated_ingredients(self):
+        self.client.force_authenticate(self.user)
+        recipe = self.recipes[0]
+        payload = self.get_payload(recipe, self.ingredients[:2] * 2)
+        for index, item in enumerate(payload):
+            item['amount'] = str(index + 1)
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        ids = [item['id'] for item in response.data]
+        self.assertNotIn(None, ids)
+        self.assertEqual(
+            dict(RecipeIngredient.objects.filter(pk__in=ids).values_list('pk', 'amount')),
+            {pk: Decimal(index + 1) for index, pk in enumerate(ids)})
+
+    def test_update_requires_owner(self):
+        other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(other)
+        row = self.recipes[0].recipe_ingredients.first()
+        payload = [{**self.get_payload(self.recipes[0], [row.ingredient])[0],
+                    'id': row.pk, 'amount': '25'}]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class MeasureConvertTest(APITestCase):
+    """
+    Перевод количества между единицами измерения
+    """
+    url = '/api/v1/measure/convert/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gram = Measure.objects.create(name='g', dimension=Measure.Dimension.MASS)
+        cls.kilogram = Measure.objects.create(
+            name='kg', dimension=Measure.Dimension.MASS, factor=Decimal('1000'))
+        cls.piece = Measure.objects.create(name='pcs', dimension=Measure.Dimension.COUNT)
+        cls.pinch = Measure.objects.create(name='pinch')
+
+    def setUp(self):
+        conversion_table.invalidate()
+
+    def convert(self, amount, from_measure, to_measure):
+        return self.client.get(self.url, {'amount': amount, 'from_measure': from_measure.pk,
+                                          'to_measure': to_measure.pk})
+
+    def test_convert(self):
+        response = self.convert('1.5', self.kilogram, self.gram)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data, {'amount': '1500.00', 'measure': self.gram.pk})
+        self.assertEqual(self.convert('250', self.gram, self.kilogram).data['amount'], '0.25')
+        self.assertEqual(self.convert('0', self.gram, self.kilogram).data['amount'], '0.00')
+        # Единица без величины переводится только сама в себя
+        self.assertEqual(self.convert('2', self.pinch, self.pinch).data['amount'], '2.00')
+
+    def test_incompatible_measures(self):
+        for from_measure, to_measure in ((self.gram, self.piece), (self.pinch, self.gram)):
+            with self.subTest(from_measure=from_measure.name, to_measure=to_measure.name):
+                response = self.convert('1', from_measure, to_measure)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('measure', response.data)
+        with self.assertRaises(ConversionError):
+            conversion_table.convert(Decimal('1'), self.piece.pk, self.kilogram.pk)
+
+    def test_to_base(self):
+        self.assertEqual(
+            conversion_table.to_base([('250', self.gram.pk), ('2', self.pinch.pk)]),
+            [(Decimal('250') * self.gram.factor, self.gram.dimension),
+             (Decimal('2') * self.pinch.factor, None)])
+        with self.assertRaisesRegex(ConversionError, '0'):
+            conversion_table.to_base([('1', self.gram.pk), ('1', 0)])
+
+    def test_invalid_amount(self):
+        for amount in ('', 'x', 'Infinity', '-Infinity', 'NaN', 'sNaN', '-1', '1e30'):
+            with self.subTest(amount=amount):
+                response = self.convert(amount, self.kilogram, self.gram)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('amount', response.data)
+
+
+class OwnershipTest(CatalogTestMixin, APITestCase):
+    """
+    Права владельцев и списки объектов текущего пользователя
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', password='password')
+
+    def test_owner_can_update(self):
+        recipe = self.recipes[0]
+        rating = recipe.user_recipe_ratings.get()
+        self.client.force_authenticate(self.other)
+        response = self.client.patch(f'/api/v1/recipe/{recipe.pk}/', {'name': 'other'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.patch(f'/api/v1/user_recipe_rating/{rating.pk}/', {'score': 1})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/v1/recipe/{recipe.pk}/', {'name': 'mine'})
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.client.patch(f'/api/v1/user_recipe_rating/{rating.pk}/', {'score': 1})
+        self.assertEqual(response.status_code, 200, response.data)
+
+    def test_anonymous_cannot_create(self):
+        response = self.client.post('/api/v1/recipe/', {'name': 'anonymous'})
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_mine(self):
+        recipe = Recipe.objects.create(
+            author=self.other, recipe_category=self.category, name='other',
+            cook_time='00:10:00')
+        UserRecipeScore.objects.create(user=self.other, recipe=self.recipes[0], score=1)
+        self.client.force_authenticate(self.other)
+        for url, pk in (('/api/v1/recipe/mine/', recipe.pk),
+                        ('/api/v1/user_recipe_rating/mine/', None)):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertEqual(len(response.data['results']), 1)
+                if pk:
+                    self.assertEqual(response.data['results'][0]['id'], pk)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/v1/recipe/mine/', {'page_size': 100})
+        self.assertEqual(len(response.data['results']), len(self.recipes))
+
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/v1/recipe/mine/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_bulk_requires_recipe_owner(self):
+        self.client.force_authenticate(self.other)
+        payload = [{'recipe': self.recipes[0].pk, 'measure': self.measure.pk,
+                    'ingredient': self.ingredients[-1].pk, 'amount': '10'}]
+        response = self.client.post('/api/v1/recipe_ingredient/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(RecipeIngredient.objects.count(), 60)
+
+
+class RecipeNestedWriteTest(CatalogTestMixin, APITestCase):
+    """
+    Создание и замена рецепта вместе со списком ингредиентов
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(
+            username='admin', password='password', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def get_payload(self, name, ingredients):
+        return {
+            'name': name,
+            'recipe_category': self.category.pk,
+            'cook_time': '00:05:00',
+            'recipe_ingredients': [
+                {'measure': self.measure.pk, 'ingredient': ingredient.pk, 'amount': '10'}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_query_count(self):
+        for size in (2, 20):
+            with self.subTest(size=size):
+                payload = self.get_payload(f'nested {size}', self.ingredients[:size])
+                with self.assertNumQueries(9):
+                    response = self.client.post('/api/v1/recipe/', payload, format='json')
+                self.assertEqual(response.status_code, 201, response.data)
+                self.assertEqual(len(response.data['recipe_ingredients']), size)
+
+                rows = response.data['recipe_ingredients']
+                payload['recipe_ingredients'] = [
+                    {**row, 'amount': '20'} for row in rows[:size // 2]
+                ] + [
+                    {'measure': self.measure.pk, 'ingredient': self.ingredients[-1].pk,
+                     'amount': '1'}
+                ]
+                with self.assertNumQueries(15):
+                    response = self.client.put(
+                        f'/api/v1/recipe/{rows[0]["recipe"]}/', payload, format='json')
+                self.assertEqual(response.status_code, 200, response.data)
+
+    def test_replace_diffs_existing_rows(self):
+        recipe = self.recipes[0]
+        kept, changed, removed = recipe.recipe_ingredients.all()
+        payload = self.get_payload(recipe.name, [kept.ingredient, self.ingredients[-1]])
+        payload['recipe_ingredients'].append({
+            'id': changed.pk, 'measure': self.measure.pk,
+            'ingredient': changed.ingredient_id, 'amount': '15'})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/v1/recipe/{recipe.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        rows = {row.pk: row for row in recipe.recipe_ingredients.all()}
+        self.assertEqual(len(rows), 3)
+        self.assertIn(kept.pk, rows)
+        self.assertEqual(rows[changed.pk].amount, Decimal('15'))
+        self.assertNotIn(removed.pk, rows)
+        pantry = [kept.ingredient_id, changed.ingredient_id, self.ingredients[-1].pk]
+        self.assertIn(recipe.pk, ingredient_index.get_available(pantry))
+
+    def test_foreign_row_is_rejected(self):
+        recipe, other = self.recipes[:2]
+        foreign = other.recipe_ingredients.first()
+        payload = self.get_payload(recipe.name, [])
+        payload['recipe_ingredients'] = [{
+            'id': foreign.pk, 'measure': self.measure.pk,
+            'ingredient': foreign.ingredient_id, 'amount': '1'}]
+        response = self.client.put(f'/api/v1/recipe/{recipe.pk}/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(recipe.recipe_ingredients.count(), 3)
+
+
+class ExportTest(CatalogTestMixin, APITestCase):
+    """
+    Потоковая выгрузка каталога
+    """
+
+    def get_export(self, export_format):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/v1/recipe/export/?export_format={export_format}')
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson(self):
+        recipes = [json.loads(line) for line in self.get_export('ndjson')]
+        self.assertEqual([recipe['name'] for recipe in recipes],
+                         [recipe.name for recipe in self.recipes])
+        self.assertEqual(
+            [row['ingredient'] for row in recipes[1]['recipe_ingredients']],
+            [ingredient.name for ingredient in self.ingredients[1:4]])
+
+    def test_csv(self):
+        rows = list(csv.DictReader(self.get_export('csv')))
+        self.assertEqual(len(rows), self.recipes_count * self.ingredients_per_recipe)
+        self.assertEqual(rows[0]['name'], self.recipes[0].name)
+        self.assertEqual(rows[0]['measure'], self.measure.name)
+        self.assertEqual(rows[0]['amount'], '10.00')
+
+
+class ImportTest(APITestCase):
+    """
+    Загрузка каталога массовыми INSERT
+    """
+    fixture = [
+        {'model': 'users.customuser', 'pk': 10, 'fields': {
+            'username': 'cook', 'password': '!', 'date_joined': '2021-06-22T23:45:07Z'}},
+        {'model': 'recipes.measure', 'pk': 10, 'fields': {'name': 'ml'}},
+        {'model': 'recipes.ingredient', 'pk': 10, 'fields': {
+            'name': 'gin', 'food_energy': '2.00', 'alcohol_by_volume': '40.00'}},
+        {'model': 'recipes.ingredient', 'pk': 11, 'fields': {
+            'name': 'tonic', 'food_energy': '0.40', 'alcohol_by_volume': None}},
+        {'model': 'recipes.recipecategory', 'pk': 10, 'fields': {'name': 'cocktail'}},
+        {'model': 'recipes.recipe', 'pk': 10, 'fields': {
+            'author': 10, 'recipe_category': 10, 'name': 'gin tonic',
+            'cook_time': '00:05:00', 'created_at': '2021-06-22T23:45:14Z',
+            'updated_at': '2021-06-22T23:45:14Z'}},
+        {'model': 'recipes.recipeingredient', 'pk': 10, 'fields': {
+            'author': 10, 'recipe': 10, 'measure': 10, 'ingredient': 10, 'amount': '50'}},
+        {'model': 'recipes.recipeingredient', 'pk': 11, 'fields': {
+            'author': 10, 'recipe': 10, 'measure': ['ml'], 'ingredient': ['tonic'],
+            'amount': '150'}},
+        {'model': 'recipes.userrecipescore', 'pk': 10, 'fields': {
+            'user': 10, 'recipe': 10, 'score': 7, 'created_at': '2021-06-22T23:45:14Z',
+            'updated_at': '2021-06-22T23:45:14Z'}},
+    ]
+
+    def load(self, text, **kwargs):
+        loader = CatalogLoader(**kwargs)
+        loader.load(iter_records(io.StringIO(text)))
+        return loader
+
+    def assertCatalog(self):
+        recipe = Recipe.objects.get(name='gin tonic')
+        self.assertEqual(recipe.created_at.year, 2021)
+        self.assertEqual(recipe.recipe_ingredients.count(), 2)
+        self.assertEqual((recipe.voter_turnout, recipe.full_score, recipe.rating),
+                         (1, 7, Decimal('7.00')))
+        self.assertEqual(recipe.alcohol_by_volume, Decimal('10.00'))
+        self.assertEqual(recipe.food_energy, Decimal('0.80'))
+
+    @patch('recipes.importer.READ_CHUNK_SIZE', 64)
+    def test_json_array_is_idempotent(self):
+        text = json.dumps(self.fixture, indent=2)
+        self.load(text, batch_size=2)
+        self.load(text, batch_size=2)
+        self.assertEqual(RecipeIngredient.objects.count(), 2)
+        self.assertEqual(UserRecipeScore.objects.count(), 1)
+        self.assertCatalog()
+
+    def test_ndjson_export(self):
+        self.load(''.join(json.dumps(record) + '\n' for record in self.fixture[:1]))
+        record = {
+            'name': 'gin tonic', 'recipe_category': 'cocktail', 'author': 'cook',
+            'cook_time': '00:05:00', 'created_at': '2021-06-22T23:45:14Z',
+            'voter_turnout': 1, 'full_score': 7, 'rating': '7.00',
+            'recipe_ingredients': [
+                {'ingredient': 'gin', 'measure': 'ml', 'amount': '50.00'},
+                {'ingredient': 'tonic', 'measure': 'ml', 'amount': '150.00'},
+            ],
+        }
+        Ingredient.objects.create(name='gin', food_energy=2, alcohol_by_volume=40)
+        Ingredient.objects.create(name='tonic', food_energy=Decimal('0.4'))
+        for _ in range(2):
+            self.load(json.dumps(record) + '\n')
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(Measure.objects.get().name, 'ml')
+        self.assertCatalog()
+
+    def test_command_skips_loaded_file(self):
+        skipped = 'Файл уже загружен'
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(self.fixture, f)
+            f.flush()
+
+            def import_catalog(*args):
+                out = io.StringIO()
+                call_command('import_catalog', f.name, *args, stdout=out)
+                return out.getvalue()
+
+            self.assertNotIn(skipped, import_catalog())
+            # Контрольная сумма и число строк в таблицах, без разбора файла
+            with self.assertNumQueries(8):
+                self.assertIn(skipped, import_catalog())
+            self.assertNotIn(skipped, import_catalog('--force'))
+            # Удаленные объекты файла загружаются снова
+            RecipeIngredient.objects.filter(pk=11).delete()
+            self.assertNotIn(skipped, import_catalog())
+            self.assertIn(skipped, import_catalog())
+        self.assertEqual(RecipeIngredient.objects.count(), 2)
+        self.assertCatalog()
+
+    def test_conflicting_object_is_not_skipped(self):
+        Measure.objects.create(name='ml')
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(self.fixture, f)
+            f.flush()
+            with self.assertRaisesRegex(CommandError, 'recipes.Measure'):
+                call_command('import_catalog', f.name, stdout=io.StringIO())
+        self.assertFalse(CatalogImport.objects.exists())
+
+    def test_unknown_natural_key(self):
+        with self.assertRaises(CatalogImportError):
+            self.load(json.dumps([{'model': 'recipes.recipeingredient', 'fields': {
+                'author': 1, 'recipe': 1, 'measure': 1, 'ingredient': ['unknown'],
+                'amount': '1'}}]))
+
+
+class PantryTest(CatalogTestMixin, APITestCase):
+    """
+    Разбор набора ингредиентов и кеш результатов поиска по нему
+    """
+
+    def test_invalid_pantry_without_queries(self):
+        recipe = self.recipes[0]
+        for value in ('x', '0', '-1', ['1', '1.5']):
+            for url in ('/api/v1/recipe/available_by_ingredients/',
+                        f'/api/v1/recipe/{recipe.pk}/missed_ingredients/'):
+                with self.subTest(url=url, value=value), self.assertNumQueries(0):
+                    response = self.client.get(url, {'ingredient': value})
+                    self.assertEqual(response.status_code, 400)
+
+    def test_any_lookup(self):
+        ingredient_ids = [ingredient.pk for ingredient in self.ingredients[:3]]
+        self.assertEqual(
+            list(RecipeIngredient.objects.filter(ingredient_id__any=ingredient_ids)),
+            list(RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)))
+        self.assertFalse(RecipeIngredient.objects.filter(ingredient_id__any=[]).exists())
+        self.assertEqual(
+            RecipeIngredient.objects.exclude(ingredient_id__any=[]).count(),
+            RecipeIngredient.objects.count())
+        self.assertEqual(
+            list(Recipe.objects.filter(recipe_ingredients__ingredient_id__any=ingredient_ids[:1])),
+            [self.recipes[0]])
+        for queryset in (Measure.objects, RecipeIngredient.objects):
+            with self.subTest(model=queryset.model), self.assertRaises(FieldError):
+                queryset.filter(pk__any=[1])
+
+    def test_parse_pantry(self):
+        self.assertEqual(parse_pantry(['3', '1', '3']), (1, 3))
+        for values in (['x'], ['0'], [None]):
+            with self.subTest(values=values), self.assertRaises(PantryError):
+                parse_pantry(values)
+
+    def test_cached_by_canonical_pantry(self):
+        ingredients = self.ingredients
+        url = '/api/v1/recipe/available_by_ingredients/'
+        pantry = [ingredients[2].pk, ingredients[0].pk, ingredients[1].pk, ingredients[0].pk]
+        self.assertEqual(canonical_pantry(pantry), tuple(sorted(set(pantry))))
+
+        hits, misses = pantry_cache.hits, pantry_cache.misses
+        first = self.client.get(url, {'ingredient': pantry}).json()
+        second = self.client.get(url, {'ingredient': sorted(set(pantry))}).json()
+        self.assertEqual([r['id'] for r in first['results']], [self.recipes[0].pk])
+        self.assertEqual(first, second)
+        self.assertEqual((pantry_cache.hits - hits, pantry_cache.misses - misses), (1, 1))
+
+        # Изменение индекса делает закешированный результат недостижимым
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=self.recipes[0]).delete()
+        self.assertEqual(self.client.get(url, {'ingredient': pantry}).json()['results'], [])
+
+    def test_available_paginated(self):
+        url = '/api/v1/recipe/available_by_ingredients/'
+        pantry = [ingredient.pk for ingredient in self.ingredients]
+        available = ingredient_index.get_available(pantry)
+        self.assertEqual(
+            list(Recipe.objects.get_available_by_ingredient_ids(pantry, 5, offset=5).values_list(
+                'pk', flat=True)),
+            list(available[5:10]))
+
+        response = self.client.get(url, {'ingredient': pantry, 'page': 2, 'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(available))
+        self.assertEqual([r['id'] for r in response.data['results']], list(available[5:10]))
+        self.assertEqual(
+            self.client.get(url, {'ingredient': pantry, 'page': 100}).status_code,
+            404)
+
+
+class IngredientIndexTest(CatalogTestMixin, APITestCase):
+    """
+    Инвертированный индекс ингредиентов совпадает с поиском в БД
+    """
+
+    def get_pantries(self):
+        ingredients = [ingredient.pk for ingredient in self.ingredients]
+        return [ingredients[:3], ingredients[:5], ingredients[2:4], ingredients[5:12:2],
+                ingredients[::3], ingredients[-1:], [ingredients[0], 0]]
+
+    def assert_matches_queryset(self):
+        for pantry in self.get_pantries():
+            with self.subTest(pantry=pantry):
+                self.assertEqual(
+                    ingredient_index.get_available(pantry),
+                    tuple(sorted(Recipe.objects.get_available_by_ingredients(
+                        pantry).values_list('pk', flat=True))))
+                self.assertEqual(
+                    dict(ingredient_index.get_closest(pantry, len(self.recipes))),
+                    dict(Recipe.objects.with_unlikeness(pantry).values_list(
+                        'pk', 'unlikeness')))
+
+    def test_matches_queryset(self):
+        # Ингредиент, указанный в рецепте дважды, считается дважды, как в БД
+        RecipeIngredient.objects.create(author=self.user, recipe=self.recipes[1],
+                                        measure=self.measure, ingredient=self.ingredients[1],
+                                        amount=Decimal('1'))
+        ingredient_index.rebuild()
+        self.assert_matches_queryset()
+
+    def test_updates_after_row_save_and_delete(self):
+        recipes, ingredients = self.recipes, self.ingredients
+        pantry = [ingredient.pk for ingredient in ingredients[:3]]
+        self.assertEqual(ingredient_index.get_available(pantry), (recipes[0].pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            row = RecipeIngredient.objects.create(
+                author=self.user, recipe=recipes[0], measure=self.measure,
+                ingredient=ingredients[5], amount=Decimal('1'))
+        self.assertEqual(ingredient_index.get_available(pantry), ())
+        self.assertEqual(ingredient_index.get_closest(pantry, 1), ((recipes[0].pk, 1),))
+        with self.captureOnCommitCallbacks(execute=True):
+            # Строка переносится в другой рецепт
+            row.recipe = recipes[10]
+            row.save()
+        self.assertEqual(ingredient_index.get_available(pantry), (recipes[0].pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.filter(recipe=recipes[1], ingredient=ingredients[3]).delete()
+            recipes[2].delete()
+        self.assertEqual(ingredient_index.get_available(pantry), (recipes[0].pk, recipes[1].pk))
+        self.assert_matches_queryset()
+        incremental = [(ingredient_index.get_available(pantry),
+                        ingredient_index.get_closest(pantry, len(recipes)))
+                       for pantry in self.get_pantries()]
+        ingredient_index.rebuild()
+        self.assertEqual(incremental, [(ingredient_index.get_available(pantry),
+                                        ingredient_index.get_closest(pantry, len(recipes)))
+                                       for pantry in self.get_pantries()])
+
+
+class ClosestByIngredientsTest(CatalogTestMixin, APITestCase):
+    """
+    Ранжирование closest_by_ingredients совпадает с RecipeQuerySet.with_unlikeness
+    """
+    url = '/api/v1/recipe/closest_by_ingredients/'
+
+    def get_expected(self, pantry, limit, recipe_category_id=None):
+        recipes = Recipe.objects.with_unlikeness(pantry)
+        if recipe_category_id is not None:
+            recipes = recipes.filter(recipe_category_id=recipe_category_id)
+        ranked = list(recipes.values_list('pk', 'unlikeness'))
+        # БД упорядочивает только по unlikeness, индекс при равенстве - по id
+        self.assertEqual([unlikeness for _, unlikeness in ranked],
+                         sorted(unlikeness for _, unlikeness in ranked))
+        return sorted(ranked, key=lambda item: (item[1], item[0]))[:limit]
+
+    def get_closest(self, pantry, limit, **params):
+        response = self.client.get(self.url, {'ingredient': pantry, 'limit': limit, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(item['id'], item['unlikeness']) for item in response.data]
+
+    def test_ranking(self):
+        other_category = RecipeCategory.objects.create(name='dessert')
+        Recipe.objects.filter(pk__in=[recipe.pk for recipe in self.recipes[1::3]]).update(
+            recipe_category=other_category)
+        ingredient_index.rebuild()
+        ingredients = [ingredient.pk for ingredient in self.ingredients]
+        for pantry in (ingredients[:6], ingredients[2:3], ingredients[::4], ingredients):
+            for limit in (1, 3, len(self.recipes)):
+                with self.subTest(pantry=pantry, limit=limit):
+                    closest = self.get_closest(pantry, limit)
+                    self.assertEqual(closest, self.get_expected(pantry, limit))
+                for category in (self.category, other_category):
+                    with self.subTest(pantry=pantry, limit=limit, category=category.name):
+                        self.assertEqual(
+                            self.get_closest(pantry, limit, recipe_category=category.pk),
+                            self.get_expected(pantry, limit, category.pk))
+        # Равные unlikeness упорядочены по id
+        self.assertEqual(self.get_closest(ingredients[4:5], 3),
+                         [(self.recipes[i].pk, 2) for i in (2, 3, 4)])
+
+
+@override_settings(RECIPES_ASYNC={'THREAD_SENSITIVE': True})
+class AsyncViewsTest(CatalogTestMixin, APITestCase):
+    """
+    Асинхронные версии действий отвечают так же, как синхронные
+    """
+
+    async def test_same_responses(self):
+        recipe = self.recipes[0]
+        pantry = '&'.join(f'ingredient={i.pk}' for i in self.ingredients[:5])
+        for url in ('recipe/?page_size=5', f'recipe/{recipe.pk}/', 'recipe/?page=2&page_size=5',
+                    f'recipe/available_by_ingredients/?{pantry}',
+                    f'recipe/closest_by_ingredients/?{pantry}&limit=3',
+                    f'recipe/{recipe.pk}/missed_ingredients/?{pantry}',
+                    f'recipe/shopping_list/?recipe={recipe.pk}&{pantry}',
+                    'ingredient/', f'ingredient/{self.ingredients[0].pk}/',
+                    'search/?q=recipe', 'recipe/0/', 'search/'):
+            with self.subTest(url=url):
+                response = await self.async_client.get(f'/api/v1/async/{url}')
+                expected = await sync_to_async(self.client.get)(f'/api/v1/{url}')
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(
+                    response.content.decode().replace('/api/v1/async/', '/api/v1/'),
+                    expected.content.decode())
+
+    def test_schema(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('spectacular', stdout=out, stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        for route in ('recipe/', 'recipe/{id}/', 'recipe/closest_by_ingredients/', 'search/'):
+            self.assertIn(f'/api/v1/async/{route}:', out.getvalue())
+
+    async def test_metrics(self):
+        labels = ('async-recipe.list', 'GET')
+        histogram = db_queries.get_histogram(labels)
+        count = histogram.count if histogram else 0
+        await self.async_client.get('/api/v1/async/recipe/')
+        histogram = db_queries.get_histogram(labels)
+        self.assertEqual(histogram.count, count + 1)
+        self.assertGreaterEqual(histogram.sum, 2)
+
+
+@override_settings(RECIPES_ASYNC={'THREAD_SENSITIVE': False})
+class AsyncViewsDbThreadsTest(CatalogTestMixin, TransactionTestCase):
+    """
+    Асинхронные представления в пуле потоков БД (run_in_executor): данные
+    теста зафиксированы и видны соединениям потоков пула
+    """
+    recipes_count = 5
+
+    def setUp(self):
+        self.setUpTestData()
+        super().setUp()
+
+    async def test_same_responses_in_db_threads(self):
+        threads = set()
+        call_in_db_thread = async_views._call_in_db_thread
+
+        def record_thread(*args, **kwargs):
+            threads.add(threading.current_thread().name)
+            return call_in_db_thread(*args, **kwargs)
+
+        recipe = self.recipes[0]
+        pantry = '&'.join(f'ingredient={i.pk}' for i in self.ingredients[:3])
+        with patch('recipes.async_views._call_in_db_thread', record_thread):
+            for url in ('recipe/?page_size=2', f'recipe/{recipe.pk}/',
+                        f'recipe/available_by_ingredients/?{pantry}', 'recipe/0/'):
+                with self.subTest(url=url):
+                    response = await self.async_client.get(f'/api/v1/async/{url}')
+                    expected = await sync_to_async(self.client.get)(f'/api/v1/{url}')
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(
+                        response.content.decode().replace('/api/v1/async/', '/api/v1/'),
+                        expected.content.decode())
+        self.assertTrue(threads)
+        self.assertTrue(all(name.startswith('recipes-db') for name in threads), threads)
+
+
+class ShoppingListTest(CatalogTestMixin, APITestCase):
+    """
+    Недостающие ингредиенты нескольких рецептов и список покупок
+    """
+
+    def test_shopping_list(self):
+        recipes, ingredients = self.recipes, self.ingredients
+        response = self.client.get('/api/v1/recipe/shopping_list/', {
+            'recipe': [recipes[1].pk, recipes[0].pk, recipes[1].pk],
+            'ingredient': [ingredients[1].pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [(r['recipe'], [i['ingredient'] for i in r['missed_ingredients']])
+             for r in data['recipes']],
+            [(recipes[1].pk, [ingredients[2].pk, ingredients[3].pk]),
+             (recipes[0].pk, [ingredients[0].pk, ingredients[2].pk])])
+        self.assertEqual(data['shopping_list'], [
+            {'ingredient': ingredients[0].pk, 'measure': self.measure.pk, 'amount': '10.00'},
+            {'ingredient': ingredients[2].pk, 'measure': self.measure.pk, 'amount': '20.00'},
+            {'ingredient': ingredients[3].pk, 'measure': self.measure.pk, 'amount': '10.00'},
+        ])
+
+        # Рецепт, для которого всего достаточно
+        response = self.client.get('/api/v1/recipe/shopping_list/', {
+            'recipe': recipes[0].pk, 'ingredient': [i.pk for i in ingredients[:3]]})
+        self.assertEqual(response.json(), {
+            'recipes': [{'recipe': recipes[0].pk, 'missed_ingredients': []}],
+            'shopping_list': []})
+
+    def test_invalid_recipes(self):
+        for params in ({}, {'recipe': 'x'}, {'recipe': [self.recipes[0].pk, 0]},
+                       {'recipe': list(range(1, 202))}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/v1/recipe/shopping_list/', params)
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RECIPES_SEARCH={'BACKEND': 'memory'})
+class ScalingTest(CatalogTestMixin, APITestCase):
+    """
+    Пересчет рецептов на заданное число порций
+    """
+
+    def test_scale_amount(self):
+        self.assertEqual(str(scale_amount(Decimal('10'), 1, 3, 2)), '3.33')
+        # Половина округляется вверх
+        self.assertEqual(str(scale_amount(Decimal('0.05'), 1, 2, 2)), '0.03')
+        self.assertEqual(str(scale_amount(Decimal('0.10'), 7, 7, 2)), '0.10')
+        self.assertEqual(str(scale_amount(Decimal('5'), 3, 2, 0)), '8')
+        # Ненулевое количество не исчезает
+        self.assertEqual(str(scale_amount(Decimal('1'), 1, 4, 0)), '1')
+
+    def test_scale(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(servings=4)
+        Measure.objects.filter(pk=self.measure.pk).update(decimal_places=1)
+        url = f'/api/v1/recipe/{recipe.pk}/scale/'
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'servings': 3})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual((response.data['servings'], response.data['scaled_servings']), (4, 3))
+        self.assertEqual([row['amount'] for row in response.data['recipe_ingredients']],
+                         ['7.5'] * 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'servings': 3}).data, response.data)
+
+        row = recipe.recipe_ingredients.first()
+        row.amount = Decimal('1')
+        with self.captureOnCommitCallbacks(execute=True):
+            row.save()
+        response = self.client.get(url, {'servings': 3})
+        self.assertEqual(response.data['recipe_ingredients'][0]['amount'], '0.8')
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'servings': 0}).status_code, 400)
+        response = self.client.get('/api/v1/recipe/0/scale/', {'servings': 3})
+        self.assertEqual(response.status_code, 404)
+
+    def test_scale_batch(self):
+        url = '/api/v1/recipe/scale_batch/'
+        recipe_ids = [recipe.pk for recipe in reversed(self.recipes)]
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'recipe': recipe_ids, 'servings': 2})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item['recipe'] for item in response.data], recipe_ids)
+        self.assertEqual({row['amount'] for item in response.data
+                          for row in item['recipe_ingredients']}, {'20.00'})
+
+        response = self.client.get(url, {'recipe': [recipe_ids[0], 0], 'servings': 2})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RECIPES_LEADERBOARD={'PRIOR_VOTES': 2, 'PRIOR_SCORE': 5})
+class LeaderboardTest(CatalogTestMixin, APITestCase):
+    """
+    Рейтинги рецептов по категориям в памяти
+    """
+    url = '/api/v1/recipe/leaderboard/'
+
+    def vote(self, recipe, *scores):
+        for score in scores:
+            user = User.objects.create_user(username=f'voter {User.objects.count()}')
+            with self.captureOnCommitCallbacks(execute=True):
+                UserRecipeScore.objects.create(user=user, recipe=recipe, score=score)
+
+    def get_ids(self, **params):
+        response = self.client.get(self.url, {'limit': 3, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item['id'] for item in response.data]
+
+    def test_leaderboard(self):
+        self.get_ids()
+        top, many_votes = self.recipes[3], self.recipes[4]
+        other_category = RecipeCategory.objects.create(name='soup')
+        with self.captureOnCommitCallbacks(execute=True):
+            single_vote = Recipe.objects.create(
+                author=self.user, recipe_category=self.category, name='single vote')
+            other = Recipe.objects.create(
+                author=self.user, recipe_category=other_category, name='other')
+        # У top (5 + 9 * 3 + 5 * 2) / (4 + 2) = 7,
+        # у many_votes (5 + 10 + 5 * 2) / (2 + 2) = 6.25, у единственной
+        # оценки 10 (10 + 5 * 2) / (1 + 2) = 6.67, хотя ее рейтинг выше
+        self.vote(top, 9, 9, 9)
+        self.vote(many_votes, 10)
+        self.vote(single_vote, 10)
+        self.vote(other, 10, 10, 10, 10, 10)
+
+        with self.assertNumQueries(0):
+            top_rated = self.get_ids(recipe_category=self.category.pk)
+        self.assertEqual(top_rated, [top.pk, single_vote.pk, many_votes.pk])
+        self.assertEqual(self.get_ids(recipe_category=self.category.pk, kind='popular'),
+                         [top.pk, many_votes.pk, single_vote.pk])
+        self.assertEqual(self.get_ids()[0], other.pk)
+        self.assertEqual(self.get_ids(recipe_category=other_category.pk), [other.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            top.user_recipe_ratings.filter(score=9).delete()
+            other.recipe_category = self.category
+            other.save()
+        incremental = self.client.get(self.url, {'recipe_category': self.category.pk}).data
+        leaderboards.invalidate()
+        self.assertEqual(
+            self.client.get(self.url, {'recipe_category': self.category.pk}).data,
+            incremental)
+        self.assertEqual(incremental[0]['id'], other.pk)
+        self.assertEqual(self.get_ids(recipe_category=other_category.pk), [])
+
+        self.assertEqual(self.client.get(self.url, {'kind': 'worst'}).status_code, 400)
+
+    @override_settings(RECIPES_LEADERBOARD={'SIZE': 3, 'PRIOR_VOTES': 2, 'PRIOR_SCORE': 5})
+    def test_bounded_boards(self):
+        def get_expected(kind):
+            leaderboards.invalidate()
+            with override_settings(RECIPES_LEADERBOARD={
+                    'SIZE': len(self.recipes), 'PRIOR_VOTES': 2, 'PRIOR_SCORE': 5}):
+                expected = self.get_ids(kind=kind)
+            leaderboards.invalidate()
+            return expected
+
+        self.get_ids()
+        self.assertEqual(
+            {len(board) for board in leaderboards._boards.values()}, {3})
+        first, second, third = self.recipes[7], self.recipes[8], self.recipes[9]
+        self.vote(first, 10, 10)
+        self.vote(second, 9, 9)
+        self.vote(third, 8, 8)
+        self.assertEqual(self.get_ids(), [first.pk, second.pk, third.pk])
+        # Опустившийся рецепт выбывает, рейтинг заполняется заново из
+        # голосов всех рецептов
+        self.vote(first, 1, 1, 1, 1)
+        incremental = {kind: self.get_ids(kind=kind) for kind in LEADERBOARD_KINDS}
+        self.assertEqual(incremental['top_rated'][:2], [second.pk, third.pk])
+        for kind in LEADERBOARD_KINDS:
+            with self.subTest(kind=kind):
+                self.assertEqual(incremental[kind], get_expected(kind))
+
+    def test_rebuilt_after_ttl(self):
+        self.assertEqual(get_leaderboard_settings()['TTL'], 60)
+        recipe = self.recipes[5]
+        now = time.monotonic()
+        with patch('recipes.leaderboards.time.monotonic', return_value=now):
+            self.get_ids(kind='popular')
+        # Голоса, измененные другим процессом (без сигналов этого процесса)
+        Recipe.objects.filter(pk=recipe.pk).update(voter_turnout=100, full_score=1000)
+        with patch('recipes.leaderboards.time.monotonic', return_value=now + 59):
+            self.assertNotEqual(self.get_ids(kind='popular')[0], recipe.pk)
+        with patch('recipes.leaderboards.time.monotonic', return_value=now + 60):
+            self.assertEqual(self.get_ids(kind='popular')[0], recipe.pk)
+
+
+@override_settings(RECIPES_RECOMMENDATIONS={'NEIGHBORS': 2, 'SHRINKAGE': 1, 'BLOCK_SIZE': 3})
+class RecommendationTest(CatalogTestMixin, APITestCase):
+    """
+    Похожие рецепты по оценкам пользователей
+    """
+
+    def vote(self, votes):
+        for username, scores in votes.items():
+            user, _ = User.objects.get_or_create(username=username)
+            for i, score in scores.items():
+                UserRecipeScore.objects.update_or_create(
+                    user=user, recipe=self.recipes[i], defaults={'score': score})
+
+    def get_neighbors(self):
+        return dict(RecipeNeighbors.objects.values_list('recipe_id', 'neighbors'))
+
+    def get_built_at(self):
+        return dict(RecipeNeighbors.objects.values_list('recipe_id', 'built_at'))
+
+    def test_similar(self):
+        self.vote({
+            'a': {0: 9, 1: 8, 5: 2},
+            'b': {0: 10, 1: 9, 2: 7},
+            'c': {2: 9, 3: 9, 4: 9},
+            'd': {3: 8, 4: 6},
+        })
+        call_command('build_recommendations', stdout=io.StringIO())
+        recipe = self.recipes[0]
+        url = f'/api/v1/recipe/{recipe.pk}/similar/'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([item['id'] for item in response.data],
+                         [self.recipes[1].pk, self.recipes[2].pk])
+        # Оценки ниже MIN_SCORE не учитываются
+        self.assertEqual(self.client.get(f'/api/v1/recipe/{self.recipes[5].pk}/similar/').data,
+                         [])
+        self.assertEqual(self.client.get('/api/v1/recipe/0/similar/').status_code, 404)
+        self.assertEqual(build_neighbors(), 0)
+
+        # Пересчитываются только затронутые изменениями списки, и результат
+        # совпадает с полным построением
+        self.vote({
+            'b': {1: 6},
+            'd': {0: 10, 6: 7},
+            'e': {6: 9, 7: 9},
+        })
+        before = self.get_neighbors()
+        built_at = self.get_built_at()
+        updated = build_neighbors()
+        incremental = self.get_neighbors()
+        rewritten = {pk for pk, value in self.get_built_at().items() if value != built_at[pk]}
+        voted = {self.recipes[i].pk for i in (0, 1, 6, 7)}
+        self.assertEqual(
+            rewritten, voted | {pk for pk in before if before[pk] != incremental[pk]})
+        self.assertEqual(updated, len(rewritten))
+        build_neighbors(full=True)
+        self.assertEqual(incremental, self.get_neighbors())
+
+    def test_deleted_recipes_removed_from_lists(self):
+        self.vote({
+            'a': {0: 9, 1: 8, 2: 9},
+            'b': {0: 10, 1: 9, 3: 7},
+            'c': {1: 9, 2: 9, 3: 9},
+        })
+        build_neighbors()
+        deleted = self.recipes[1]
+        self.assertTrue(any(deleted.pk in dict(neighbors)
+                            for neighbors in self.get_neighbors().values()))
+        built_at = self.get_built_at()
+        deleted.delete()
+        updated = build_neighbors()
+        incremental = self.get_neighbors()
+        self.assertFalse(any(deleted.pk in dict(neighbors)
+                             for neighbors in incremental.values()))
+        rewritten = {pk for pk, value in self.get_built_at().items() if value != built_at[pk]}
+        self.assertEqual(rewritten, {self.recipes[i].pk for i in (0, 2, 3)})
+        self.assertEqual(updated, len(rewritten))
+        build_neighbors(full=True)
+        self.assertEqual(incremental, self.get_neighbors())
+
+
+class IngredientSimilarityTest(CatalogTestMixin, APITestCase):
+    """
+    Похожие рецепты по составу
+    """
+
+    def get_similar(self, recipe, **params):
+        response = self.client.get(f'/api/v1/recipe/{recipe.pk}/similar_by_ingredients/',
+                                   params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [(item['id'], item['similarity']) for item in response.data]
+
+    def get_expected(self, recipe, method, min_similarity, limit=10):
+        # Полный перебор всех пар рецептов
+        rows = {}
+        for recipe_id, *row in RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id', 'measure_id', 'amount'):
+            rows.setdefault(recipe_id, []).append(row)
+        recipes = {pk: get_weights(recipe_rows) for pk, recipe_rows in rows.items()}
+        sample = recipes.get(recipe.pk, {})
+        result = []
+        for pk, other in recipes.items():
+            if method == 'weighted':
+                common = sum(min(sample.get(i, 0), other.get(i, 0)) for i in other)
+                value = common / (2 - common)
+            else:
+                value = len(sample.keys() & other.keys()) / len(sample.keys() | other.keys())
+            if pk != recipe.pk and value > 0 and value >= min_similarity:
+                result.append((pk, round(value, 4)))
+        return sorted(result, key=lambda item: (-item[1], item[0]))[:limit]
+
+    def test_similar_by_ingredients(self):
+        recipes = self.recipes
+        self.assertEqual(self.get_similar(recipes[0]),
+                         [(recipes[1].pk, 0.5), (recipes[2].pk, 0.2)])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_similar(recipes[0], min_similarity=0.3),
+                             [(recipes[1].pk, 0.5)])
+        self.assertEqual(self.get_similar(recipes[0], limit=1), [(recipes[1].pk, 0.5)])
+        self.assertEqual(
+            self.client.get('/api/v1/recipe/0/similar_by_ingredients/').status_code, 404)
+        for params in ({'method': 'cosine'}, {'min_similarity': 2}, {'min_similarity': 'x'}):
+            with self.subTest(params):
+                response = self.client.get(
+                    f'/api/v1/recipe/{recipes[0].pk}/similar_by_ingredients/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_weights(self):
+        gram = Measure.objects.create(name='g', dimension=Measure.Dimension.MASS)
+        kilogram = Measure.objects.create(
+            name='kg', dimension=Measure.Dimension.MASS, factor=Decimal('1000'))
+        piece = Measure.objects.create(name='pcs', dimension=Measure.Dimension.COUNT)
+        conversion_table.invalidate()
+        # Ингредиенту в штуках назначается медиана остальных (1000 г)
+        weights = get_weights([(1, gram.pk, Decimal('500')), (2, kilogram.pk, Decimal('1')),
+                               (3, piece.pk, Decimal('2')), (2, gram.pk, Decimal('500'))])
+        self.assertEqual(weights.keys(), {1, 2, 3})
+        for ingredient_id, share in ((1, 1 / 6), (2, 1 / 2), (3, 1 / 3)):
+            self.assertAlmostEqual(weights[ingredient_id], share)
+
+    def test_matches_brute_force(self):
+        gram = Measure.objects.create(name='g', dimension=Measure.Dimension.MASS)
+        conversion_table.invalidate()
+        for i, row in enumerate(RecipeIngredient.objects.order_by('pk')):
+            row.measure = gram if i % 4 else self.measure
+            row.amount = Decimal(i % 7 + 1)
+            row.save()
+        # Изменения после построения матрицы хранятся отдельно от нее
+        self.get_similar(self.recipes[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(author=self.user, recipe=self.recipes[0],
+                                            measure=gram, ingredient=self.ingredients[4],
+                                            amount=Decimal('3'))
+            RecipeIngredient.objects.filter(recipe=self.recipes[3]).delete()
+        for built in (False, True):
+            if built:
+                ingredient_similarity.invalidate()
+            for recipe in self.recipes[:6]:
+                for method in SIMILARITY_METHODS:
+                    for min_similarity in (0, 0.1, 0.25, 0.5):
+                        with self.subTest(recipe=recipe.pk, method=method,
+                                          min_similarity=min_similarity, built=built):
+                            self.assertEqual(
+                                self.get_similar(recipe, method=method,
+                                                 min_similarity=min_similarity),
+                                self.get_expected(recipe, method, min_similarity))
+
+    def test_rebuilt_after_ttl(self):
+        self.assertEqual(get_similarity_settings()['TTL'], 300)
+        recipe, other = self.recipes[0], self.recipes[5]
+        now = time.monotonic()
+        with patch('recipes.similarity.time.monotonic', return_value=now):
+            self.get_similar(recipe)
+        # Состав, измененный другим процессом (без сигналов этого процесса)
+        rows = RecipeIngredient.objects.filter(recipe=other).order_by('pk')
+        for row, ingredient in zip(rows, self.ingredients[:3]):
+            RecipeIngredient.objects.filter(pk=row.pk).update(ingredient=ingredient)
+        with patch('recipes.similarity.time.monotonic', return_value=now + 299):
+            self.assertNotIn(other.pk, dict(self.get_similar(recipe)))
+        with patch('recipes.similarity.time.monotonic', return_value=now + 300):
+            self.assertEqual(self.get_similar(recipe)[0], (other.pk, 1.0))
+
+
+class SearchTest(CatalogTestMixin, APITestCase):
+    """
+    Поиск по названиям с учетом опечаток и обновление индекса
+    """
+
+    def search(self, q, **params):
+        response = self.client.get('/api/v1/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_autocomplete_and_typos(self):
+        result = self.search('recipe 1', limit=3)
+        self.assertEqual(set(result), {'ingredient', 'recipe', 'recipe_category'})
+        self.assertEqual([r['name'] for r in result['recipe']],
+                         ['recipe 1', 'recipe 10', 'recipe 11'])
+
+        result = self.search('cocktial', type='recipe_category')
+        self.assertEqual(list(result), ['recipe_category'])
+        self.assertEqual(result['recipe_category'][0]['id'], self.category.pk)
+
+        result = self.search('INGREDEINT 7', type='ingredient', limit=1)
+        self.assertEqual(result['ingredient'][0]['name'], 'ingredient 7')
+
+        self.assertEqual(self.search('zzzz', type='ingredient'), {'ingredient': []})
+
+    def test_search_without_queries(self):
+        self.search('recipe')
+        with self.assertNumQueries(0):
+            self.search('ingredient 2')
+
+    def test_invalid_params(self):
+        for params in ({}, {'q': ' '}, {'q': 'recipe', 'type': 'measure'},
+                       {'q': 'recipe', 'limit': 0}):
+            with self.subTest(params=params):
+                response = self.client.get('/api/v1/search/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_rebuilt_after_ttl(self):
+        self.assertEqual(get_search_settings()['TTL'], 60)
+        now = time.monotonic()
+        with patch('recipes.search.time.monotonic', return_value=now):
+            self.search('ingredient', type='ingredient')
+        # Название, измененное другим процессом (без сигналов этого процесса)
+        Ingredient.objects.filter(pk=self.ingredients[0].pk).update(name='Grenadine syrup')
+        with patch('recipes.search.time.monotonic', return_value=now + 59):
+            self.assertEqual(self.search('grenadine', type='ingredient'), {'ingredient': []})
+        with patch('recipes.search.time.monotonic', return_value=now + 60):
+            result = self.search('grenadine', type='ingredient')
+        self.assertEqual([r['id'] for r in result['ingredient']], [self.ingredients[0].pk])
+
+    def test_index_follows_writes(self):
+        self.search('recipe')
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient = Ingredient.objects.create(name='Grenadine syrup')
+        self.assertEqual(self.search('grenad', type='ingredient')['ingredient'][0]['id'],
+                         ingredient.pk)
+
+        recipe = self.recipes[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.name = 'Tequila sunrise'
+            recipe.save()
+        self.assertEqual(self.search('sunrise', type='recipe')['recipe'][0]['id'], recipe.pk)
+        self.assertNotIn(recipe.pk, [r['id'] for r in self.search('recipe 0')['recipe']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertEqual(self.search('grenad', type='ingredient'), {'ingredient': []})
+
+    def test_trigram_lookup_only_on_searched_names(self):
+        self.assertIn('%>', str(Recipe.objects.filter(name__trigram_word_similar='gin').query))
+        self.assertNotIn('trigram_word_similar', CharField.get_lookups())
+        with self.assertRaises(FieldError):
+            Measure.objects.filter(name__trigram_word_similar='ml')
+
+    def test_similarity_threshold_set_once_per_session(self):
+        db = MagicMock(in_atomic_block=False)
+        reset_similarity_threshold(sender=None, connection=db)
+        for threshold in (0.5, 0.5, 0.3, 0.3):
+            set_similarity_threshold(db, threshold)
+        executed = db.cursor.return_value.__enter__.return_value.execute
+        self.assertEqual([c.args[1] for c in executed.call_args_list], [['0.5'], ['0.3']])
+
+        # После отката транзакции значение в сессии могло вернуться к прежнему
+        db.in_atomic_block = True
+        set_similarity_threshold(db, 0.5)
+        set_similarity_threshold(db, 0.5)
+        self.assertEqual(executed.call_count, 4)
+        reset_similarity_threshold(sender=None, connection=db)
+        db.in_atomic_block = False
+        set_similarity_threshold(db, 0.5)
+        set_similarity_threshold(db, 0.5)
+        self.assertEqual(executed.call_count, 5)
+
+
+class BenchmarkTest(CatalogTestMixin, APITestCase):
+    """
+    Генератор синтетического каталога и нагрузочные сценарии
+    """
+
+    def test_generate_catalog(self):
+        call_command('generate_catalog', recipes=10, users=2, votes=5, stdout=io.StringIO())
+        recipes = Recipe.objects.filter(name__startswith='bench ')
+        self.assertEqual(recipes.count(), 10)
+        self.assertFalse(recipes.filter(recipe_ingredients__isnull=True).exists())
+        # Повторный запуск с тем же seed ничего не добавляет
+        call_command('generate_catalog', recipes=10, users=2, stdout=io.StringIO())
+        self.assertEqual(recipes.count(), 10)
+
+    def test_benchmark_api(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as output:
+            call_command('benchmark_api', requests=3, warmup=1, output=output.name,
+                         stdout=io.StringIO())
+            report = json.load(output)
+        self.assertEqual(set(report['scenarios']), set(ApiBenchmark.scenarios))
+        for name, result in report['scenarios'].items():
+            with self.subTest(name):
+                self.assertEqual(result['requests'], 3)
+                self.assertEqual(result['errors'], 0)
+                # Поиск и рейтинги обслуживаются из памяти без SQL запросов
+                self.assertEqual(result['queries']['max'] > 0,
+                                 name not in ('search', 'leaderboard'))
+
+
+@override_settings(RECIPES_ASYNC={'THREAD_SENSITIVE': True})
+class ConcurrencyBenchmarkTest(LiveServerTestCase):
+    """
+    Сценарии по HTTP для синхронных и асинхронных представлений
+    """
+
+    def test_run(self):
+        user = User.objects.create_user(username='user', password='password')
+        category = RecipeCategory.objects.create(name='cocktail')
+        measure = Measure.objects.create(name='ml')
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=user, recipe_category=category, name=f'recipe {i}')
+            RecipeIngredient.objects.create(
+                author=user, recipe=recipe, measure=measure, amount=Decimal('10'),
+                ingredient=Ingredient.objects.create(name=f'ingredient {i}'))
+        benchmark = ConcurrencyBenchmark(pantry_size=2, page_size=2)
+        for scenario in ('missed_ingredients', 'list_page', 'search'):
+            paths = benchmark.get_paths(scenario, 4)
+            for prefix in ('/api/v1/', '/api/v1/async/'):
+                with self.subTest(scenario=scenario, prefix=prefix):
+                    result = benchmark.run(self.live_server_url + prefix, paths, 2)
+                    self.assertEqual(result['requests'], 4)
+                    self.assertEqual(result['errors'], 0)
+
+
+class ConcurrentRatingTest(TransactionTestCase):
+    """
+    Конкурентные голосования за один рецепт не теряют обновлений
+    """
+    threads_count = 8
+    votes_per_thread = 10
+
+    in_memory_connection = None
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            # in-memory SQLite не поддерживает конкурентную запись, поэтому
+            # на время теста база по умолчанию заменяется файлом: потоки
+            # создают соединения по connections.settings
+            cls.in_memory_connection = connections[DEFAULT_DB_ALIAS]
+            cls.database_file = tempfile.NamedTemporaryFile(suffix='.sqlite3')
+            connections.settings[DEFAULT_DB_ALIAS] = dict(
+                cls.in_memory_connection.settings_dict, NAME=cls.database_file.name)
+            connections[DEFAULT_DB_ALIAS] = connections.create_connection(DEFAULT_DB_ALIAS)
+            call_command('migrate', verbosity=0, interactive=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.in_memory_connection is not None:
+            connection.close()
+            connections.settings[DEFAULT_DB_ALIAS] = cls.in_memory_connection.settings_dict
+            connections[DEFAULT_DB_ALIAS] = cls.in_memory_connection
+            cls.database_file.close()
+
+    def test_concurrent_votes(self):
+        author = User.objects.create_user(username='author', password='password')
+        recipe = Recipe.objects.create(
+            author=author,
+            recipe_category=RecipeCategory.objects.create(name='cocktail'),
+            name='recipe',
+        )
+        users = [
+            [User.objects.create(username=f'user {t} {v}')
+             for v in range(self.votes_per_thread)]
+            for t in range(self.threads_count)
+        ]
+        errors = []
+        barrier = threading.Barrier(self.threads_count)
+
+        def vote(voters):
+            try:
+                barrier.wait()
+                for i, user in enumerate(voters):
+                    UserRecipeScore.objects.create(
+                        user=user, recipe=recipe, score=i % 10 + 1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=vote, args=(voters,)) for voters in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        votes = self.threads_count * self.votes_per_thread
+        full_score = self.threads_count * sum(
+            i % 10 + 1 for i in range(self.votes_per_thread))
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.voter_turnout, votes)
+        self.assertEqual(recipe.full_score, full_score)
+        self.assertEqual(
+            recipe.rating,
+            (Decimal(full_score) / votes).quantize(Decimal('0.01')))
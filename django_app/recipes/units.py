@@ -0,0 +1,86 @@
+import threading
+from decimal import Decimal
+
+
+class ConversionError(ValueError):
+    """
+    Единицы измерения нельзя перевести друг в друга
+    """
+
+
+class ConversionTable:
+    """
+    Таблица перевода единиц измерения в базовые единицы (грамм, миллилитр,
+    штука), загружаемая из БД один раз на процесс.
+
+    Поддерживается сигналами Measure (см. recipes.signals).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # measure_id -> (dimension, factor)
+        self._measures = None
+
+    def _get_measures(self):
+        measures = self._measures
+        if measures is None:
+            from .models import Measure
+
+            with self._lock:
+                if self._measures is None:
+                    self._measures = {
+                        pk: (dimension, factor)
+                        for pk, dimension, factor in Measure.objects.values_list(
+                            'pk', 'dimension', 'factor')
+                    }
+                measures = self._measures
+        return measures
+
+    def invalidate(self):
+        """
+        Сбрасывает таблицу, она будет загружена при следующем обращении
+        """
+        self._measures = None
+
+    def get(self, measure_id):
+        """
+        Возвращает (dimension, factor) единицы измерения
+        """
+        try:
+            return self._get_measures()[measure_id]
+        except KeyError:
+            raise ConversionError(f'Неизвестная единица измерения {measure_id}')
+
+    def convert(self, amount, from_measure_id, to_measure_id):
+        """
+        Переводит количество из одной единицы измерения в другую
+        """
+        if from_measure_id == to_measure_id:
+            return amount
+        from_dimension, from_factor = self.get(from_measure_id)
+        to_dimension, to_factor = self.get(to_measure_id)
+        if from_dimension is None or from_dimension != to_dimension:
+            raise ConversionError(
+                f'Единицу измерения {from_measure_id} нельзя перевести в {to_measure_id}')
+        return Decimal(amount) * from_factor / to_factor
+
+    def to_base(self, rows):
+        """
+        Переводит список пар (amount, measure_id), например все ингредиенты
+        рецепта, в базовые единицы за один проход.
+        Возвращает список пар (amount, dimension), для единиц без величины
+        dimension - None, а количество не пересчитывается.
+        """
+        measures = self._get_measures()
+        rows = list(rows)
+        unknown = {measure_id for _, measure_id in rows} - measures.keys()
+        if unknown:
+            raise ConversionError('Неизвестные единицы измерения ' + ', '.join(
+                str(measure_id) for measure_id in sorted(unknown, key=str)))
+        return [
+            (Decimal(amount) * measures[measure_id][1], measures[measure_id][0])
+            for amount, measure_id in rows
+        ]
+
+
+conversion_table = ConversionTable()
@@ -1,12 +1,16 @@
+from django.urls import path
 from rest_framework import routers
 
+from .async_views import async_view
+
 from .views import (
     MeasureViewSet,
     IngredientViewSet,
     RecipeCategoryViewSet,
     RecipeViewSet,
     RecipeIngredientViewSet,
-    UserRecipeRatingViewSet
+    UserRecipeRatingViewSet,
+    SearchViewSet
 )
 
 router = routers.DefaultRouter()
@@ -17,5 +21,33 @@ router.register(r'recipe_category', RecipeCategoryViewSet)
 router.register(r'recipe', RecipeViewSet)
 router.register(r'recipe_ingredient', RecipeIngredientViewSet)
 router.register(r'user_recipe_rating', UserRecipeRatingViewSet)
+router.register(r'search', SearchViewSet, basename='search')
+
+# Асинхронные (ASGI) версии действий только для чтения
+async_routes = (
+    ('recipe/', RecipeViewSet, 'recipe', False, 'list'),
+    ('recipe/<int:pk>/', RecipeViewSet, 'recipe', True, 'retrieve'),
+    ('recipe/available_by_ingredients/', RecipeViewSet, 'recipe', False,
+     'available_by_ingredients'),
+    ('recipe/closest_by_ingredients/', RecipeViewSet, 'recipe', False,
+     'closest_by_ingredients'),
+    ('recipe/shopping_list/', RecipeViewSet, 'recipe', False, 'shopping_list'),
+    ('recipe/<int:pk>/missed_ingredients/', RecipeViewSet, 'recipe', True,
+     'missed_ingredients'),
+    ('recipe/scale_batch/', RecipeViewSet, 'recipe', False, 'scale_batch'),
+    ('recipe/leaderboard/', RecipeViewSet, 'recipe', False, 'leaderboard'),
+    ('recipe/<int:pk>/similar/', RecipeViewSet, 'recipe', True, 'similar'),
+    ('recipe/<int:pk>/similar_by_ingredients/', RecipeViewSet, 'recipe', True,
+     'similar_by_ingredients'),
+    ('recipe/<int:pk>/scale/', RecipeViewSet, 'recipe', True, 'scale'),
+    ('ingredient/', IngredientViewSet, 'ingredient', False, 'list'),
+    ('ingredient/<int:pk>/', IngredientViewSet, 'ingredient', True, 'retrieve'),
+    ('search/', SearchViewSet, 'search', False, 'list'),
+)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path(f'async/{route}',
+         async_view(viewset, {'get': action}, basename=f'async-{basename}', detail=detail),
+         name=f'async-{basename}-{action.replace("_", "-")}')
+    for route, viewset, basename, detail, action in async_routes
+]
@@ -1,12 +1,20 @@
+from decimal import Decimal, InvalidOperation
 from typing import List
-from rest_framework.viewsets import ModelViewSet
+from django.http import StreamingHttpResponse
+from rest_framework import serializers, status
+from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter, OpenApiExample
 from drf_spectacular.types import OpenApiTypes
 
 from users.permissions import IsAdminOrReadOnly, IsAdminOrOwnerOrReadOnly
-from users.mixins import MultiSerializerViewSetMixin
+from metrics.mixins import MetricsViewSetMixin
+from users.mixins import (
+    EagerLoadingViewSetMixin, MultiSerializerViewSetMixin, OwnedListViewSetMixin
+)
 
 from .models import (
     Measure,
@@ -14,17 +22,107 @@ from .models import (
     RecipeCategory,
     Recipe,
     RecipeIngredient,
+    RecipeNeighbors,
     UserRecipeScore
 )
+from .cache import CachedResponseMixin
+from .export import EXPORT_FORMATS, iter_export
+from .indexes import ingredient_index
+from .pagination import CursorOrPageNumberPagination, RecipePageNumberPagination
+from .leaderboards import LEADERBOARD_KINDS, leaderboards
+from .pantry import PantryError, parse_pantry
+from .scaling import scale_recipes
+from .search import SEARCH_MODELS, search
+from .similarity import SIMILARITY_METHODS, ingredient_similarity
+from .units import ConversionError, conversion_table
 from .serializers import (
     MeasureSerializer,
     IngredientSerializer,
     RecipeCategorySerializer,
     RecipeSerializer,
+    RecipeUnlikenessSerializer,
     RecipeIngredientSerializer,
+    RecipeIngredientBulkSerializer,
     UserRecipeScoreSerializer
 )
 
+CLOSEST_RECIPES_DEFAULT_LIMIT = 10
+CLOSEST_RECIPES_MAX_LIMIT = 100
+SHOPPING_LIST_MAX_RECIPES = 200
+SCALE_MAX_RECIPES = 200
+LEADERBOARD_DEFAULT_LIMIT = 10
+SIMILAR_DEFAULT_LIMIT = 10
+SIMILAR_MAX_LIMIT = 100
+SCALE_MAX_SERVINGS = 1000
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+
+def get_recipe_ids(request, max_count):
+    """
+    Возвращает список уникальных id рецептов из параметров запроса recipe
+    """
+    try:
+        recipe_ids = list(dict.fromkeys(int(pk) for pk in request.GET.getlist('recipe')))
+    except ValueError:
+        raise ValidationError({'recipe': ['Ожидаются целочисленные id рецептов']})
+    if not recipe_ids:
+        raise ValidationError({'recipe': ['Укажите хотя бы один рецепт']})
+    if len(recipe_ids) > max_count:
+        raise ValidationError({'recipe': [f'Не больше {max_count} рецептов']})
+    return recipe_ids
+
+
+def get_pantry(request, name='ingredient'):
+    """
+    Канонический набор ингредиентов из параметров запроса name
+    """
+    try:
+        return parse_pantry(request.GET.getlist(name))
+    except PantryError as e:
+        raise ValidationError({name: [str(e)]})
+
+
+def get_int_param(request, name, default=None, min_value=None, max_value=None):
+    """
+    Возвращает целочисленный параметр запроса name в заданных границах
+    """
+    value = request.GET.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: ['Ожидается целое число']})
+    if min_value is not None and value < min_value:
+        raise ValidationError({name: [f'Значение должно быть не меньше {min_value}']})
+    if max_value is not None and value > max_value:
+        raise ValidationError({name: [f'Значение должно быть не больше {max_value}']})
+    return value
+
+
+def get_time_param(request, name):
+    """
+    Возвращает обязательный параметр запроса name - время в формате hh:mm[:ss]
+    """
+    value = request.GET.get(name)
+    if value in (None, ''):
+        raise ValidationError({name: ['Укажите время']})
+    try:
+        return serializers.TimeField().to_internal_value(value)
+    except ValidationError as e:
+        raise ValidationError({name: e.detail})
+
+
+def get_servings(request):
+    """
+    Возвращает обязательный параметр запроса servings - число порций
+    """
+    servings = get_int_param(request, 'servings', min_value=1, max_value=SCALE_MAX_SERVINGS)
+    if servings is None:
+        raise ValidationError({'servings': ['Укажите число порций']})
+    return servings
+
 
 @extend_schema_view(
     create=extend_schema(description='Создание единицы измерения'),
@@ -35,7 +133,7 @@ from .serializers import (
     destroy=extend_schema(description='Удаление единицы измерения'),
     list=extend_schema(description='Получение списка единиц измерения'),
 )
-class MeasureViewSet(ModelViewSet):
+class MeasureViewSet(MetricsViewSetMixin, CachedResponseMixin, ModelViewSet):
     """
     CRUD для единиц измерения
     """
@@ -43,6 +141,44 @@ class MeasureViewSet(ModelViewSet):
     serializer_class = MeasureSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(name='amount', type=OpenApiTypes.DECIMAL,
+                             location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name='from_measure', type=OpenApiTypes.INT,
+                             location=OpenApiParameter.QUERY, required=True),
+            OpenApiParameter(name='to_measure', type=OpenApiTypes.INT,
+                             location=OpenApiParameter.QUERY, required=True),
+        ],
+        description='Переводит количество из одной единицы измерения в другую',
+    )
+    @action(detail=False, methods=['GET'], name='Convert amount between measures')
+    def convert(self, request, *args, **kwargs):
+        try:
+            amount = Decimal(request.GET.get('amount', ''))
+        except InvalidOperation:
+            raise ValidationError({'amount': ['Ожидается число']})
+        if not amount.is_finite() or amount < 0:
+            raise ValidationError({'amount': ['Ожидается неотрицательное число']})
+        from_measure = get_int_param(request, 'from_measure')
+        to_measure = get_int_param(request, 'to_measure')
+        if from_measure is None or to_measure is None:
+            raise ValidationError({'measure': ['Укажите from_measure и to_measure']})
+        try:
+            converted = conversion_table.convert(amount, from_measure, to_measure)
+        except ConversionError as e:
+            raise ValidationError({'measure': [str(e)]})
+        try:
+            converted = converted.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            # Результат не помещается в точность контекста Decimal
+            raise ValidationError({'amount': ['Слишком большое значение']})
+
+        return Response({
+            'amount': str(converted),
+            'measure': to_measure,
+        })
+
 
 @extend_schema_view(
     create=extend_schema(description='Создание ингредиента'),
@@ -53,7 +189,7 @@ class MeasureViewSet(ModelViewSet):
     destroy=extend_schema(description='Удаление ингредиента'),
     list=extend_schema(description='Получение списка ингредиентов'),
 )
-class IngredientViewSet(ModelViewSet):
+class IngredientViewSet(MetricsViewSetMixin, CachedResponseMixin, ModelViewSet):
     """
     CRUD для ингредиентов
     """
@@ -71,7 +207,7 @@ class IngredientViewSet(ModelViewSet):
     destroy=extend_schema(description='Удаление категории рецепта'),
     list=extend_schema(description='Получение списка категорий рецептов'),
 )
-class RecipeCategoryViewSet(ModelViewSet):
+class RecipeCategoryViewSet(MetricsViewSetMixin, CachedResponseMixin, ModelViewSet):
     """
     CRUD для категорий рецептов
     """
@@ -88,8 +224,10 @@ class RecipeCategoryViewSet(ModelViewSet):
         description='Частичное обновление рецепта'),
     destroy=extend_schema(description='Удаление рецепта'),
     list=extend_schema(description='Получение списка рецептов'),
+    mine=extend_schema(description='Получение списка рецептов текущего пользователя'),
 )
-class RecipeViewSet(MultiSerializerViewSetMixin, ModelViewSet):
+class RecipeViewSet(MetricsViewSetMixin, OwnedListViewSetMixin, EagerLoadingViewSetMixin,
+                    MultiSerializerViewSetMixin, ModelViewSet):
     """
     CRUD для рецептов
     """
@@ -97,23 +235,79 @@ class RecipeViewSet(MultiSerializerViewSetMixin, ModelViewSet):
     serializer_class = RecipeSerializer
     serializer_action_classes = {
         'missed_ingredients': RecipeIngredientSerializer,
+        'shopping_list': RecipeIngredientSerializer,
+        'closest_by_ingredients': RecipeUnlikenessSerializer,
     }
     permission_classes = (IsAdminOrOwnerOrReadOnly,)
+    pagination_class = CursorOrPageNumberPagination
+    owner_field_name = 'author'
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def get_object_id(self):
+        """
+        id рецепта из URL без загрузки рецепта
+        """
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise NotFound()
+
     # TODO: Разобраться с parameters для правильного отображения в Swagger
     @extend_schema(
-        description='Возвращает все рецепты для приготовления которых достаточно заданных ингредиентов',
+        description='Возвращает постранично рецепты, для приготовления которых достаточно '
+                    'заданных ингредиентов',
     )
     @action(detail=False, methods=['GET'], name='Get available recipes by ingredients')
     def available_by_ingredients(self, request, *args, **kwargs):
-        ingredients_id_list = request.GET.getlist('ingredient')
-        ingredients = Ingredient.objects.filter(pk__in=ingredients_id_list)
-        queryset = self.queryset.get_available_by_ingredients(ingredients)
+        ingredient_ids = get_pantry(request)
+        # Страница считается по id из индекса, в запрос к БД попадают
+        # только id текущей страницы
+        paginator = RecipePageNumberPagination()
+        recipe_ids = paginator.paginate_queryset(
+            ingredient_index.get_available(ingredient_ids), request, view=self)
+        queryset = self.get_queryset().filter(pk__any=recipe_ids).order_by('pk')
         serializer = self.get_serializer(queryset, many=True)
 
+        return paginator.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='ingredient',
+                type={'type': 'array', 'items': {'type': 'integer'}},
+                location=OpenApiParameter.QUERY,
+                description='Available ingredient id (repeatable)',
+                explode=True,
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of recipes (1-{CLOSEST_RECIPES_MAX_LIMIT}, '
+                            f'default {CLOSEST_RECIPES_DEFAULT_LIMIT})',
+            ),
+            OpenApiParameter(
+                name='recipe_category',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='Filter by recipe category id',
+            ),
+        ],
+        description='Возвращает limit рецептов с наименьшим числом недостающих ингредиентов',
+    )
+    @action(detail=False, methods=['GET'], name='Get closest recipes by ingredients')
+    def closest_by_ingredients(self, request, *args, **kwargs):
+        ingredient_ids = get_pantry(request)
+        limit = get_int_param(
+            request, 'limit', default=CLOSEST_RECIPES_DEFAULT_LIMIT,
+            min_value=1, max_value=CLOSEST_RECIPES_MAX_LIMIT)
+        recipe_category_id = get_int_param(request, 'recipe_category')
+        recipes = self.get_queryset().get_closest_by_ingredient_ids(
+            ingredient_ids, limit, recipe_category_id)
+        serializer = self.get_serializer(recipes, many=True)
+
         return Response(serializer.data)
 
     # TODO: Разобраться с parameters для правильного отображения в Swagger
@@ -122,21 +316,264 @@ class RecipeViewSet(MultiSerializerViewSetMixin, ModelViewSet):
     )
     @action(detail=True, methods=['GET'], name='Get missed ingredients for recipe')
     def missed_ingredients(self, request, *args, **kwargs):
+        ingredient_ids = get_pantry(request)
         recipe = self.get_object()
-        ingredients_id_list = request.GET.getlist('ingredient')
-        ingredients = Ingredient.objects.filter(pk__in=ingredients_id_list)
         missed_ingredients = recipe.recipe_ingredients.exclude(
-            ingredient__in=ingredients)
+            ingredient_id__any=ingredient_ids)
         serializer = RecipeIngredientSerializer(missed_ingredients, many=True)
 
         return Response(serializer.data)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='recipe',
+                type={'type': 'array', 'items': {'type': 'integer'}},
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description=f'Recipe id (repeatable, up to {SHOPPING_LIST_MAX_RECIPES})',
+                explode=True,
+            ),
+            OpenApiParameter(
+                name='ingredient',
+                type={'type': 'array', 'items': {'type': 'integer'}},
+                location=OpenApiParameter.QUERY,
+                description='Available ingredient id (repeatable)',
+                explode=True,
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает недостающие ингредиенты каждого из рецептов и список покупок - '
+                    'их количество, просуммированное по ингредиенту и единице измерения',
+    )
+    @action(detail=False, methods=['GET'], name='Get missed ingredients and shopping list for recipes')
+    def shopping_list(self, request, *args, **kwargs):
+        recipe_ids = get_recipe_ids(request, SHOPPING_LIST_MAX_RECIPES)
+        ingredient_ids = get_pantry(request)
+        missed = self.get_queryset().filter(
+            pk__in=recipe_ids).get_missed_ingredients(ingredient_ids)
+        unknown = [pk for pk in recipe_ids if pk not in missed]
+        if unknown:
+            raise ValidationError({'recipe': [
+                f'Рецепты не найдены: {", ".join(map(str, unknown))}']})
+
+        totals = {}
+        for recipe_ingredients in missed.values():
+            for recipe_ingredient in recipe_ingredients:
+                key = (recipe_ingredient.ingredient_id, recipe_ingredient.measure_id)
+                totals[key] = totals.get(key, 0) + recipe_ingredient.amount
+        serializer = self.get_serializer(
+            [recipe_ingredient for pk in recipe_ids for recipe_ingredient in missed[pk]],
+            many=True)
+        recipes = {pk: [] for pk in recipe_ids}
+        for data in serializer.data:
+            recipes[data['recipe']].append(data)
+
+        return Response({
+            'recipes': [
+                {'recipe': pk, 'missed_ingredients': recipe_ingredients}
+                for pk, recipe_ingredients in recipes.items()
+            ],
+            'shopping_list': [
+                {'ingredient': ingredient_id, 'measure': measure_id, 'amount': str(amount)}
+                for (ingredient_id, measure_id), amount in sorted(totals.items())
+            ],
+        })
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of recipes (1-{SIMILAR_MAX_LIMIT}, '
+                            f'default {SIMILAR_DEFAULT_LIMIT})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает рецепты, которые понравились пользователям, высоко '
+                    'оценившим этот рецепт (списки строит команда build_recommendations)',
+    )
+    @action(detail=True, methods=['GET'], name='Get similar recipes by user ratings')
+    def similar(self, request, *args, **kwargs):
+        limit = get_int_param(request, 'limit', default=SIMILAR_DEFAULT_LIMIT,
+                              min_value=1, max_value=SIMILAR_MAX_LIMIT)
+        pk = self.get_object_id()
+        neighbors = RecipeNeighbors.objects.filter(recipe_id=pk).values_list(
+            'neighbors', flat=True).first()
+        if neighbors is None:
+            if not Recipe.objects.filter(pk=pk).exists():
+                raise NotFound()
+            neighbors = []
+        neighbors = neighbors[:limit]
+        names = dict(Recipe.objects.filter(
+            pk__any=[neighbor_id for neighbor_id, _ in neighbors]).values_list('pk', 'name'))
+
+        return Response([
+            {'id': neighbor_id, 'name': names[neighbor_id], 'score': score}
+            for neighbor_id, score in neighbors if neighbor_id in names
+        ])
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='method',
+                type={'type': 'string', 'enum': list(SIMILARITY_METHODS)},
+                location=OpenApiParameter.QUERY,
+                description='jaccard - by ingredient sets (default), '
+                            'weighted - by ingredient shares of the recipe amount',
+            ),
+            OpenApiParameter(
+                name='min_similarity',
+                type=OpenApiTypes.FLOAT,
+                location=OpenApiParameter.QUERY,
+                description='Minimum similarity (0-1, default from settings)',
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of recipes (1-{SIMILAR_MAX_LIMIT}, '
+                            f'default {SIMILAR_DEFAULT_LIMIT})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает рецепты, похожие на этот по составу (мера Жаккара по '
+                    'ингредиентам или по их долям), из матрицы в памяти процесса',
+    )
+    @action(detail=True, methods=['GET'], name='Get similar recipes by ingredients')
+    def similar_by_ingredients(self, request, *args, **kwargs):
+        method = request.GET.get('method', SIMILARITY_METHODS[0])
+        if method not in SIMILARITY_METHODS:
+            raise ValidationError({'method': [
+                f'Ожидается одно из значений: {", ".join(SIMILARITY_METHODS)}']})
+        min_similarity = request.GET.get('min_similarity')
+        if min_similarity not in (None, ''):
+            try:
+                min_similarity = float(min_similarity)
+            except ValueError:
+                raise ValidationError({'min_similarity': ['Ожидается число']})
+            if not 0 <= min_similarity <= 1:
+                raise ValidationError({'min_similarity': ['Ожидается число от 0 до 1']})
+        else:
+            min_similarity = None
+        limit = get_int_param(request, 'limit', default=SIMILAR_DEFAULT_LIMIT,
+                              min_value=1, max_value=SIMILAR_MAX_LIMIT)
+        pk = self.get_object_id()
+        similar = ingredient_similarity.get_similar(pk, limit, method, min_similarity)
+        # Названия читаются одним запросом вместе с проверкой самого рецепта
+        names = dict(Recipe.objects.filter(
+            pk__any=[pk] + [recipe_id for recipe_id, _ in similar]).values_list('pk', 'name'))
+        if pk not in names:
+            raise NotFound()
+
+        return Response([
+            {'id': recipe_id, 'name': names[recipe_id], 'similarity': similarity}
+            for recipe_id, similarity in similar if recipe_id in names
+        ])
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='kind',
+                type={'type': 'string', 'enum': list(LEADERBOARD_KINDS)},
+                location=OpenApiParameter.QUERY,
+                description='top_rated - by Bayesian-adjusted rating (default), '
+                            'popular - by number of votes',
+            ),
+            OpenApiParameter(
+                name='recipe_category',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description='Recipe category id (default all recipes)',
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of recipes (default {LEADERBOARD_DEFAULT_LIMIT})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает лучшие рецепты категории по байесовской оценке рейтинга '
+                    'или по числу голосов из рейтингов в памяти, без запросов к БД',
+    )
+    @action(detail=False, methods=['GET'], name='Get recipe leaderboard')
+    def leaderboard(self, request, *args, **kwargs):
+        kind = request.GET.get('kind', LEADERBOARD_KINDS[0])
+        if kind not in LEADERBOARD_KINDS:
+            raise ValidationError({'kind': [
+                f'Ожидается одно из значений: {", ".join(LEADERBOARD_KINDS)}']})
+        recipe_category_id = get_int_param(request, 'recipe_category')
+        limit = get_int_param(request, 'limit', default=LEADERBOARD_DEFAULT_LIMIT, min_value=1)
+
+        return Response(leaderboards.get(kind, recipe_category_id, limit))
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='servings',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description=f'Number of servings (1-{SCALE_MAX_SERVINGS})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает рецепт с количествами ингредиентов, пересчитанными на '
+                    'заданное число порций и округленными по точности единиц измерения',
+    )
+    @action(detail=True, methods=['GET'], name='Scale recipe to servings')
+    def scale(self, request, *args, **kwargs):
+        servings = get_servings(request)
+        pk = self.get_object_id()
+        scaled = scale_recipes([pk], servings)
+        if pk not in scaled:
+            raise NotFound()
+
+        return Response(scaled[pk])
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='recipe',
+                type={'type': 'array', 'items': {'type': 'integer'}},
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description=f'Recipe id (repeatable, up to {SCALE_MAX_RECIPES})',
+                explode=True,
+            ),
+            OpenApiParameter(
+                name='servings',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description=f'Number of servings (1-{SCALE_MAX_SERVINGS})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Возвращает рецепты с количествами ингредиентов, пересчитанными на '
+                    'заданное число порций',
+    )
+    @action(detail=False, methods=['GET'], name='Scale recipes to servings')
+    def scale_batch(self, request, *args, **kwargs):
+        recipe_ids = get_recipe_ids(request, SCALE_MAX_RECIPES)
+        servings = get_servings(request)
+        scaled = scale_recipes(recipe_ids, servings)
+        unknown = [pk for pk in recipe_ids if pk not in scaled]
+        if unknown:
+            raise ValidationError({'recipe': [
+                f'Рецепты не найдены: {", ".join(map(str, unknown))}']})
+
+        return Response([scaled[pk] for pk in recipe_ids])
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
                 name='cook_time',
                 type=OpenApiTypes.TIME,
                 location=OpenApiParameter.QUERY,
+                required=True,
                 description='Filter by cook time',
                 examples=[
                     OpenApiExample(
@@ -148,15 +585,42 @@ class RecipeViewSet(MultiSerializerViewSetMixin, ModelViewSet):
                 ],
             ),
         ],
-        description='Возвращает рецепты приготовление которых занимает не более указанного времени',
+        description='Возвращает постранично рецепты, приготовление которых занимает не более '
+                    'указанного времени',
     )
     @action(detail=False, methods=['GET'], name='Get recipes with cook_time less than or equal entered time')
     def cook_time(self, request, *args, **kwargs):
-        cook_time = request.GET.get('cook_time')
-        queryset = self.queryset.filter(cook_time__lte=cook_time)
-        serializer = self.get_serializer(queryset, many=True)
+        cook_time = get_time_param(request, 'cook_time')
+        queryset = self.get_queryset().get_by_cook_time(cook_time)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
 
-        return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='export_format',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=list(EXPORT_FORMATS),
+                description='Export format (default ndjson)',
+            ),
+        ],
+        responses={(200, media_type): OpenApiTypes.STR for media_type in EXPORT_FORMATS.values()},
+        description='Потоковая выгрузка всех рецептов с ингредиентами в формате NDJSON или CSV',
+    )
+    @action(detail=False, methods=['GET'], name='Export recipes with ingredients')
+    def export(self, request, *args, **kwargs):
+        export_format = request.GET.get('export_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'export_format': [
+                f'Ожидается один из форматов: {", ".join(EXPORT_FORMATS)}']})
+        response = StreamingHttpResponse(
+            iter_export(export_format), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="recipes.{export_format}"'
+
+        return response
 
 
 @extend_schema_view(
@@ -173,17 +637,36 @@ class RecipeViewSet(MultiSerializerViewSetMixin, ModelViewSet):
     list=extend_schema(
         description='Получение списка ингредиентов рецепта с количеством и мерой'),
 )
-class RecipeIngredientViewSet(ModelViewSet):
+class RecipeIngredientViewSet(MetricsViewSetMixin, MultiSerializerViewSetMixin, ModelViewSet):
     """
     CRUD для ингредиентов рецептов с количеством и мерой
     """
     queryset = RecipeIngredient.objects.all()
     serializer_class = RecipeIngredientSerializer
+    serializer_action_classes = {
+        'bulk': RecipeIngredientBulkSerializer,
+    }
     permission_classes = (IsAdminOrOwnerOrReadOnly,)
+    owner_field_name = 'author'
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @extend_schema(
+        request=RecipeIngredientBulkSerializer(many=True),
+        responses=RecipeIngredientBulkSerializer(many=True),
+        description='Массовое создание (элементы без id) и обновление (элементы с id) '
+                    'ингредиентов рецептов в одной транзакции',
+    )
+    @action(detail=False, methods=['POST'], name='Bulk create or update recipe ingredients',
+            permission_classes=[IsAuthenticated])
+    def bulk(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(author=request.user)
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 
 @extend_schema_view(
     create=extend_schema(
@@ -198,15 +681,68 @@ class RecipeIngredientViewSet(ModelViewSet):
         description='Удаление пользовательского рейтинга рецептов'),
     list=extend_schema(
         description='Получение списка пользовательских рейтингов рецептов'),
+    mine=extend_schema(
+        description='Получение списка рейтингов рецептов текущего пользователя'),
 )
-class UserRecipeRatingViewSet(ModelViewSet):
+class UserRecipeRatingViewSet(MetricsViewSetMixin, OwnedListViewSetMixin, ModelViewSet):
     """
     CRUD для рейтинга рецептов
     """
     queryset = UserRecipeScore.objects.all()
     serializer_class = UserRecipeScoreSerializer
     permission_classes = (IsAdminOrOwnerOrReadOnly,)
+    pagination_class = CursorOrPageNumberPagination
     owner_field_name = 'user'
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+
+@extend_schema_view(
+    list=extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name='q',
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description='Name or its beginning, typos are tolerated',
+            ),
+            OpenApiParameter(
+                name='type',
+                type={'type': 'array', 'items': {'type': 'string', 'enum': list(SEARCH_MODELS)}},
+                location=OpenApiParameter.QUERY,
+                description='Object type (repeatable, default all)',
+                explode=True,
+            ),
+            OpenApiParameter(
+                name='limit',
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description=f'Number of results per type (1-{SEARCH_MAX_LIMIT}, '
+                            f'default {SEARCH_DEFAULT_LIMIT})',
+            ),
+        ],
+        responses=OpenApiTypes.OBJECT,
+        description='Поиск и автодополнение рецептов, ингредиентов и категорий рецептов '
+                    'по названию с учетом опечаток',
+    ),
+)
+class SearchViewSet(MetricsViewSetMixin, ViewSet):
+    """
+    Поиск по названиям
+    """
+
+    def list(self, request, *args, **kwargs):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['Укажите строку поиска']})
+        types = request.GET.getlist('type') or list(SEARCH_MODELS)
+        unknown = set(types) - set(SEARCH_MODELS)
+        if unknown:
+            raise ValidationError({'type': [
+                f'Ожидается один из типов: {", ".join(SEARCH_MODELS)}']})
+        limit = get_int_param(
+            request, 'limit', default=SEARCH_DEFAULT_LIMIT, min_value=1, max_value=SEARCH_MAX_LIMIT)
+
+        return Response(search(query, types, limit))
@@ -0,0 +1,142 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from config.app_settings import get_app_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Отправляется после изменения голосов рецепта (в т.ч. записи буфера);
+# аргументы recipe_id, voter_turnout_delta, full_score_delta
+recipe_votes_changed = Signal()
+
+DEFAULT_VOTE_BUFFER_SETTINGS = {
+    # Копить голоса в памяти вместо UPDATE рецепта на каждый голос
+    'ENABLED': False,
+    # Период фоновой записи в секундах (None - только явный flush)
+    'FLUSH_INTERVAL': 1.0,
+    # Максимальная задержка голоса в буфере в секундах: при превышении
+    # запись выполняется синхронно в потоке, добавляющем голос
+    'MAX_LAG': 5.0,
+}
+
+
+def get_vote_buffer_settings():
+    return get_app_settings('RECIPES_VOTE_BUFFER', DEFAULT_VOTE_BUFFER_SETTINGS)
+
+
+class VoteBuffer:
+    """
+    Буфер голосов с отложенной записью.
+
+    Изменения числа голосов и суммы оценок накапливаются по рецептам и
+    записываются одним UPDATE на рецепт (RecipeQuerySet.apply_votes) фоновым
+    потоком раз в FLUSH_INTERVAL секунд. Строки UserRecipeScore при этом
+    сохраняются сразу, поэтому ограничение уникальности (user, recipe)
+    продолжает действовать, а с задержкой обновляются только агрегаты рецепта.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # recipe_id -> [voter_turnout_delta, full_score_delta]
+        self._pending = {}
+        self._oldest = None
+        self._flusher = None
+
+    def add(self, recipe_id, voter_turnout_delta, full_score_delta):
+        """
+        Добавляет изменение голосов рецепта в буфер
+        """
+        buffer_settings = get_vote_buffer_settings()
+        with self._lock:
+            self._merge(recipe_id, voter_turnout_delta, full_score_delta)
+            lag = time.monotonic() - self._oldest
+        if buffer_settings['FLUSH_INTERVAL'] is not None:
+            self._start_flusher(buffer_settings['FLUSH_INTERVAL'])
+        if buffer_settings['MAX_LAG'] is not None and lag >= buffer_settings['MAX_LAG']:
+            self.flush()
+
+    def flush(self):
+        """
+        Записывает накопленные изменения в БД, возвращает число рецептов
+        """
+        from .models import Recipe
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._oldest = None
+        # Порядок по id рецепта исключает взаимные блокировки с другими
+        # процессами, записывающими те же рецепты
+        items = sorted(pending.items())
+        flushed = 0
+        for i, (recipe_id, (voter_turnout_delta, full_score_delta)) in enumerate(items):
+            if not voter_turnout_delta and not full_score_delta:
+                continue
+            try:
+                Recipe.objects.filter(pk=recipe_id).apply_votes(
+                    voter_turnout_delta, full_score_delta)
+                recipe_votes_changed.send(
+                    sender=Recipe, recipe_id=recipe_id,
+                    voter_turnout_delta=voter_turnout_delta,
+                    full_score_delta=full_score_delta)
+            except Exception:
+                # Возвращаем незаписанные изменения в буфер
+                with self._lock:
+                    for item_recipe_id, deltas in items[i:]:
+                        self._merge(item_recipe_id, *deltas)
+                raise
+            flushed += 1
+        return flushed
+
+    def _merge(self, recipe_id, voter_turnout_delta, full_score_delta):
+        deltas = self._pending.setdefault(recipe_id, [0, 0])
+        deltas[0] += voter_turnout_delta
+        deltas[1] += full_score_delta
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+
+    def _start_flusher(self, interval):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._run, args=(interval,),
+                    name='vote-buffer-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Vote buffer flush failed')
+                connection.close()
+
+
+vote_buffer = VoteBuffer()
+atexit.register(vote_buffer.flush)
+
+
+def apply_votes(recipe_id, voter_turnout_delta, full_score_delta):
+    """
+    Применяет изменение голосов рецепта: сразу в текущей транзакции или,
+    если включен RECIPES_VOTE_BUFFER, через буфер после ее фиксации
+    """
+    from .models import Recipe
+
+    if get_vote_buffer_settings()['ENABLED']:
+        transaction.on_commit(lambda: vote_buffer.add(
+            recipe_id, voter_turnout_delta, full_score_delta))
+    else:
+        Recipe.objects.filter(pk=recipe_id).apply_votes(
+            voter_turnout_delta, full_score_delta)
+        recipe_votes_changed.send(
+            sender=Recipe, recipe_id=recipe_id,
+            voter_turnout_delta=voter_turnout_delta, full_score_delta=full_score_delta)
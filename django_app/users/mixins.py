@@ -1,3 +1,8 @@
+from drf_spectacular.utils import extend_schema
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+
+
 class OwnerPermMixin():
     """
     Mixin для ViewSet с дополнительным разграничением доступа:
@@ -51,3 +56,56 @@ class MultiSerializerViewSetMixin(object):
             return self.serializer_action_classes[self.action]
         except (KeyError, AttributeError):
             return super(MultiSerializerViewSetMixin, self).get_serializer_class()
+
+
+class EagerLoadingViewSetMixin(object):
+    """
+    Подготавливает queryset под сериализатор текущего действия.
+
+    Если у сериализатора (с учетом serializer_action_classes) есть метод
+    setup_eager_loading и сериализатор работает с той же моделью, что и
+    queryset, queryset передается через этот метод, i.e.:
+
+    class MySerializer(ModelSerializer):
+        related = RelatedSerializer(many=True)
+
+        @staticmethod
+        def setup_eager_loading(queryset):
+            return queryset.prefetch_related('related')
+
+    Так списки сериализуются за постоянное число запросов, а не по запросу
+    на каждый объект.
+    """
+
+    def get_queryset(self):
+        queryset = super(EagerLoadingViewSetMixin, self).get_queryset()
+        serializer_class = self.get_serializer_class()
+        setup_eager_loading = getattr(serializer_class, 'setup_eager_loading', None)
+        if setup_eager_loading and serializer_class.Meta.model is queryset.model:
+            queryset = setup_eager_loading(queryset)
+        return queryset
+
+
+class OwnedListViewSetMixin(object):
+    """
+    Добавляет в ViewSet действие mine - список объектов текущего
+    пользователя с той же сериализацией и пагинацией, что и list.
+
+    owner_field_name - название внешнего ключа на владельца. Фильтр
+    выполняется в SQL по id владельца, поэтому для модели нужен индекс,
+    начинающийся с этого поля.
+    """
+    owner_field_name = 'author'
+
+    def get_queryset(self):
+        queryset = super(OwnedListViewSetMixin, self).get_queryset()
+        if self.action == 'mine':
+            attname = queryset.model._meta.get_field(self.owner_field_name).attname
+            queryset = queryset.filter(**{attname: self.request.user.pk})
+        return queryset
+
+    @extend_schema(description='Получение списка объектов текущего пользователя')
+    @action(detail=False, methods=['GET'], name='Get own objects',
+            permission_classes=[IsAuthenticated])
+    def mine(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
@@ -1,19 +1,46 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
+def get_owner_id(obj, owner_field_name):
+    """
+    id владельца объекта из внешнего ключа (без запроса пользователя)
+    """
+    return getattr(obj, obj._meta.get_field(owner_field_name).attname)
+
+
+def is_owner(user, obj, owner_field_name):
+    """
+    Является ли пользователь владельцем объекта
+    """
+    return bool(user and user.is_authenticated
+                and get_owner_id(obj, owner_field_name) == user.pk)
+
+
 class IsAdminOrOwnerOrReadOnly(BasePermission):
     """
     Создание / Редактирование / Удаление доступно только для администрации
     или автора
+
+    Поле владельца берется из owner_field_name представления (по умолчанию
+    author) и сравнивается по id, не загружая пользователя.
     """
     owner_field_name = 'author'
 
+    def get_owner_field_name(self, view):
+        return getattr(view, 'owner_field_name', self.owner_field_name)
+
+    def has_permission(self, request, view):
+        return bool(
+            request.method in SAFE_METHODS or
+            request.user and request.user.is_authenticated
+        )
+
     def has_object_permission(self, request, view, obj):
         return bool(
             request.method in SAFE_METHODS or (
                 request.user and (
                     request.user.is_staff or
-                    getattr(obj, owner_field_name) == request.user
+                    is_owner(request.user, obj, self.get_owner_field_name(view))
                 )
             )
         )
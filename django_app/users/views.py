@@ -5,6 +5,8 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.viewsets import ModelViewSet
 from drf_spectacular.utils import extend_schema_view, extend_schema
 
+from metrics.mixins import MetricsViewSetMixin
+
 from .mixins import OwnerPermMixin, MultiSerializerViewSetMixin
 from .serializers import (
     UserProfileSerializer,
@@ -24,7 +26,8 @@ User = get_user_model()
     destroy=extend_schema(description='Удаление профиля пользователя'),
     list=extend_schema(description='Получение списка профилей пользователей'),
 )
-class UserProfileViewSet(MultiSerializerViewSetMixin, OwnerPermMixin, ModelViewSet):
+class UserProfileViewSet(MetricsViewSetMixin, MultiSerializerViewSetMixin, OwnerPermMixin,
+                         ModelViewSet):
     """
     CRUD для пользователя
     """